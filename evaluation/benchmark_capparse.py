@@ -0,0 +1,172 @@
+"""Measures the parse throughput of the router capture files read by the
+feedbackThread (see tecontroller/linkmonitor/captail.py), on synthetic
+captures of the same packets in text (tcpdump -n output) and pcap
+format.
+
+It compares the former line-by-line parsing of the text (split and
+ipaddress.ip_address for each line), the regular expression applied
+to whole blocks of lines, and the struct parsing of the pcap records,
+and checks that all of them find the same flows. Then it appends each
+capture to a file in chunks cut at random points (partial lines and
+records), reading it incrementally after each chunk, and checks that
+no packet is lost.
+
+The cost of formatting the text in tcpdump is not measured: it is
+saved altogether with pcap captures.
+
+Usage: python benchmark_capparse.py [n_packets]
+"""
+from tecontroller.linkmonitor.captail import CaptureTail, PcapTail, parseFlows, parsePcapRecords
+from tecontroller.linkmonitor import captail
+from tecontroller.res import defaultconf as dconf
+
+import ipaddress
+import tempfile
+import socket
+import struct
+import random
+import time
+import sys
+import os
+
+SNAPLEN = dconf.CAP_Snaplen
+PAYLOAD = 1470
+
+def syntheticPackets(n_packets, n_flows=50, seed=1):
+    """Returns a list of n_packets (timestamp, kind, src, sport, dst,
+    dport): UDP packets of n_flows flows, with some ARP and IPv6
+    packets in between.
+    """
+    rnd = random.Random(seed)
+    flows = []
+    for i in range(n_flows):
+        src = '10.0.%d.%d'%(rnd.randint(0, 255), rnd.randint(1, 254))
+        dst = '10.0.%d.%d'%(rnd.randint(0, 255), rnd.randint(1, 254))
+        flows.append((src, rnd.randint(1024, 65535), dst, rnd.choice([5001, 5002, 5003])))
+
+    packets = []
+    for i in range(n_packets):
+        timestamp = 43200 + i/1000.0 + rnd.random()/1000.0
+        r = rnd.random()
+        if r < 0.02:
+            packets.append((timestamp, 'arp', None, None, None, None))
+        elif r < 0.04:
+            packets.append((timestamp, 'ip6', None, None, None, None))
+        else:
+            packets.append((timestamp, 'udp') + rnd.choice(flows))
+    return packets
+
+def textCapture(packets):
+    """Returns the lines of tcpdump -n output of packets"""
+    lines = []
+    for (timestamp, kind, src, sport, dst, dport) in packets:
+        t = '%02d:%02d:%09.6f'%(timestamp/3600, (timestamp/60) % 60, timestamp % 60)
+        if kind == 'arp':
+            lines.append('%s ARP, Request who-has 10.0.0.1 tell 10.0.0.2, length 28\n'%t)
+        elif kind == 'ip6':
+            lines.append('%s IP6 fe80::1.546 > ff02::1:2.547: dhcp6 solicit\n'%t)
+        else:
+            lines.append('%s IP %s.%d > %s.%d: UDP, length %d\n'%(t, src, sport, dst, dport, PAYLOAD))
+    return lines
+
+def pcapCapture(packets):
+    """Returns the pcap capture of packets, as written by tcpdump -i any
+    -s SNAPLEN (Linux cooked headers).
+    """
+    data = [struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, SNAPLEN, captail.LINKTYPE_LINUX_SLL)]
+    for (timestamp, kind, src, sport, dst, dport) in packets:
+        if kind == 'arp':
+            (ethertype, payload) = (0x0806, '\x00'*28)
+        elif kind == 'ip6':
+            (ethertype, payload) = (0x86dd, '\x60' + '\x00'*(40 + 8 + PAYLOAD - 1))
+        else:
+            length = 20 + 8 + PAYLOAD
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, length, 0, 0x4000, 64, 17, 0,
+                             socket.inet_aton(src), socket.inet_aton(dst))
+            udp = struct.pack('!HHHH', sport, dport, 8 + PAYLOAD, 0)
+            (ethertype, payload) = (0x0800, ip + udp + '\x00'*PAYLOAD)
+        packet = struct.pack('!HHH8sH', 4, 1, 6, '\x02'*6 + '\x00'*2, ethertype) + payload
+        data.append(struct.pack('<IIII', int(timestamp), int((timestamp % 1)*1e6),
+                                min(len(packet), SNAPLEN), len(packet)))
+        data.append(packet[:SNAPLEN])
+    return ''.join(data)
+
+def legacyParse(lines):
+    """Former parsing of feedbackThread.updateRouterFlowSets"""
+    ridSet = set()
+    for line in lines:
+        try:
+            src_tmp = line.split(' ')[2]
+            src_ip_tmp = src_tmp.split('.')[:4]
+            src_ip = ipaddress.ip_address('.'.join(map(str, src_ip_tmp)))
+            dst_tmp = line.split(' ')[4].strip(':')
+            dst_ip_tmp = dst_tmp.split('.')[:4]
+            dport = dst_tmp.split('.')[4]
+            dst_ip = ipaddress.ip_address('.'.join(map(str, dst_ip_tmp)))
+            ridSet.update({((src_ip, 's'), (dst_ip, 'd'), dport)})
+        except:
+            pass
+    return ridSet
+
+def timeIt(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return (time.time() - start_time, result)
+
+def incrementalRead(tail_class, data, suffix, seed=2):
+    """Appends data to a file in chunks of random size, reading it with
+    tail_class after each chunk. Returns the tuple (elapsed time,
+    number of reads, number of packets parsed).
+    """
+    (fd, path) = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    rnd = random.Random(seed)
+    tail = tail_class(path)
+    n_parsed = 0
+    n_reads = 0
+    start_time = time.time()
+    with open(path, 'wb') as f:
+        offset = 0
+        while offset < len(data):
+            end = min(len(data), offset + rnd.randint(1, 64*1024))
+            f.write(data[offset:end])
+            f.flush()
+            offset = end
+            n_parsed += len(tail.readFlows())
+            n_reads += 1
+    elapsed = time.time() - start_time
+    tail.close()
+    os.remove(path)
+    return (elapsed, n_reads, n_parsed)
+
+def run(n_packets):
+    packets = syntheticPackets(n_packets)
+    lines = textCapture(packets)
+    text = ''.join(lines)
+    pcap = pcapCapture(packets)
+    print("*** %d packets (text: %.1f MB, pcap: %.1f MB)"%(n_packets, len(text)/1e6, len(pcap)/1e6))
+
+    (t_legacy, legacy_set) = timeIt(legacyParse, lines)
+    (t_regex, text_flows) = timeIt(parseFlows, text)
+    (t_pcap, (pcap_flows, consumed)) = timeIt(parsePcapRecords, pcap[captail.PCAP_HEADER_SIZE:])
+    legacy_flows = {(int(src), int(dst), int(dport)) for ((src, s), (dst, d), dport) in legacy_set}
+    print("    text, line by line: %10.0f packets/s"%(n_packets/t_legacy))
+    print("    text, regex blocks: %10.0f packets/s\tspeedup: %.1fx"%(n_packets/t_regex, t_legacy/t_regex))
+    print("    pcap, struct:       %10.0f packets/s\tspeedup: %.1fx"%(n_packets/t_pcap, t_legacy/t_pcap))
+    print("    same flows: %s (%d), same packets: %s"%(legacy_flows == set(text_flows) == set(pcap_flows),
+                                                      len(legacy_flows), text_flows == pcap_flows))
+
+    # Incremental reads of files written in chunks
+    for (name, tail_class, data, suffix) in [('text', CaptureTail, text, '.cap'),
+                                             ('pcap', PcapTail, pcap, '.pcap')]:
+        (elapsed, n_reads, n_parsed) = incrementalRead(tail_class, data, suffix)
+        print("    %s, incremental: %d reads, %10.0f packets/s, all packets parsed: %s"%(
+            name, n_reads, n_packets/elapsed, n_parsed == len(text_flows)))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        n_packets = int(sys.argv[1])
+    else:
+        n_packets = 200000
+    for n in sorted(set([n_packets/10, n_packets])):
+        run(n)
@@ -0,0 +1,108 @@
+"""Measures the speedup of evaluating the candidate ri->dx DAGs of
+TEControllerLab2 in a pool of worker processes.
+
+The first scenario reproduces the topology and flows of the lab2
+test1.csv (flows towards r1). The second one uses a random graph,
+where the number of candidate DAGs is much larger.
+
+Usage: python benchmark_dagpool.py [max_workers]
+"""
+from tecontroller.res.dagpool import CandidateDagPool, DecisionContext
+from tecontroller.res.problib import ProbabiliyCalculator
+from tecontroller.res.flow import Flow
+from tecontroller.res import daglib
+
+import networkx as nx
+import tempfile
+import random
+import time
+import sys
+
+BW = 1e6
+MINCAP = 0.2*BW
+
+def lab2Graph():
+    graph = nx.DiGraph()
+    links = [('r1','r2',10), ('r1','r4',2), ('r1','r3',2), ('r2','r3',2), ('r3','r4',5)]
+    for (x, y, cost) in links:
+        graph.add_edge(x, y, metric=cost)
+        graph.add_edge(y, x, metric=cost)
+    return graph
+
+def randomGraph(n, p, seed):
+    random.seed(seed)
+    graph_tmp = nx.gnp_random_graph(n, p, seed=seed)
+    while not nx.is_connected(graph_tmp):
+        graph_tmp = nx.gnp_random_graph(n, p)
+    graph = nx.DiGraph()
+    for (x, y) in graph_tmp.edges():
+        cost = random.randint(1, 5)
+        graph.add_edge(x, y, metric=cost)
+        graph.add_edge(y, x, metric=cost)
+    return graph
+
+def allSourcesDag(graph, egress):
+    """Shortest-path DAG from all nodes towards egress"""
+    dag = nx.DiGraph()
+    for node in graph.nodes():
+        if node == egress:
+            continue
+        for path in nx.all_shortest_paths(graph, node, egress, weight='metric'):
+            dag.add_edges_from(zip(path[:-1], path[1:]))
+    return dag
+
+def capacityGraph(graph, load):
+    cg = graph.copy()
+    for (x, y, data) in cg.edges(data=True):
+        data['bw'] = BW
+        data['capacity'] = BW*(1-random.random()*load)
+        data['mincap'] = MINCAP
+    return cg
+
+def buildContext(graph, adag, sources, new_source, egress):
+    """sources: list of (ingress, size) of the allocated flows"""
+    allocated_flows = []
+    for (ingress, size) in sources:
+        paths = daglib.getAllPathsLim(adag, ingress, egress, 0)
+        allocated_flows.append((Flow(size=size), paths))
+    (new_ingress, new_size) = new_source
+    ingress_routers = [new_ingress]+[ingress for (ingress, size) in sources]
+    cg = capacityGraph(graph, 0.5)
+    return DecisionContext(adag, cg, Flow(size=new_size), allocated_flows,
+                           ingress_routers, egress)
+
+def timeEvaluation(pool, context, dags, pc, repetitions):
+    start_time = time.time()
+    for i in range(repetitions):
+        results = pool.evaluate(context, dags, pc)
+    return ((time.time()-start_time)/float(repetitions), results[0][2])
+
+def run(name, graph, sources, new_source, egress, max_workers, repetitions):
+    adag = allSourcesDag(graph, egress)
+    context = buildContext(graph, adag, sources, new_source, egress)
+    dags = daglib.getAllPossibleDags(graph, new_source[0], egress)
+    dump_filename = tempfile.mktemp()
+    pc = ProbabiliyCalculator(dump_filename=dump_filename)
+
+    print("*** %s: %d candidate DAGs, %d flows"%(name, len(dags), len(sources)+1))
+    serial_time = None
+    for n_workers in range(1, max_workers+1):
+        pool = CandidateDagPool(n_workers=n_workers, dump_filename=dump_filename)
+        (t, pc_min) = timeEvaluation(pool, context, dags, pc, repetitions)
+        pool.close()
+        if serial_time is None:
+            serial_time = t
+        print("    workers: %d\ttime: %.2f ms\tspeedup: %.2fx\tmin Pc: %.3f"%(n_workers, t*1000.0, serial_time/t, pc_min))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        max_workers = int(sys.argv[1])
+    else:
+        max_workers = 4
+
+    random.seed(1)
+    run('lab2 test1', lab2Graph(), [('r3', 600e3), ('r2', 300e3)], ('r2', 600e3), 'r1', max_workers, 20)
+
+    graph = randomGraph(9, 0.45, 3)
+    sources = [(random.choice(graph.nodes()[1:]), random.randint(100, 400)*1e3) for i in range(4)]
+    run('random graph', graph, sources, (graph.nodes()[-1], 300e3), graph.nodes()[0], max_workers, 1)
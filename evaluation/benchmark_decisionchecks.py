@@ -0,0 +1,141 @@
+"""Measures the capacity checks that TEControllerLab2 runs on the
+candidate ri->dx DAGs of each allocation decision (see dagpool.py),
+without the exact congestion probability computation:
+
+ * lower bounds: congestionLowerBound of all candidates, which orders
+   the branch-and-bound search.
+ * checks: virtual capacities of the new all-sources DAG of each
+   candidate, and the analytic bounds of boundlib.
+
+They are compared with the former per-edge checks over the networkx
+attribute dictionaries, where the virtual capacity of each edge was
+found by scanning the paths of all single-path flows, and checked to
+give the same results.
+
+Usage: python benchmark_decisionchecks.py [n_candidates]
+"""
+from tecontroller.linkmonitor.capsnapshot import snapshotFromGraph
+from tecontroller.res.dagpool import DecisionContext
+from tecontroller.res.flow import Flow
+from tecontroller.res import dagpool, boundlib, daglib
+
+import networkx as nx
+import random
+import time
+import sys
+
+BW = 1e6
+MINCAP = 0.2*BW
+
+SCENARIOS = [(12, 0.4, 20), (30, 0.2, 100), (60, 0.1, 300)]
+
+def scenario(n_nodes, p, n_flows, n_candidates, seed=1):
+    """Returns a random capacity graph, the all-sources DAG towards node
+    0, the allocated flows (80% of them in a single path), the ingress
+    routers and the candidate DAGs of a new flow.
+    """
+    rnd = random.Random(seed)
+    graph = nx.DiGraph()
+    for (x, y) in nx.gnp_random_graph(n_nodes, p, seed=seed).edges():
+        cost = rnd.randint(1, 5)
+        for (u, v) in [(x, y), (y, x)]:
+            graph.add_edge(u, v, metric=cost, bw=BW, capacity=BW*rnd.uniform(0.2, 0.8), mincap=MINCAP)
+
+    egress = 0
+    adag = nx.DiGraph()
+    for node in graph.nodes():
+        if node != egress and nx.has_path(graph, node, egress):
+            for path in nx.all_shortest_paths(graph, node, egress, weight='metric'):
+                adag.add_edges_from(zip(path[:-1], path[1:]))
+
+    allocated_flows = []
+    ingress_routers = [n_nodes - 1]
+    for i in range(n_flows):
+        ingress = rnd.choice(adag.nodes()[1:])
+        paths = daglib.getAllPathsLim(adag, ingress, egress, 0)
+        if rnd.random() < 0.8:
+            paths = paths[:1]
+        allocated_flows.append((Flow(size=rnd.randint(10, 50)*1e3), paths))
+        ingress_routers.append(ingress)
+
+    sampler = daglib.RandomDagSampler(graph, n_nodes - 1, egress, seed=seed, max_paths=3)
+    return (graph, adag, allocated_flows, ingress_routers, egress, sampler.take(n_candidates))
+
+# Former checks ##############################################
+
+def legacyVirtualCapacity(capacities, single_paths, x, y):
+    (cap, mincap) = capacities[(x, y)]
+    to_add = sum([size for (size, p) in single_paths if (x, y) in zip(p[:-1], p[1:])])
+    return (cap + to_add, mincap)
+
+def legacyLowerBound(context, capacities, ri_dx_dag):
+    size = context.flow_sizes[0]
+    paths = daglib.getAllPathsLim(ri_dx_dag, context.ingress_routers[0], context.egress_router, 0)
+    if paths == []:
+        return 0.0
+    full_edges = set()
+    for (x, y) in ri_dx_dag.edges():
+        (vcap, mincap) = legacyVirtualCapacity(capacities, context.single_paths, x, y)
+        if vcap - size < mincap:
+            full_edges.add((x, y))
+    congested_paths = [p for p in paths if full_edges.intersection(zip(p[:-1], p[1:])) != set()]
+    return len(congested_paths)/float(len(paths))
+
+def legacyChecks(context, capacities, new_adag, new_paths):
+    for (x, y, data) in new_adag.edges(data=True):
+        (data['capacity'], data['mincap']) = legacyVirtualCapacity(capacities, context.single_paths, x, y)
+    return boundlib.congestionBounds(new_adag, new_paths, context.flow_sizes)
+
+def arrayChecks(context, new_adag, new_paths):
+    dagpool.addVirtualCapacities(new_adag, context.graph, context.virtual_caps)
+    return boundlib.congestionBounds(new_adag, new_paths, context.flow_sizes,
+                                     context.graph, context.virtual_caps)
+
+##############################################################
+
+def timeIt(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return (time.time() - start_time, result)
+
+def run(n_nodes, p, n_flows, n_candidates):
+    (graph, adag, allocated_flows, ingress_routers, egress, dags) = scenario(n_nodes, p, n_flows, n_candidates)
+    snapshot = snapshotFromGraph(graph)
+    print("*** %d nodes, %d edges, %d flows, %d candidates"%(n_nodes, graph.number_of_edges(),
+                                                            n_flows + 1, len(dags)))
+
+    # Context of the decision, and former dict of capacities
+    (t_context, context) = timeIt(DecisionContext, adag, snapshot, Flow(size=40e3),
+                                  allocated_flows, ingress_routers, egress)
+    (t_dict, capacities) = timeIt(lambda: {(x, y): (data.get('capacity'), data.get('mincap')) for
+                                           (x, y, data) in snapshot.edges(data=True)})
+
+    (t_legacy_lb, legacy_lb) = timeIt(lambda: [legacyLowerBound(context, capacities, dag) for dag in dags])
+    (t_lb, lb) = timeIt(lambda: [dagpool.congestionLowerBound(context, dag) for dag in dags])
+
+    # New all-sources DAGs and paths of the flows of each candidate
+    candidates = []
+    for dag in dags:
+        new_adag = dagpool.recomputeAllSourcesDag(context.adag, dag)
+        candidates.append((new_adag, dagpool.computeNewPaths(new_adag, ingress_routers, egress)))
+    (t_legacy_checks, legacy_bounds) = timeIt(lambda: [legacyChecks(context, capacities, a, paths) for
+                                                       (a, paths) in candidates])
+    (t_checks, bounds) = timeIt(lambda: [arrayChecks(context, a, paths) for (a, paths) in candidates])
+
+    t_legacy = t_dict + t_legacy_lb + t_legacy_checks
+    t_arrays = t_context + t_lb + t_checks
+    print("    %-14s %10s %10s %8s"%('', 'dicts (ms)', 'arrays (ms)', 'speedup'))
+    for (name, t0, t1) in [('lower bounds', t_legacy_lb, t_lb), ('checks', t_legacy_checks, t_checks),
+                           ('per decision', t_legacy, t_arrays)]:
+        print("    %-14s %10.2f %10.2f %7.1fx"%(name, t0*1000.0, t1*1000.0, t0/t1))
+    same = legacy_lb == lb and all([abs(l0 - l1) < 1e-9 and abs(u0 - u1) < 1e-9 for
+                                    ((l0, u0), (l1, u1)) in zip(legacy_bounds, bounds)])
+    print("    same results: %s"%same)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        n_candidates = int(sys.argv[1])
+    else:
+        n_candidates = 200
+    for (n_nodes, p, n_flows) in SCENARIOS:
+        run(n_nodes, p, n_flows, n_candidates)
@@ -0,0 +1,170 @@
+"""Benchmarks the links monitor (LinksMonitorThread) against simulated
+SNMP agents (see tecontroller/res/snmpagent.py), without mininet.
+
+The agents of n_routers routers, with n_interfaces router-to-router
+links each, are served from a separate process. In each scenario the
+monitor polls all routers every interval seconds, and the benchmark
+reports:
+
+ * cycle: mean and max duration of the poll cycles (ms).
+ * cpu: CPU time used by the monitor, as % of the elapsed time.
+ * error: mean and max relative error of the link rates estimated by
+   the monitor, with respect to the mean rates of the agents between
+   two read-outs.
+ * missed: read-outs of a router that failed (lost requests).
+
+Usage: python benchmark_linksmonitor.py [n_routers [n_interfaces]]
+"""
+from tecontroller.linkmonitor.linksmonitor_thread import LinksMonitorThread
+from tecontroller.res.snmpagent import SimulatedRouter, AgentSimulator
+from tecontroller.res.snmplib import SnmpSessionCounters
+
+import multiprocessing
+import networkx as nx
+import numpy as np
+import threading
+import random
+import time
+import sys
+import os
+
+# Bandwidth of the links (bits/s)
+BW = 1e7
+
+SCENARIOS = [('baseline', {}, {}),
+             ('latency 10ms + jitter 10ms', {'latency': 0.01, 'jitter': 0.01}, {}),
+             ('loss 5%', {'loss': 0.05}, {}),
+             ('64-bit wraps', {}, {'wrap': True}),
+             ('rate steps', {}, {'steps': True})]
+
+def routerId(k):
+    return '10.0.0.%d'%(k + 1)
+
+
+class SimulatedDatabase(object):
+    """Router names, as read by the monitor from the network database"""
+    def __init__(self, routers):
+        self.names = {routerId(k): router.name for (k, router) in enumerate(routers)}
+
+    def getNameFromIP(self, x):
+        return self.names.get(x, x)
+
+
+class SimulatedLinksMonitor(LinksMonitorThread):
+    """Links monitor of the simulated routers. Interface j of router k is
+    the link towards router k+j+1.
+    """
+    def __init__(self, routers, **kwargs):
+        self.routers = routers
+        capacity_graph = nx.DiGraph()
+        for (edge, data) in self._startLinks().iteritems():
+            capacity_graph.add_edge(*edge, bw=data['bw'], capacity=data['capacity'])
+        super(SimulatedLinksMonitor, self).__init__(capacity_graph, threading.Lock(), None,
+                                                    db=SimulatedDatabase(routers), **kwargs)
+
+    def _startCounters(self):
+        return {routerId(k): SnmpSessionCounters(routerIp='127.0.0.1', port=router.port) for
+                (k, router) in enumerate(self.routers)}
+
+    def _startLinks(self):
+        links = {}
+        n = len(self.routers)
+        for (k, router) in enumerate(self.routers):
+            for (j, iface) in enumerate(router.interfaces[1:]):
+                links[(routerId(k), routerId((k + j + 1) % n))] = {'bw': BW, 'capacity': BW,
+                                                                  'interface': iface.name}
+        return links
+
+
+def createRouters(n_routers, n_interfaces, duration, seed, wrap=False, steps=False):
+    """Returns the simulated routers, with links loaded between 10% and
+    90% of BW.
+    """
+    rnd = random.Random(seed)
+    routers = []
+    for k in range(n_routers):
+        rates = []
+        start_octets = []
+        for j in range(n_interfaces):
+            rate = rnd.uniform(0.1, 0.9)*BW/8
+            if steps:
+                # Load changes twice during the run
+                rates.append([(0, rate), (duration/3.0, rnd.uniform(0.1, 0.9)*BW/8),
+                              (2*duration/3.0, rnd.uniform(0.1, 0.9)*BW/8)])
+            else:
+                rates.append(rate)
+            if wrap:
+                # Counters wrap around in the middle of the run
+                start_octets.append(2**64 - int(rate*duration/2))
+            else:
+                start_octets.append(0)
+        routers.append(SimulatedRouter('r%d'%(k + 1), n_interfaces, rates, start_octets))
+    return routers
+
+def cpuTime():
+    (user, system) = os.times()[:2]
+    return user + system
+
+def run(name, n_routers, n_interfaces, simulator_args, router_args, cycles=20, interval=0.5, seed=1):
+    duration = cycles*interval
+    routers = createRouters(n_routers, n_interfaces, duration, seed, **router_args)
+    simulator = AgentSimulator(routers, seed=seed, **simulator_args)
+    # Agents run in their own process, so that their CPU is not counted
+    process = multiprocessing.Process(target=simulator.run)
+    process.daemon = True
+    process.start()
+
+    # Reading delay of the responses (on average)
+    delay = simulator.latency + simulator.jitter/2.0
+    interfaces = {(routerId(k), iface.name): iface for
+                  (k, router) in enumerate(routers) for iface in router.interfaces}
+    try:
+        monitor = SimulatedLinksMonitor(routers, interval=interval, adaptive=False, push=False)
+        monitor.updateLinksCapacities()
+
+        durations = []
+        errors = []
+        missed = 0
+        start_time = time.time()
+        start_cpu = cpuTime()
+        for cycle in range(cycles):
+            time.sleep(max(0, start_time + (cycle + 1)*interval - time.time()))
+            previous = {r: counter.lastUpdated for (r, counter) in monitor.counters.iteritems()}
+            monitor.updateLinksCapacities()
+            durations.append(monitor.pollCycleDuration)
+
+            for (r, counter) in monitor.counters.iteritems():
+                if counter.lastUpdated == previous[r]:
+                    missed += 1
+                    continue
+                (positions, edge_ids) = monitor.router_edges[r]
+                estimated = monitor.bandwidths[edge_ids] - monitor.capacities[edge_ids]
+                for (position, rate) in zip(positions, estimated):
+                    iface = interfaces[(r, counter.interfaces[position]['name'])]
+                    expected = 8*iface.meanRate(previous[r] - delay, counter.lastUpdated - delay)
+                    errors.append(abs(rate - expected)/expected)
+        cpu = (cpuTime() - start_cpu)/(time.time() - start_time)
+        monitor.pollers.close()
+    finally:
+        process.terminate()
+        for router in routers:
+            router.sock.close()
+
+    errors = np.asarray(errors)
+    print("    %-28s %8.2f %8.2f %6.1f %8.2f %8.2f %6d"%(name, np.mean(durations)*1000.0, max(durations)*1000.0,
+                                                        cpu*100.0, errors.mean()*100.0, errors.max()*100.0, missed))
+
+if __name__ == '__main__':
+    n_routers = 8
+    n_interfaces = 4
+    if len(sys.argv) > 1:
+        n_routers = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        n_interfaces = int(sys.argv[2])
+    n_interfaces = min(n_interfaces, n_routers - 1)
+
+    print("*** %d routers, %d links each"%(n_routers, n_interfaces))
+    print("    %-28s %8s %8s %6s %8s %8s %6s"%('scenario', 'cycle', 'max', 'cpu', 'error', 'max', 'missed'))
+    print("    %-28s %8s %8s %6s %8s %8s %6s"%('', '(ms)', '(ms)', '(%)', '(%)', '(%)', ''))
+    for (name, simulator_args, router_args) in SCENARIOS:
+        run(name, n_routers, n_interfaces, simulator_args, router_args)
@@ -0,0 +1,92 @@
+"""Compares the iterative path enumerator of tecontroller.res.pathenum
+against the recursive versions it replaced, on random graphs of
+increasing size.
+
+Usage: python benchmark_paths.py [max_nodes]
+"""
+from tecontroller.res import pathenum
+
+import networkx as nx
+import random
+import time
+import sys
+
+def recursiveAllPathsLimDAG(dag, start, end, k, path=[]):
+    """Recursive version limited in hops (formerly in daglib, problib
+    and LBController._getAllPathsLimDAG).
+    """
+    path = path + [start]
+    if start == end:
+        return [path]
+    if not start in dag:
+        return []
+    paths = []
+    for node in dag[start]:
+        if node not in path:
+            if k == 0 or len(path) < k+1:
+                paths += recursiveAllPathsLimDAG(dag, node, end, k, path=path)
+    return paths
+
+def recursiveAllPathsLim(igp_graph, start, end, k, path=[], len_path=0):
+    """Recursive version limited in metric (formerly in
+    LBController._getAllPathsLim).
+    """
+    if path != []:
+        len_path += igp_graph[path[-1]][start]['metric']
+    path = path + [start]
+    if start == end:
+        if k == 0 or len_path < k+1:
+            return [path]
+        return []
+    if not start in igp_graph:
+        return []
+    paths = []
+    for node in igp_graph[start]:
+        if node not in path:
+            if k == 0 or len_path < k+1:
+                paths += recursiveAllPathsLim(igp_graph, node, end, k, path=path, len_path=len_path)
+    return paths
+
+def randomGraph(n, p, seed):
+    random.seed(seed)
+    graph_tmp = nx.gnp_random_graph(n, p, seed=seed)
+    while not nx.is_connected(graph_tmp):
+        graph_tmp = nx.gnp_random_graph(n, p)
+    graph = nx.DiGraph()
+    for (x, y) in graph_tmp.edges():
+        cost = random.randint(1, 5)
+        graph.add_edge(x, y, metric=cost)
+        graph.add_edge(y, x, metric=cost)
+    return graph
+
+def timeIt(function, *args, **kwargs):
+    start_time = time.time()
+    result = function(*args, **kwargs)
+    return (time.time() - start_time, result)
+
+def run(n, p, seed):
+    graph = randomGraph(n, p, seed)
+    (start, end) = (0, n-1)
+    diameter = nx.diameter(graph.to_undirected())
+    max_metric = 3*diameter
+
+    print("*** %d nodes, %d edges"%(n, graph.number_of_edges()))
+    cases = [('all paths', recursiveAllPathsLimDAG, (graph, start, end, 0), {}),
+             ('hop limit %d'%diameter, recursiveAllPathsLimDAG, (graph, start, end, diameter), {'max_hops': diameter}),
+             ('metric limit %d'%max_metric, recursiveAllPathsLim, (graph, start, end, max_metric), {'max_metric': max_metric})]
+    for (name, recursive, args, kwargs) in cases:
+        (t_rec, rec_paths) = timeIt(recursive, *args)
+        (t_it, it_paths) = timeIt(pathenum.getAllPaths, graph, start, end, **kwargs)
+        (t_first, first) = timeIt(pathenum.getAllPaths, graph, start, end, max_paths=10, **kwargs)
+        assert rec_paths == it_paths
+        to_print = "    %s: %d paths\trecursive: %.2f ms\titerative: %.2f ms\tspeedup: %.2fx\tfirst 10: %.2f ms"
+        print(to_print%(name, len(it_paths), t_rec*1000.0, t_it*1000.0, t_rec/t_it, t_first*1000.0))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        max_nodes = int(sys.argv[1])
+    else:
+        max_nodes = 12
+
+    for n in range(6, max_nodes+1, 2):
+        run(n, 0.4, n)
@@ -0,0 +1,67 @@
+"""Compares the time it takes to read the interface counters of the
+routers through the in-process SNMP session (SnmpSessionCounters)
+against calling the snmp command line tools (SnmpCounters).
+
+Both read a local stand-in agent (see tecontroller/res/snmpagent.py)
+that serves the IF-MIB objects used by the link monitor, with counters
+growing at a known rate. The 32-bit counters of the agent start close
+to their wrap-around, so that the estimated rates also show that wraps
+are accounted for.
+
+The subprocess path is only measured if snmpwalk is installed.
+
+Usage: python benchmark_snmp.py [n_interfaces]
+"""
+from tecontroller.res.snmplib import SnmpCounters, SnmpSessionCounters
+from tecontroller.res.snmpagent import SimulatedRouter, AgentSimulator
+
+from distutils.spawn import find_executable
+import time
+import sys
+
+def measure(counter, rounds, interval):
+    """Returns the tuple (mean read-out time, estimated rates of the
+    last read-out).
+    """
+    counter.updateCounters()
+    times = []
+    for i in range(rounds):
+        time.sleep(interval)
+        start_time = time.time()
+        counter.updateCounters()
+        times.append(time.time() - start_time)
+    rates = counter.getLoads()/8.0/counter.timeDiff
+    return (sum(times)/len(times), rates)
+
+def run(n_interfaces, rounds=20, interval=0.05, rate=10**7):
+    # ifIndex 1 is the loopback
+    router = SimulatedRouter('r1', n_interfaces - 1, rate=[rate*i for i in range(2, n_interfaces + 1)],
+                             start_octets=2**32 - 10**6)
+    agent = AgentSimulator([router])
+    agent.start()
+    print("*** %d interfaces, counters growing %d*ifIndex bytes/s"%(n_interfaces, rate))
+
+    counters = [('in-process session', SnmpSessionCounters(routerIp='127.0.0.1', port=router.port))]
+    if find_executable('snmpwalk'):
+        counters.append(('snmpwalk subprocess', SnmpCounters(routerIp='127.0.0.1:%d'%router.port)))
+    else:
+        print("    snmpwalk not found: subprocess path not measured")
+
+    results = []
+    for (name, counter) in counters:
+        (t, rates) = measure(counter, rounds, interval)
+        expected = [rate*int(data['number']) for data in counter.interfaces]
+        error = max([abs(r - e)/float(e) for (r, e) in zip(rates, expected)])
+        print("    %s: %.2f ms per read-out\tmax rate error: %.1f%%"%(name, t*1000.0, error*100.0))
+        results.append(t)
+    if len(results) == 2:
+        print("    speedup: %.1fx"%(results[1]/results[0]))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        n_interfaces = int(sys.argv[1])
+    else:
+        n_interfaces = 8
+    for n in sorted(set([2, n_interfaces/2, n_interfaces])):
+        if n >= 2:
+            run(n)
@@ -0,0 +1,87 @@
+"""Offline evaluation of the capacity filters of the links monitor
+(tecontroller/linkmonitor/capfilters.py) over recorded links logs.
+
+The filters are run over the available capacities (100 - utilization)
+of each logged link, as the links monitor would, and compared with a
+non-causal reference: the centered median of 5 read-outs. For each
+filter it reports:
+
+ * rmse: error with respect to the reference (in utilization points).
+ * noise: mean absolute change between consecutive outputs.
+ * lag: mean number of samples until the output settles within 10% of
+   the new level after each step of the reference.
+ * >100%: number of outputs above 100% utilization (double read-outs).
+
+Usage: python evaluate_filters.py [logfile ...]
+       (all logs in evaluation/test1/ by default)
+"""
+from tecontroller.linkmonitor import capfilters
+from tecontroller.linkmonitor.loadlog import readLinksLog
+from scipy import signal
+
+import numpy as np
+import glob
+import sys
+import os
+
+FILTERS = [('none', {}),
+           ('doublereadout', {}),
+           ('median', {'size': 3}),
+           ('median', {'size': 5}),
+           ('ewma', {'half_life': 1.0}),
+           ('ewma', {'half_life': 3.0}),
+           ('kalman', {'q': 0.1}),
+           ('kalman', {'q': 1.0})]
+
+def runFilter(name, kwargs, times, loads):
+    """Returns the filtered utilizations"""
+    n_links = loads.shape[1]
+    capacity_filter = capfilters.createFilter(name, n_links, **kwargs)
+    edge_ids = np.arange(n_links)
+    filtered = np.zeros(loads.shape)
+    for (i, timestamp) in enumerate(times):
+        filtered[i] = 100 - capacity_filter.update(edge_ids, 100 - loads[i], timestamp)
+    return filtered
+
+def settlingLag(filtered, reference, min_step=10.0, max_lag=10):
+    """Mean number of samples it takes filtered to get within 10% of the
+    new level after each step (of at least min_step) of reference.
+    """
+    lags = []
+    for link in range(reference.shape[1]):
+        steps = np.nonzero(np.abs(np.diff(reference[:, link])) >= min_step)[0] + 1
+        for t in steps:
+            jump = abs(reference[t, link] - reference[t-1, link])
+            lag = max_lag
+            for k in range(min(max_lag, len(reference) - t)):
+                if abs(filtered[t+k, link] - reference[t+k, link]) <= 0.1*jump:
+                    lag = k
+                    break
+            lags.append(lag)
+    if not lags:
+        return 0.0
+    return sum(lags)/float(len(lags))
+
+def evaluate(path):
+    (links, edges, times, loads) = readLinksLog(path)
+    loads = np.asarray(loads, dtype=float)
+    reference = np.column_stack([signal.medfilt(loads[:, l], 5) for l in range(len(links))])
+
+    print("*** %s: %d links, %d samples"%(os.path.basename(path), len(links), len(times)))
+    print("    %-24s %8s %8s %8s %6s"%('filter', 'rmse', 'noise', 'lag', '>100%'))
+    for (name, kwargs) in FILTERS:
+        filtered = runFilter(name, kwargs, times, loads)
+        rmse = np.sqrt(np.mean((filtered - reference)**2))
+        noise = np.mean(np.abs(np.diff(filtered, axis=0)))
+        lag = settlingLag(filtered, reference)
+        over = int((filtered > 100).sum())
+        label = name + ''.join(['(%s=%s)'%(k, v) for (k, v) in sorted(kwargs.items())])
+        print("    %-24s %8.2f %8.2f %8.2f %6d"%(label, rmse, noise, lag, over))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        paths = sys.argv[1:]
+    else:
+        paths = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test1', '*.log')))
+    for path in paths:
+        evaluate(path)
@@ -1,3 +1,4 @@
+from tecontroller.res import pathenum
 import networkx as nx
 import itertools as it
 import numpy as np
@@ -576,8 +577,8 @@ class Evaluation(object):
             
         return new_sources
 
-    def _getAllPathsLimDAG(self, dag, start, end, k, path=[]):
-        """Recursive function that finds all paths from start node to end node
+    def _getAllPathsLimDAG(self, dag, start, end, k):
+        """Finds all paths from start node to end node
         with maximum length of k.
         
         If the function is called with k=0, returns all existing
@@ -594,73 +595,13 @@ class Evaluation(object):
         since the dags do not have weights).
         
         """
-        # Accumulate nodes in path
-        path = path + [start]
-        
-        if start == end:
-            # Arrived to the end. Go back returning everything
-            return [path]
-            
-        if not start in dag:
-            return []
-            
-        paths = []
-        for node in dag[start]:
-            if node not in path: # Ommiting loops here
-                if k == 0:
-                    # If we do not want any length limit
-                    newpaths = self._getAllPathsLimDAG(dag, node, end, k, path=path)
-                    for newpath in newpaths:
-                        paths.append(newpath)
-                elif len(path) < k+1:
-                    newpaths = self._getAllPathsLimDAG(dag, node, end, k, path=path)
-                    for newpath in newpaths:
-                        paths.append(newpath)
-        return paths
-
-    def _getAllPathsLim(self, igp_graph, start, end, k, path=[], len_path=0, die=False):
-        """Recursive function that finds all paths from start node to end
-        node with maximum length of k.
+        return pathenum.getAllPaths(dag, start, end, max_hops=k)
+
+    def _getAllPathsLim(self, igp_graph, start, end, k):
+        """Finds all paths from start node to end node with maximum length
+        (sum of edge 'weight') of k.
         """
-        if not die:
-            # Accumulate path length first
-            if not path:
-                len_path = 0
-            else:
-                last_node = path[-1]
-                len_path += igp_graph.get_edge_data(last_node, start)['weight']
-                
-            # Accumulate nodes in path
-            path = path + [start]
-        
-            if start == end:
-                # Arrived to the end. Go back returning everything
-                if k == 0:
-                    return [path]
-                elif len_path < k+1:
-                    return [path]
-                else:
-                    self._getAllPathsLim(igp_graph, start, end, k, path=path, len_path=len_path, die=True)
-            
-            if not start in igp_graph:
-                return []
-
-            paths = []
-            for node in igp_graph[start]:
-                if node not in path: # Ommiting loops here
-                    if k == 0:
-                        # If we do not want any length limit
-                        newpaths = self._getAllPathsLim(igp_graph, node, end, k, path=path, len_path=len_path)
-                        for newpath in newpaths:
-                            paths.append(newpath)
-                    elif len_path < k+1:
-                        newpaths = self._getAllPathsLim(igp_graph, node, end, k, path=path, len_path=len_path)
-                        for newpath in newpaths:
-                            paths.append(newpath)
-            return paths
-        else:
-            # Recursive call dies here
-            pass
+        return pathenum.getAllPaths(igp_graph, start, end, max_metric=k, metric_key='weight')
 
     def exactCongestionProbability(self, all_dag, flow_paths, flow_sizes):
         """
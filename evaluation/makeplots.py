@@ -2,6 +2,7 @@
 in the network.
 """
 from tecontroller.res import defaultconf as dconf
+from tecontroller.linkmonitor.loadlog import readLinksLog
 import numpy as np
 import matplotlib.pyplot as plt
 import time
@@ -15,62 +16,25 @@ import matplotlib
 def extractData(logfile):
     # Here we store all data from logfile
     data_dict = {}
-    
-    # Read al lines of logfile first
-    lines = logfile.readlines()
-    
-    # Remove \n and split by ','
-    lines = [line.strip('\n').split(',') for line in lines]
 
-    # Get logged edges line 
-    edges_t = lines[0]
-
-    # Remove edge line from top
-    lines = lines[1:]
+    # Read the logfile (binary or text)
+    logfile.close()
+    (links, edges, seconds, loads) = readLinksLog(logfile.name)
 
     # Fill data dict with edges 
-    for edge_t in edges_t:
-        if edge_t != '':
-            link = edge_t.split('->')[0]
-            edge = edge_t.split('->')[1]
-            x = edge.split(' ')[0].strip('(')
-            y = edge.split(' ')[1].strip(')')
-            edge = (x,y)
-            data_dict[link] = {'edge': edge}
+    for link, edge in zip(links, edges):
+        data_dict[link] = {'edge': edge}
 
     ## Get time axis (in seconds)
-    seconds = np.asarray([float(line[0]) for line in lines])
     # Make time relative to start
     seconds = seconds - seconds[0]
     
     # Add it into data_dict
     data_dict['time_axis'] = seconds
 
-    # Separate other data
-    data = [line[1:] for line in lines]
-
-    # Iterate data and load it in data dictionary
-    # First fill tmp dict with loads
-    tmp_loads = {}
-    for l in data_dict.keys():
-        if l != 'time_axis':
-            tmp_loads[l] = []
-
-    for line in data:
-        # Iterate value edges in line
-        for v in line:
-            # Get link 
-            link = v.split(' ')[0].strip('(')
-            value = float(v.split(' ')[1].strip('%)'))
-            # Add value in list of values per link
-            tmp_loads[link].append(value)
-
-    # Add it into data_dict
-    for link, values in tmp_loads.iteritems():
-        if link != 'time_axis':
-            # Convert to np array
-            values = np.asarray(values)
-            data_dict[link]['values'] = values
+    # Load values in data dictionary
+    for i, link in enumerate(links):
+        data_dict[link]['values'] = np.asarray(loads[:, i], dtype=float)
 
     # Compute filtered output with a median filter
     for link in data_dict.keys():
@@ -79,7 +43,6 @@ def extractData(logfile):
             filtered = signal.medfilt(values)
             data_dict[link]['filtered'] = filtered
 
-    logfile.close()
     return data_dict
 
 
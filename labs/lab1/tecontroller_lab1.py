@@ -31,16 +31,17 @@ class TEControllerLab1(SimplePathLB):
         with self.capacityGraphLock:
             self.cg = self._createCapacitiesGraph()
 
-        # Variable where we save the last "read-out" copy of the
-        # capacity graph
-        self.cgc = self.cg.copy()
-
-        # Start the links monitorer thread linked to the event queue
-        lmt = LinksMonitorThread(capacity_graph = self.cg,
-                                 lock = self.capacityGraphLock,
-                                 logfile = dconf.LinksMonitor_LogFile,
-                                 median_filter=False)
-        lmt.start()
+        # Start the links monitorer thread linked to the event queue.
+        # Its loadStore keeps the recent history of link utilizations
+        self.linksMonitor = LinksMonitorThread(capacity_graph = self.cg,
+                                               lock = self.capacityGraphLock,
+                                               logfile = dconf.LinksMonitor_LogFile,
+                                               median_filter=False,
+                                               hot_utilization=self.congestionThreshold)
+        self.linksMonitor.start()
+
+        # Last capacity snapshot read (see capsnapshot.py)
+        self.cgc = self.linksMonitor.snapshot
         
     def run(self):
         """Main loop that deals with new incoming events
@@ -157,16 +158,12 @@ class TEControllerLab1(SimplePathLB):
         Re-writes the parent class method.
         """
 
-        # We acquire the lock now, and assume that capacities are
-        # fixed for all execution of the dealWithNewFlow function
-
-        with self.capacityGraphLock:
-            # Make copy of the capacity graph at that moment in time
-            # and release the lock.
-            self.cgc = self.cg.copy()
+        # Take the latest capacity snapshot: capacities are fixed for
+        # all execution of the dealWithNewFlow function
+        self.cgc = self.linksMonitor.snapshot
 
         t = time.strftime("%H:%M:%S", time.gmtime())
-        log.info("%s - Copy of the capacity graph done. Current edge usages:\n"%t)
+        log.info("%s - Capacity snapshot %d taken. Current edge usages:\n"%(t, self.cgc.version))
         for (x, y, data) in self.cgc.edges(data=True):
             currentLoad = self.getCurrentEdgeLoad(x,y)
             x_name = self.db.getNameFromIP(x)
@@ -313,16 +310,10 @@ class TEControllerLab1(SimplePathLB):
         We overwrite the method so that capacities are now checked from the
         SNMP couters data updated by the link monitor thread.
         """
-        caps_in_path = []
-        for (u,v) in zip(path[:-1], path[1:]):
-            edge_data = self.cgc.get_edge_data(u, v)
-            if edge_data:
-                cap = edge_data.get('capacity', None)
-                caps_in_path.append(cap)
-        try:
-            mini = min(caps_in_path)
-            return mini
-        except ValueError:
+        min_cap_edge = self.cgc.minCapacityEdge(path)
+        if min_cap_edge is not None:
+            return min_cap_edge[1]
+        else:
             t = time.strftime("%H:%M:%S", time.gmtime())
             log.info("%s - getMinCapacity(): ERROR: min could not be calculated\n"%t)
             log.info("\t* Path: %s\n"%path)            
@@ -336,7 +327,7 @@ class TEControllerLab1(SimplePathLB):
         for path in path_list:
             # Get edge with minimum capacity of the path
             ((x,y), minCap) = self.getMinCapacityEdge(path)
-            bw = self.cgc[x][y].get('bw')
+            bw = self.cgc.bandwidth(x, y)
 
             currentload = (bw - minCap)/float(bw)
             if currentload > self.congestionThreshold:
@@ -348,17 +339,11 @@ class TEControllerLab1(SimplePathLB):
         return True
 
     def getMinCapacityEdge(self, path):
-        caps_edges = []
-        for (u,v) in zip(path[:-1], path[1:]):
-            edge_data = self.cgc.get_edge_data(u, v)
-            if edge_data:
-                cap = edge_data.get('capacity', None)
-                caps_edges.append(((u,v), cap))
-        try:
-            min_cap_edge = min(caps_edges, key=lambda x: x[1])
+        # Read from the arrays of the capacity snapshot
+        min_cap_edge = self.cgc.minCapacityEdge(path)
+        if min_cap_edge is not None:
             return min_cap_edge
-        
-        except ValueError:
+        else:
             t = time.strftime("%H:%M:%S", time.gmtime())
             log.info("%s - getMinCapacity(): ERROR: min could not be calculated\n"%t)
             log.info("Argument should be a list! (not a list of lists)")
@@ -391,7 +376,6 @@ class TEControllerLab1(SimplePathLB):
                 cg.remove_node(node)
                 
         for (x, y, edge_data) in cg.edges(data=True):
-            edge_data['window'] = []
             edge_data['capacity'] = 0
         return cg
 
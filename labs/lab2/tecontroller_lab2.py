@@ -3,7 +3,13 @@ from tecontroller.loadbalancer.lbcontroller import LBController
 from tecontroller.linkmonitor.linksmonitor_thread import LinksMonitorThread
 from fibbingnode.misc.mininetlib import get_logger
 from tecontroller.res import defaultconf as dconf
-from tecontroller.res.problib import ProbabiliyCalculator
+from tecontroller.res.problib import ProbabiliyCalculator, IncrementalCongestionProbability, CongestionCostEstimator
+from tecontroller.res import problib
+from tecontroller.res import pathenum
+from tecontroller.res.dagpool import CandidateDagPool, DecisionContext
+from tecontroller.res.boundlib import BoundsFilter
+from tecontroller.res.csrgraph import CSRGraph
+from tecontroller.res import dagpool
 import networkx as nx
 import threading
 import time
@@ -17,14 +23,41 @@ log = get_logger()
 lineend = "-"*100+'\n'
 
 class TEControllerLab2(LBController):
-    def __init__(self, congestionThreshold = 0.8, probabilityAlgorithm='exact'):
-        
+    def __init__(self, congestionThreshold = 0.8, probabilityAlgorithm='exact',
+                 nWorkers=dconf.LBC_CandidateWorkers,
+                 decisionTimeBudget=dconf.LBC_DecisionTimeBudget,
+                 nSamples=dconf.LBC_CandidateSamples,
+                 samplingSeed=dconf.LBC_SamplingSeed):
+
+        # Reject unknown congestion probability algorithms before
+        # starting any process or thread
+        if probabilityAlgorithm is not None:
+            dagpool.checkAlgorithm(probabilityAlgorithm)
+
+        # Pool of processes that evaluate the candidate DAGs. It is
+        # created first, before the parent class spawns its threads
+        self.nWorkers = nWorkers
+        self.dagPool = CandidateDagPool(n_workers=self.nWorkers)
+
         # Call init method from LBController
         super(TEControllerLab2, self).__init__(congestionThreshold)
 
         # Instantiate probability calculator object
         self.pc = ProbabiliyCalculator()
 
+        # Predicts the cost of each probability algorithm
+        self.costEstimator = CongestionCostEstimator()
+
+        # Per-prefix incremental congestion probability state:
+        # {prefix: IncrementalCongestionProbability}
+        self.incrementalPc = {}
+
+        # Congestion probability above which ECMP should be
+        # de-activated, and analytic bounds used to decide it without
+        # computing the exact probability whenever possible
+        self.ecmpCongProbThreshold = 0.5
+        self.boundsFilter = BoundsFilter()
+
         # Create lock for synchronization on accessing self.cg
         self.capacityGraphLock = threading.Lock()
 
@@ -32,22 +65,35 @@ class TEControllerLab2(LBController):
         with self.capacityGraphLock:
             self.cg = self._createCapacitiesGraph()
 
-        # Variable where we save the last "read-out" copy of the
-        # capacity graph
-        self.cgc = self.cg.copy()
-
         # Type of algorithm used to calculate congestion probability
-        # in the ECMP part. It can be: simplified, exact or sampled
+        # in the ECMP part. It can be: exact, decomposed or sampled,
+        # or None to choose it at each decision given its expected cost
         self.probabilityAlgorithm = probabilityAlgorithm
         t = time.strftime("%H:%M:%S", time.gmtime())
         log.info("%s - ECMP Congestion Probability Calculation function used: %s\n"%(t, self.probabilityAlgorithm))
+        log.info("%s - Candidate DAGs evaluated by %d worker process/es\n"%(t, self.nWorkers))
+
+        # Maximum time (in seconds) spent searching for a DAG in each
+        # allocation decision
+        self.decisionTimeBudget = decisionTimeBudget
+
+        # Number of candidate DAGs sampled at random in each
+        # allocation decision (0 means all of them are enumerated),
+        # and generator of the seeds of each sampler
+        self.nSamples = nSamples
+        self.samplingRandom = random.Random(samplingSeed)
         
-        # Start the links monitorer thread linked to the event queue
-        lmt = LinksMonitorThread(capacity_graph = self.cg,
-                                 lock = self.capacityGraphLock,
-                                 logfile = dconf.LinksMonitor_LogFile,
-                                 median_filter=False)
-        lmt.start()
+        # Start the links monitorer thread linked to the event queue.
+        # Its loadStore keeps the recent history of link utilizations
+        self.linksMonitor = LinksMonitorThread(capacity_graph = self.cg,
+                                               lock = self.capacityGraphLock,
+                                               logfile = dconf.LinksMonitor_LogFile,
+                                               median_filter=False,
+                                               hot_utilization=self.congestionThreshold)
+        self.linksMonitor.start()
+
+        # Last capacity snapshot read (see capsnapshot.py)
+        self.cgc = self.linksMonitor.snapshot
         
     def run(self):
         """Main loop that deals with new incoming events
@@ -154,16 +200,13 @@ class TEControllerLab2(LBController):
         """
         Re-writes the parent class method.
         """
-        # We acquire the lock now, and assume that capacities are
-        # fixed for all execution of the dealWithNewFlow function
-        with self.capacityGraphLock:
-            # Make copy of the capacity graph at that moment in time
-            # and release the lock.
-            self.cgc = self.cg.copy()
+        # Take the latest capacity snapshot: capacities are fixed for
+        # all execution of the dealWithNewFlow function
+        self.cgc = self.linksMonitor.snapshot
 
         # Log capacities in stdout
         t = time.strftime("%H:%M:%S", time.gmtime())
-        log.info("%s - Copy of the capacity graph done. Current edge usages:\n"%t)
+        log.info("%s - Capacity snapshot %d taken. Current edge usages:\n"%(t, self.cgc.version))
         for (x, y, data) in self.cgc.edges(data=True):
             currentLoad = self.getCurrentEdgeLoad(x,y)
             x_name = self.db.getNameFromIP(x)
@@ -220,10 +263,6 @@ class TEControllerLab2(LBController):
             # Get ongoing flows
             allocated_flows = self.getAllocatedFlows(dst_prefix)
 
-            # Collect flow sizes and paths
-            flow_sizes = [f.size for (f, pl) in allocated_flows]+[flow.size]
-            flow_paths = [pl for (f, pl) in allocated_flows]+[currentPaths]
-
             # Insert capacities into active DAG
             for (u, v, data) in adag.edges(data=True):
                 cap = self.cgc[u][v]['capacity']
@@ -237,13 +276,37 @@ class TEControllerLab2(LBController):
             log.info("\t* Flow size: %d\n"%flow.size)
             log.info("\t* Equal Cost Paths: %s\n"%self.toLogRouterNames(currentPaths))
             
+            flow_sizes = [f.size for (f, pl) in allocated_flows]+[flow.size]
+            flow_paths = [pl for (f, pl) in allocated_flows]+[currentPaths]
+            ipc = self.getIncrementalPc(dst_prefix)
             with self.pc.timer as t:
-                congProb = self.pc.ExactCongestionProbability(adag, flow_paths, flow_sizes)
+                # Try to decide with the analytic bounds first
+                (lower, upper, decided) = self.boundsFilter.decide(adag, flow_paths, flow_sizes,
+                                                                   self.ecmpCongProbThreshold)
+                if decided:
+                    # Report the bound on the side of the threshold
+                    if upper <= self.ecmpCongProbThreshold:
+                        congProb = upper
+                    else:
+                        congProb = lower
+                else:
+                    # Update load distribution of the prefix with the
+                    # flows that changed since last decision
+                    ipc.sync(adag, allocated_flows)
+                    congProb = ipc.congestionProbability(adag, flow.size, currentPaths)
 
             # Log it
-            to_print = "\t* Flow will be allocated with a congestion probability of %.2f%%\n"
-            log.info(to_print%(congProb*100.0))
+            if decided:
+                to_print = "\t* Flow will be allocated with a congestion probability %s %.2f%%\n"
+                log.info(to_print%("<=" if congProb == upper else ">=", congProb*100.0))
+            else:
+                to_print = "\t* Flow will be allocated with a congestion probability of %.2f%%\n"
+                log.info(to_print%(congProb*100.0))
             log.info("\t* It took %s ms to compute probabilities\n"%str(self.pc.timer.msecs))
+            to_log = "\t* Pc bounds: [%.2f%%, %.2f%%]. Exact computation %s (%s)\n"
+            log.info(to_log%(lower*100.0, upper*100.0, "skipped" if decided else "needed", str(self.boundsFilter)))
+            to_log = "\t* Load distribution of prefix: %d full recomputes, %d incremental updates\n"
+            log.info(to_log%(ipc.n_recomputes, ipc.n_updates))
             to_print = "\t* Paths: %s\n"
             log.info(to_print%str([self.toLogRouterNames(path) for path in currentPaths]))
 
@@ -306,13 +369,21 @@ class TEControllerLab2(LBController):
                 # allocate flow to a congestion-free path
                 self.flowAllocationAlgorithm(dst_prefix, flow, currentPath)
 
+    def getIncrementalPc(self, prefix):
+        """Returns the incremental congestion probability object of the
+        prefix, creating it if needed.
+        """
+        if prefix not in self.incrementalPc.keys():
+            self.incrementalPc[prefix] = IncrementalCongestionProbability()
+        return self.incrementalPc[prefix]
+
     def shouldDeactivateECMP(self, dag, currentPaths, congProb):
         """This function returns a boolean output that decides wheather we
         should deactivate ECMP.
 
         TODO
         """
-        if congProb > 0.5:
+        if congProb > self.ecmpCongProbThreshold:
             return True
         else:
             return False
@@ -325,7 +396,7 @@ class TEControllerLab2(LBController):
         for path in path_list:
             # Get edge with minimum capacity of the path
             ((x,y), minCap) = self.getMinCapacityEdge(path)
-            bw = self.cgc[x][y].get('bw')
+            bw = self.cgc.bandwidth(x, y)
 
             currentload = (bw - minCap)/float(bw)
             if currentload > self.congestionThreshold:
@@ -352,17 +423,11 @@ class TEControllerLab2(LBController):
         return currentLoad
     
     def getMinCapacityEdge(self, path):
-        caps_edges = []
-        for (u,v) in zip(path[:-1], path[1:]):
-            edge_data = self.cgc.get_edge_data(u, v)
-            if edge_data:
-                cap = edge_data.get('capacity', None)
-                caps_edges.append(((u,v), cap))
-        try:
-            min_cap_edge = min(caps_edges, key=lambda x: x[1])
+        # Read from the arrays of the capacity snapshot
+        min_cap_edge = self.cgc.minCapacityEdge(path)
+        if min_cap_edge is not None:
             return min_cap_edge
-        
-        except ValueError:
+        else:
             t = time.strftime("%H:%M:%S", time.gmtime())
             log.info("%s - getMinCapacity(): ERROR: min could not be calculated\n"%t)
             log.info("Argument should be a list! (not a list of lists)")
@@ -373,16 +438,10 @@ class TEControllerLab2(LBController):
         We overwrite the method so that capacities are now checked from the
         SNMP couters data updated by the link monitor thread.
         """
-        caps_in_path = []
-        for (u,v) in zip(path[:-1], path[1:]):
-            edge_data = self.cgc.get_edge_data(u, v)
-            if edge_data:
-                cap = edge_data.get('capacity', None)
-                caps_in_path.append(cap)
-        try:
-            mini = min(caps_in_path)
-            return mini
-        except ValueError:
+        min_cap_edge = self.cgc.minCapacityEdge(path)
+        if min_cap_edge is not None:
+            return min_cap_edge[1]
+        else:
             t = time.strftime("%H:%M:%S", time.gmtime())
             log.info("%s - getMinCapacity(): ERROR: min could not be calculated\n"%t)
             log.info("\t* Path: %s\n"%path)            
@@ -398,18 +457,9 @@ class TEControllerLab2(LBController):
                 cg.remove_node(node)
                 
         for (x, y, edge_data) in cg.edges(data=True):
-            edge_data['window'] = []
             edge_data['capacity'] = 0
         return cg
 
-    def shouldDeactivateECMP(self, dag, currentPaths, congProb):
-        """This function returns a boolean output that decides wheather we
-        should deactivate ECMP.
-
-        TODO
-        """
-        return False
-
     def utilizationIncrease(self, path, flow):
         # Get edge with minimum capacity of the path
         ((x,y), minCap) = self.getMinCapacityEdge(path)
@@ -476,7 +526,27 @@ class TEControllerLab2(LBController):
         ingress_rid = self.getIngressRouter(flow)
         egress_rid = self.getEgressRouter(flow)
 
-        if self.shouldCalculateAllDAGs():
+        if self.nSamples > 0:
+            n_samples = self.nSamples
+        elif self.shouldSampleDags(ingress_rid, egress_rid):
+            n_samples = dconf.LBC_FallbackCandidateSamples
+        else:
+            n_samples = 0
+
+        if n_samples > 0:
+            # Draw random DAGs lazily instead of enumerating them
+            if self.shouldCalculateAllDAGs():
+                max_paths = dconf.LBC_SamplerMaxPaths
+            else:
+                max_paths = 1
+            sampler = daglib.RandomDagSampler(self.initial_graph, ingress_rid, egress_rid,
+                                              seed=self.samplingRandom.random(),
+                                              max_paths=max_paths)
+            all_dags = sampler.take(n_samples)
+            to_log = "\t* %d random DAGs sampled (%d draws rejected)\n"
+            log.info(to_log%(sampler.n_samples, sampler.n_rejections))
+
+        elif self.shouldCalculateAllDAGs():
             # Check all DAGs
             all_dags = daglib.getAllPossibleDags(self.initial_graph, ingress_rid, egress_rid)
             log.info("\t* All possible DAGs should be considered (single+multiple path DAGs)\n")
@@ -486,10 +556,13 @@ class TEControllerLab2(LBController):
             all_dags = daglib.getAllPossibleSimplePathDags(self.initial_graph, ingress_rid, egress_rid)
             log.info("\t* Only single path DAGs are considered\n")
 
+        # Get ongoing flows
+        allocated_flows = self.getAllocatedFlows(dst_prefix)
+
         # Choose first which probability calculation algorithm is
         # going to be used
         if not self.probabilityAlgorithm:
-            probAlgo = self.chooseProbabilityAlgorithm()
+            probAlgo = self.chooseProbabilityAlgorithm(all_dags, flow, allocated_flows, ingress_rid, egress_rid)
         else:
             probAlgo = self.probabilityAlgorithm
         log.info("\t* Algorithm to compute Pc chosen: %s\n"%probAlgo)
@@ -502,41 +575,30 @@ class TEControllerLab2(LBController):
         to_log = "\t* First level sampling: %d samples out of %d\n"
         log.info(to_log%(n_iterations, len(all_dags)))
 
-        results = []
-        #foundEarlyDag = False
+        # Ship capacities and allocations once for all candidates
+        flows = [flow]+[f for (f, pl) in allocated_flows]
+        ingress_routers = map(lambda x: self.getIngressRouter(x), flows)
+        context = DecisionContext(adag, self.cgc, flow, allocated_flows,
+                                  ingress_routers, egress_rid, probAlgo)
 
         start_time = time.time()
-        # First level sampling
-        for i in range(n_iterations):
-            # Try ouf unique random ri-dx DAG
-            ri_dx_dag = all_dags[i]
-            
-            # Compute the new all-routers DAG
-            new_adag = self.recomputeAllSourcesDag(adag, ri_dx_dag)
-
-            # Add virtual capacities to new_adag
-            new_adag = self.addVirtualCapacities(new_adag, dst_prefix)
-
-            # Compute new path taken by sources in new re-computed DAG
-            new_sources = self.computeNewSources(new_adag, flow, dst_prefix)
+        # First level sampling: branch-and-bound search of the
+        # candidates in the pool. Only those with minimum Pc are
+        # returned
+        (min_evaluated, bound, n_evaluated, reason) = self.dagPool.search(context, all_dags[:n_iterations], self.pc,
+                                                                          self.isLowEnough, self.decisionTimeBudget)
 
-            # Compute congestion probability Pc
-            congProb = self.computeCongProb(probAlgo, new_adag, new_sources)
-
-            # If found congProb low enough
-            #if self.isLowEnough(congProb):
-                # Chose and break
-            #    foundEarlyDag = True
-            #    chosen_ridx_dag = ri_dx_dag
-            #    chosen_alls_dag = new_adag
-            #    chosen_congProb = congProb
-            #    break
-
-            #else:
-            # Note down results
-            results.append((ri_dx_dag, new_adag, congProb, new_sources))
+        # Note down results
+        results = []
+        for (index, new_adag, congProb, new_paths) in min_evaluated:
+            new_sources = [(flows[i], pl) for (i, pl) in enumerate(new_paths)]
+            results.append((all_dags[index], new_adag, congProb, new_sources))
 
         log.info("\t* It took %.3f ms to find optimal DAG\n"%((time.time()-start_time)*1000.0))
+        to_log = "\t* Search stopped (%s) after evaluating %d out of %d DAGs. Lower bound on optimal Pc: %s\n"
+        log.info(to_log%(reason, n_evaluated, n_iterations, "%.2f%%"%(bound*100.0) if bound is not None else "n/a"))
+        to_log = "\t* Exact Pc computation skipped by the bounds for %d out of %d candidates so far\n"
+        log.info(to_log%(self.dagPool.n_skipped, self.dagPool.n_candidates))
 
         # Now choose ri-dx DAG that minimizes Pc
         # Sort results by increasing congestion probability
@@ -798,28 +860,7 @@ class TEControllerLab2(LBController):
         the newly created all_routers_dag merging the previous one while forcing the
         new ridxDag.
         """
-        # Add 'flag' in new ridx dag
-        edges = new_ridx_dag.edges()
-        ridx_dag = nx.DiGraph()
-        ridx_dag.add_edges_from(edges, flag=True)
-        
-        # Compose it with all_dag
-        new_adag = nx.compose(all_dag, ridx_dag)
-
-        # Iterate new ridx nodes. Remove those outgoing edges from the same node 
-        # in all_dag that do not have 'flag'.
-        final_all_dag = new_adag.copy()
-
-        # Get edges to remove
-        edges_to_remove = [(x, y) for node in new_ridx_dag.nodes() for
-                           (x, y, data) in new_adag.edges(data=True)
-                           if node == x and not data.get('flag')]
-
-        # Remove them
-        final_all_dag.remove_edges_from(edges_to_remove)
-        
-        # Return modified all_dag
-        return final_all_dag
+        return dagpool.recomputeAllSourcesDag(all_dag, new_ridx_dag)
 
     def addVirtualCapacities(self, all_dag, dst_prefix):
         """
@@ -833,31 +874,13 @@ class TEControllerLab2(LBController):
         sources = self.getAllocatedFlows(dst_prefix)
 
         # Extract the single only path
-        sources = [(f, p[0]) for (f, p) in sources if len(p) == 1]
-
-        # Iterate each edge on all_dag
-        for (x, y, data) in all_dag.edges(data=True):
-            # Get edge capacity
-            cap = self.cgc[x][y].get('capacity')
-
-            # Add also minimum capacity mincap
-            mincap = self.cgc[x][y].get('mincap')
-            
-            # Accumulate sizes of flows that pass through there
-            to_add = sum([f.size for (f, p) in sources if (x, y) in zip(p[:-1], p[1:])])
-            
-            # Compute new virtual capacity
-            vcap = cap + to_add
+        single_paths = [(f.size, p[0]) for (f, p) in sources if len(p) == 1]
 
-            # Update new size in all_dag edge
-            data['capacity'] = vcap
-            data['mincap'] = mincap
+        # Capacities of the latest capacity snapshot, by edge id
+        graph = CSRGraph.fromCapacityGraph(self.cgc)
+        virtual_caps = graph.attributes['capacity'] + graph.pathLoads(single_paths)
 
-            # Remove flag
-            if 'flag' in data.keys():
-                data.pop('flag')
-
-        return all_dag    
+        return dagpool.addVirtualCapacities(all_dag, graph, virtual_caps)
 
     # TODO FUNCTIONS #########################################
 
@@ -876,9 +899,34 @@ class TEControllerLab2(LBController):
         else:
             return False
 
-    def chooseProbabilityAlgorithm(self):
-        # This should be replaced by the results of the evaluation
-        return 'exact'
+    def shouldSampleDags(self, ingress_rid, egress_rid):
+        """Returns True if there are too many paths from ingress to egress
+        router to enumerate all possible DAGs (one per subset of paths).
+        """
+        max_paths = dconf.LBC_MaxEnumeratedPaths
+        paths = pathenum.getAllPaths(self.initial_graph, ingress_rid, egress_rid, max_paths=max_paths+1)
+        if len(paths) > max_paths:
+            to_log = "\t* WARNING: more than %d paths between ingress and egress: candidate DAGs will be sampled\n"
+            log.info(to_log%max_paths)
+            return True
+        return False
+
+    def chooseProbabilityAlgorithm(self, all_dags, flow, allocated_flows, ingress_rid, egress_rid):
+        """Chooses the most accurate congestion probability algorithm that is
+        expected to run within dconf.LBC_PcTimeBudget for the candidate DAGs.
+
+        The new flow is assumed to take as many paths as in the largest
+        candidate DAG, and the allocated flows as many as they have now.
+        Flows with the same size and ingress router share their paths.
+        """
+        new_paths = [problib.countPaths(dag, ingress_rid, egress_rid) for dag in all_dags]
+        path_counts = [max(new_paths + [1])] + [len(pl) for (f, pl) in allocated_flows]
+        groups = [(flow.size, ingress_rid)] + [(f.size, self.getIngressRouter(f)) for (f, pl) in allocated_flows]
+
+        (algorithm, secs) = self.costEstimator.choose(path_counts, dconf.LBC_PcTimeBudget, groups)
+        to_log = "\t* %d allocations to evaluate: %s expected to take %.2f ms per candidate\n"
+        log.info(to_log%(problib.allocationProductSize(path_counts), algorithm, secs*1000.0))
+        return algorithm
 
     def computeNewSources(self, new_adag, flow, dst_prefix):
         """
@@ -895,13 +943,11 @@ class TEControllerLab2(LBController):
         # Calculate egress router (should be the same for all)
         er = self.getEgressRouter(flow)
 
-        # Result list of tuples (flow, [p1, p2])
-        sources_to_paths = []
-
         # Search for all paths for each flow
-        for index, f in enumerate(flows):
-            all_flow_paths = daglib.getAllPathsLim(new_adag, irs[index], er, 0)
-            sources_to_paths.append((f, all_flow_paths))
+        new_paths = dagpool.computeNewPaths(new_adag, irs, er)
+
+        # Result list of tuples (flow, [p1, p2])
+        sources_to_paths = zip(flows, new_paths)
 
         return sources_to_paths
 
@@ -916,13 +962,7 @@ class TEControllerLab2(LBController):
         flow_sizes = [f.size for (f, pl) in sources]
         flow_paths = [pl for (f, pl) in sources]
 
-        if algorithm == 'exact':
-            congProb = self.pc.ExactCongestionProbability(all_dag, flow_paths, flow_sizes)
-        elif algorithm == 'sampled':
-            pass
-        else:
-            pass
-        return congProb
+        return dagpool.computeCongProb(self.pc, algorithm, all_dag, flow_paths, flow_sizes)
 
     ##########################################################
         
@@ -1071,11 +1111,19 @@ if __name__ == '__main__':
     log.info("-"*90+"\n")
     time.sleep(dconf.LBC_InitialWaitingTime)
 
-    if len(sys.argv) == 2:
+    if len(sys.argv) >= 2:
         algorithm = sys.argv[1]
     else:
         algorithm = 'exact'
+
+    if algorithm == 'auto':
+        algorithm = None
+
+    if len(sys.argv) == 3:
+        nWorkers = int(sys.argv[2])
+    else:
+        nWorkers = dconf.LBC_CandidateWorkers
     
-    tec = TEControllerLab2(probabilityAlgorithm=algorithm)
+    tec = TEControllerLab2(probabilityAlgorithm=algorithm, nWorkers=nWorkers)
     tec.run()
                                 
@@ -0,0 +1,160 @@
+"""This module implements the filters that the links monitor applies to
+the available capacity read-outs before writing them into the capacity
+graph.
+
+Filters keep their state in arrays indexed by edge id, and are applied
+at once to the read-outs of all links updated in a poll cycle:
+
+    filtered = capacity_filter.update(edge_ids, values, timestamp)
+
+Available filters (see createFilter):
+
+ * 'none': read-outs are used as they are.
+
+ * 'doublereadout': discards read-outs that double the previous one
+   (counters read twice in the same interval).
+
+ * 'median': median of the last size read-outs.
+
+ * 'ewma': exponentially weighted moving average, with a half-life
+   given in seconds.
+
+ * 'kalman': Kalman filter of a random walk observed with noise.
+"""
+import numpy as np
+import time
+
+class CapacityFilter(object):
+    """Base class: no filtering"""
+    def __init__(self, n_edges):
+        self.n_edges = n_edges
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def update(self, edge_ids, values, timestamp=None):
+        """Returns the filtered values of the new read-outs values of the
+        edges with edge_ids (arrays), taken at timestamp.
+        """
+        return np.asarray(values, dtype=float)
+
+    def __repr__(self):
+        return "%s(%d edges)"%(self.__class__.__name__, self.n_edges)
+
+
+class DoubleReadoutFilter(CapacityFilter):
+    """Replaces a read-out by the previous one if it is about twice as
+    big, once each edge has been read more than size times.
+    """
+    def __init__(self, n_edges, size=3, low=1.95, high=2.05):
+        self.size = size
+        self.low = low
+        self.high = high
+        super(DoubleReadoutFilter, self).__init__(n_edges)
+
+    def reset(self):
+        self.last = np.zeros(self.n_edges)
+        self.count = np.zeros(self.n_edges, dtype=int)
+
+    def update(self, edge_ids, values, timestamp=None):
+        values = np.asarray(values, dtype=float)
+        last = self.last[edge_ids]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = values/last
+        double = (self.count[edge_ids] >= self.size) & (rate > self.low) & (rate < self.high)
+        filtered = np.where(double, last, values)
+        self.last[edge_ids] = filtered
+        self.count[edge_ids] += 1
+        return filtered
+
+
+class MedianFilter(CapacityFilter):
+    """Median of the last size read-outs of each edge (the upper one if
+    fewer than size read-outs have been taken, or size is even).
+    """
+    def __init__(self, n_edges, size=3):
+        self.size = size
+        super(MedianFilter, self).__init__(n_edges)
+
+    def reset(self):
+        # Circular window of read-outs of each edge
+        self.window = np.full((self.n_edges, self.size), np.nan)
+        self.count = np.zeros(self.n_edges, dtype=int)
+
+    def update(self, edge_ids, values, timestamp=None):
+        edge_ids = np.asarray(edge_ids, dtype=int)
+        self.window[edge_ids, self.count[edge_ids] % self.size] = values
+        self.count[edge_ids] += 1
+        # NaNs (empty slots) are sorted last
+        ordered = np.sort(self.window[edge_ids], axis=1)
+        n = np.minimum(self.count[edge_ids], self.size)
+        return ordered[np.arange(len(edge_ids)), n/2]
+
+
+class EWMAFilter(CapacityFilter):
+    """Exponentially weighted moving average. The weight of a read-out
+    halves every half_life seconds.
+    """
+    def __init__(self, n_edges, half_life=2.0):
+        self.half_life = half_life
+        super(EWMAFilter, self).__init__(n_edges)
+
+    def reset(self):
+        self.average = np.zeros(self.n_edges)
+        self.last_time = np.full(self.n_edges, np.nan)
+
+    def update(self, edge_ids, values, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        values = np.asarray(values, dtype=float)
+        elapsed = timestamp - self.last_time[edge_ids]
+        # Weight of the new read-out (1 for the first one)
+        alpha = np.where(np.isnan(elapsed), 1.0, 1 - 0.5**(np.maximum(elapsed, 0)/self.half_life))
+        average = self.average[edge_ids] + alpha*(values - self.average[edge_ids])
+        self.average[edge_ids] = average
+        self.last_time[edge_ids] = timestamp
+        return average
+
+
+class KalmanFilter(CapacityFilter):
+    """Kalman filter of a random walk observed with noise, for each edge.
+
+    Only the ratio q of the process to the measurement noise variance
+    matters: the bigger, the more responsive (and noisier) the output.
+    Variances are kept relative to the measurement variance.
+    """
+    def __init__(self, n_edges, q=0.1):
+        self.q = q
+        super(KalmanFilter, self).__init__(n_edges)
+
+    def reset(self):
+        self.estimate = np.zeros(self.n_edges)
+        # Estimate variance (inf: no read-out yet)
+        self.variance = np.full(self.n_edges, np.inf)
+
+    def update(self, edge_ids, values, timestamp=None):
+        values = np.asarray(values, dtype=float)
+        first = np.isinf(self.variance[edge_ids])
+        predicted = np.where(first, 0.0, self.variance[edge_ids] + self.q)
+        gain = np.where(first, 1.0, predicted/(predicted + 1))
+        estimate = self.estimate[edge_ids] + gain*(values - self.estimate[edge_ids])
+        self.estimate[edge_ids] = estimate
+        # The first read-out is taken as it is
+        self.variance[edge_ids] = np.where(first, 1.0, (1 - gain)*predicted)
+        return estimate
+
+
+FILTERS = {'none': CapacityFilter,
+           'doublereadout': DoubleReadoutFilter,
+           'median': MedianFilter,
+           'ewma': EWMAFilter,
+           'kalman': KalmanFilter}
+
+def createFilter(name, n_edges, **kwargs):
+    """Returns the filter called name (see FILTERS) for n_edges, with the
+    given parameters.
+    """
+    if name not in FILTERS:
+        raise ValueError("Unknown capacity filter: %s. Choose from: %s"%(name, ', '.join(sorted(FILTERS.keys()))))
+    return FILTERS[name](n_edges, **kwargs)
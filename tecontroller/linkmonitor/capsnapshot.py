@@ -0,0 +1,139 @@
+"""This module implements the immutable snapshots of the link capacities
+published by the links monitor thread.
+
+After each poll cycle, the monitor builds a new CapacitySnapshot and
+publishes it by swapping a single reference. Readers take the latest
+snapshot and keep using it as long as they want, without locks or
+copies: a snapshot never changes once published, and the monitor never
+waits for its readers.
+
+Snapshots keep the capacities, bandwidths and minimum capacities of the
+edges in read-only arrays, indexed by edge position. They can also be
+read like the (former) copies of the capacity graph:
+
+    snapshot[x][y]['capacity'], snapshot.get_edge_data(x, y),
+    snapshot.edges(data=True)
+
+where the edge data dicts are built on demand. snapshot.copy() returns
+a mutable networkx graph, for what-if computations.
+"""
+import networkx as nx
+import numpy as np
+import time
+
+def _readOnly(array):
+    array = np.array(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+class _SnapshotAdjacency(object):
+    """Read-only view of the successors of node x in a snapshot"""
+    def __init__(self, snapshot, x):
+        self.snapshot = snapshot
+        self.x = x
+
+    def __getitem__(self, y):
+        data = self.snapshot.get_edge_data(self.x, y)
+        if data is None:
+            raise KeyError(y)
+        return data
+
+    def __contains__(self, y):
+        return (self.x, y) in self.snapshot.edge_index
+
+    def get(self, y, default=None):
+        return self.snapshot.get_edge_data(self.x, y, default)
+
+
+class CapacitySnapshot(object):
+    """Available capacities of the edges at some point in time.
+
+    :param version: sequence number of the snapshot.
+
+    :param edges: list of edges (x, y), and edge_index {edge:
+    position}, shared by all snapshots of a monitor.
+    """
+    def __init__(self, version, timestamp, edges, edge_index, capacities, bandwidths, mincaps):
+        self.version = version
+        self.timestamp = timestamp
+        self.edges_list = edges
+        self.edge_index = edge_index
+        self.capacities = _readOnly(capacities)
+        self.bandwidths = _readOnly(bandwidths)
+        self.mincaps = _readOnly(mincaps)
+
+    def __repr__(self):
+        return "CapacitySnapshot(version=%d, %d edges)"%(self.version, len(self.edges_list))
+
+    def __len__(self):
+        return len(self.edges_list)
+
+    def withCapacities(self, positions, capacities, timestamp=None):
+        """Returns the next snapshot: a copy of this one, with the
+        capacities of the edges at positions replaced.
+        """
+        new_capacities = np.array(self.capacities)
+        new_capacities[positions] = capacities
+        return CapacitySnapshot(self.version + 1, timestamp or time.time(), self.edges_list,
+                                self.edge_index, new_capacities, self.bandwidths, self.mincaps)
+
+    def capacity(self, x, y):
+        return self.capacities[self.edge_index[(x, y)]]
+
+    def bandwidth(self, x, y):
+        return self.bandwidths[self.edge_index[(x, y)]]
+
+    def minCapacityEdge(self, path):
+        """Returns the tuple ((x, y), capacity) of the edge of path (list
+        of nodes) with minimum capacity, or None if none of its edges
+        is in the snapshot.
+        """
+        edge_index = self.edge_index
+        positions = [edge_index[edge] for edge in zip(path[:-1], path[1:]) if edge in edge_index]
+        if positions == []:
+            return None
+        capacities = self.capacities
+        i = min(positions, key=lambda i: capacities[i])
+        return (self.edges_list[i], float(capacities[i]))
+
+    def utilizations(self):
+        """Array of the fraction of bandwidth used in each edge"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.nan_to_num(1 - self.capacities/self.bandwidths)
+
+    def _edgeData(self, i):
+        return {'capacity': float(self.capacities[i]),
+                'bw': float(self.bandwidths[i]),
+                'mincap': float(self.mincaps[i])}
+
+    def get_edge_data(self, x, y, default=None):
+        i = self.edge_index.get((x, y))
+        if i is None:
+            return default
+        return self._edgeData(i)
+
+    def __getitem__(self, x):
+        return _SnapshotAdjacency(self, x)
+
+    def edges(self, data=False):
+        if not data:
+            return list(self.edges_list)
+        return [(x, y, self._edgeData(i)) for (i, (x, y)) in enumerate(self.edges_list)]
+
+    def copy(self):
+        """Returns a mutable nx.DiGraph with the edges and their data"""
+        graph = nx.DiGraph()
+        graph.add_edges_from(self.edges(data=True))
+        return graph
+
+
+def snapshotFromGraph(capacity_graph, version=0):
+    """Returns the snapshot of the edges of capacity_graph, with their
+    'capacity', 'bw' and 'mincap' attributes (0 if missing).
+    """
+    edges = sorted(capacity_graph.edges())
+    edge_index = {edge: i for (i, edge) in enumerate(edges)}
+    attribute = lambda name: [capacity_graph[x][y].get(name) or 0 for (x, y) in edges]
+    return CapacitySnapshot(version, time.time(), edges, edge_index, attribute('capacity'),
+                            attribute('bw'), attribute('mincap'))
@@ -0,0 +1,215 @@
+"""This module implements the incremental reading of the capture files
+written by tcpdump in each router (see MyCustomRouter), used by the
+feedbackThread to know which flows go through which routers.
+
+CaptureTail reads only what has been appended to a text capture (.cap)
+since the last read, and keeps a partially written last line until it
+is completed. The flows of the new lines are parsed at once with a
+precompiled regular expression, into (src, dst, dport) tuples of
+integers.
+
+PcapTail does the same with binary pcap captures (.pcap): the headers
+of the records are unpacked with struct, without formatting or parsing
+any text. Partially written records are kept until they are completed.
+
+FlowWindow keeps the flows seen in the last window seconds.
+"""
+import struct
+import re
+import os
+import time
+
+# 'HH:MM:SS.ffffff [iface dir ]IP a.b.c.d.sport > e.f.g.h.dport: ...'
+FLOW_RE = re.compile(r'IP (\d+)\.(\d+)\.(\d+)\.(\d+)\.\d+ > (\d+)\.(\d+)\.(\d+)\.(\d+)\.(\d+):')
+
+def parseFlows(data):
+    """Returns the list of flows (src, dst, dport) of the lines in data,
+    where addresses are integers. Lines that are not IPv4 packets with
+    ports are skipped.
+    """
+    flows = []
+    for (a, b, c, d, e, f, g, h, dport) in FLOW_RE.findall(data):
+        src = (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+        dst = (int(e) << 24) | (int(f) << 16) | (int(g) << 8) | int(h)
+        flows.append((src, dst, int(dport)))
+    return flows
+
+
+class CaptureTail(object):
+    """Reads the lines appended to the file at path since the last
+    read. The file is opened on the first read in which it exists, and
+    read again from the start if it is truncated.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.reset()
+
+    def reset(self):
+        """Forgets what has been read: the file is read from the start"""
+        self.offset = 0
+        # Last line (or record), not completed yet
+        self.partial = ''
+
+    def __repr__(self):
+        return "CaptureTail(%s, offset %d)"%(self.path, self.offset)
+
+    def readData(self):
+        """Returns the data appended to the file since the last read"""
+        if self.f is None:
+            try:
+                self.f = open(self.path, 'rb')
+            except IOError:
+                return ''
+        if os.fstat(self.f.fileno()).st_size < self.offset:
+            # Truncated: start over
+            self.f.seek(0)
+            self.reset()
+
+        data = self.f.read()
+        self.offset += len(data)
+        return data
+
+    def readLines(self):
+        """Returns a string with the new complete lines"""
+        data = self.readData()
+        data = self.partial + data
+        end = data.rfind('\n') + 1
+        self.partial = data[end:]
+        return data[:end]
+
+    def readFlows(self):
+        """Returns the flows of the new complete lines"""
+        return parseFlows(self.readLines())
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+
+# Byte order of pcap files by magic number (micro and nanosecond
+# timestamps), and sizes of the global and record headers
+PCAP_MAGIC = {'\xd4\xc3\xb2\xa1': '<', '\x4d\x3c\xb2\xa1': '<',
+              '\xa1\xb2\xc3\xd4': '>', '\xa1\xb2\x3c\x4d': '>'}
+PCAP_HEADER_SIZE = 24
+PCAP_RECORD_SIZE = 16
+
+# Link types: offset of the ethertype and of the network header in
+# the link-layer header. tcpdump -i any writes Linux cooked captures
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+LINK_HEADERS = {LINKTYPE_ETHERNET: (12, 14),
+                LINKTYPE_LINUX_SLL: (14, 16),
+                LINKTYPE_LINUX_SLL2: (0, 20)}
+
+ETHERTYPE_IP = 0x0800
+ETHERTYPE = struct.Struct('!H')
+# Version and IHL, flags and fragment offset, protocol, src and dst
+IP_HEADER = struct.Struct('!B5xH1xB2xII')
+PORT = struct.Struct('!H')
+# Protocols whose destination port goes after the source port
+PORT_PROTOCOLS = (6, 17)
+
+def parsePcapRecords(data, byteorder='<', linktype=LINKTYPE_LINUX_SLL):
+    """Returns the tuple (flows, consumed): the flows (src, dst, dport)
+    of the complete pcap records in data, and the number of bytes they
+    take. Packets that are not IPv4 TCP or UDP, non-first fragments
+    and packets captured too short are skipped.
+    """
+    (ethertype_offset, ip_offset) = LINK_HEADERS[linktype]
+    unpack_record = struct.Struct(byteorder + '8xI4x').unpack_from
+    unpack_ethertype = ETHERTYPE.unpack_from
+    unpack_ip = IP_HEADER.unpack_from
+    unpack_port = PORT.unpack_from
+
+    flows = []
+    offset = 0
+    size = len(data)
+    while offset + PCAP_RECORD_SIZE <= size:
+        (incl_len,) = unpack_record(data, offset)
+        packet = offset + PCAP_RECORD_SIZE
+        end = packet + incl_len
+        if end > size:
+            # Partially written record
+            break
+        offset = end
+
+        if incl_len < ip_offset + IP_HEADER.size or \
+           unpack_ethertype(data, packet + ethertype_offset)[0] != ETHERTYPE_IP:
+            continue
+        ip = packet + ip_offset
+        (version_ihl, fragment, protocol, src, dst) = unpack_ip(data, ip)
+        port = ip + (version_ihl & 0x0f)*4 + 2
+        if version_ihl >> 4 != 4 or protocol not in PORT_PROTOCOLS or \
+           fragment & 0x1fff or port + PORT.size > end:
+            continue
+        flows.append((src, dst, unpack_port(data, port)[0]))
+    return (flows, offset)
+
+
+class PcapTail(CaptureTail):
+    """Reads the flows of the pcap records appended to the file at path
+    since the last read.
+    """
+    def reset(self):
+        super(PcapTail, self).reset()
+        # Byte order and link type, from the global header
+        self.byteorder = None
+        self.linktype = None
+
+    def readFlows(self):
+        data = self.readData()
+        data = self.partial + data
+        if self.byteorder is None:
+            if len(data) < PCAP_HEADER_SIZE:
+                self.partial = data
+                return []
+            if data[:4] not in PCAP_MAGIC:
+                raise ValueError("%s is not a pcap file"%self.path)
+            self.byteorder = PCAP_MAGIC[data[:4]]
+            # The upper bits of the link type field may hold FCS info
+            linktype = struct.unpack_from(self.byteorder + 'I', data, 20)[0] & 0x0fffffff
+            if linktype not in LINK_HEADERS:
+                raise ValueError("%s: unsupported link type %d"%(self.path, linktype))
+            self.linktype = linktype
+            data = data[PCAP_HEADER_SIZE:]
+
+        (flows, consumed) = parsePcapRecords(data, self.byteorder, self.linktype)
+        self.partial = data[consumed:]
+        return flows
+
+
+class FlowWindow(object):
+    """Set of the flows seen in the last window seconds"""
+    def __init__(self, window):
+        self.window = window
+        # {flow: last time seen}
+        self.lastSeen = {}
+
+    def __len__(self):
+        return len(self.lastSeen)
+
+    def update(self, flows, now=None):
+        """Records that flows have been seen at time now, and expires the
+        ones not seen in the last window seconds.
+        """
+        if now is None:
+            now = time.time()
+        for flow in flows:
+            self.lastSeen[flow] = now
+        self.expire(now)
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        oldest = now - self.window
+        expired = [flow for (flow, seen) in self.lastSeen.iteritems() if seen < oldest]
+        for flow in expired:
+            del self.lastSeen[flow]
+
+    def flows(self):
+        return set(self.lastSeen.iterkeys())
+
+    def __contains__(self, flow):
+        return flow in self.lastSeen
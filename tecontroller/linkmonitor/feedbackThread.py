@@ -2,7 +2,7 @@ from fibbingnode.misc.mininetlib import get_logger
 from tecontroller.res.dbhandler import DatabaseHandler
 from tecontroller.res import defaultconf as dconf
 from tecontroller.res.flow import Flow
-import ipaddress
+from tecontroller.linkmonitor.captail import CaptureTail, PcapTail, FlowWindow
 import traceback
 import threading
 import time
@@ -22,12 +22,12 @@ class feedbackThread(threading.Thread):
         # Read network database
         self.db = DatabaseHandler()
 
-        # Fill router cap files
-        self.capFilesDict = self.pickCapFiles()
+        # Readers of the router cap files
+        self.capTails = self.pickCapFiles()
 
         # Data structure that maintains a set of current flows passing
-        # through each router in the last second
-        self.router_flowsets = {}
+        # through each router in the last FeedbackFlowWindow seconds
+        self.router_flowsets = {rid: FlowWindow(dconf.FeedbackFlowWindow) for rid in self.capTails.keys()}
         self.updateRouterFlowSets()
             
     def run(self):
@@ -53,26 +53,13 @@ class feedbackThread(threading.Thread):
                 
 
     def updateRouterFlowSets(self):
-        for rid, capfile in self.capFilesDict.iteritems():
-            lines = capfile.readlines()
-            # Create new empty set
-            ridSet = set()
-            for line in lines:
-                try:
-                    # Parse ip's 
-                    src_tmp = line.split(' ')[2]
-                    src_ip_tmp = src_tmp.split('.')[:4]
-                    src_ip = ipaddress.ip_address('.'.join(map(str, src_ip_tmp)))
-                    dst_tmp = line.split(' ')[4].strip(':')
-                    dst_ip_tmp = dst_tmp.split('.')[:4]
-                    dport = dst_tmp.split('.')[4]
-                    dst_ip = ipaddress.ip_address('.'.join(map(str, dst_ip_tmp)))
-                    ridSet.update({((src_ip, 's'), (dst_ip, 'd'), dport)})
-                except:
-                    pass
-                
-            # Add set into dictionary
-            self.router_flowsets[rid] = ridSet
+        """Adds the flows captured in each router since the last update to
+        its flow set, and expires the old ones. Flows are (src, dst,
+        dport) tuples of integers.
+        """
+        now = time.time()
+        for rid, capTail in self.capTails.iteritems():
+            self.router_flowsets[rid].update(capTail.readFlows(), now)
 
     def dealWithRequest(self, requestFlowsDict):
         """
@@ -87,13 +74,11 @@ class feedbackThread(threading.Thread):
             # We can't fix the source port from iperf client, so it
             # will never match. This implies that same host can't same
             # two UDP flows to the same destination host.
-            flowSet = set()
-            flowSet.update({((f.src.ip, 's'), (f.dst.ip, 'd'), str(f.dport))})
+            flowKey = (int(f.src.ip), int(f.dst.ip), int(f.dport))
             
             # Set of routers containing flow
             routers_containing_flow = {self.db.getIpFromHostName(rid) for rid, rset in
-                                       self.router_flowsets.iteritems() if
-                                       rset.intersection(flowSet) != set()}
+                                       self.router_flowsets.iteritems() if flowKey in rset}
 
             #log.info("*** SEARCHING:\n")
             #log.info("     - %s\n"%f)
@@ -119,8 +104,11 @@ class feedbackThread(threading.Thread):
     
     def pickCapFiles(self):
         """
-        Returns a dictionary indexed by router id -> corresponding .cap file
+        Returns a dictionary indexed by router id -> reader of the
+        corresponding capture file (.pcap or .cap, see dconf.CAP_Format)
         """
-        return {rid: open(dconf.CAP_Path+rid+'.cap', 'r') for rid in self.db.routers_to_ip.keys()}
+        if dconf.CAP_Format == 'pcap':
+            return {rid: PcapTail(dconf.CAP_Path+rid+'.pcap') for rid in self.db.routers_to_ip.keys()}
+        return {rid: CaptureTail(dconf.CAP_Path+rid+'.cap') for rid in self.db.routers_to_ip.keys()}
         
             
@@ -11,6 +11,7 @@ from fibbingnode.misc.mininetlib import get_logger
 from tecontroller.res.snmplib import SnmpCounters
 from tecontroller.res.dbhandler import DatabaseHandler
 from tecontroller.res import defaultconf as dconf
+from tecontroller.linkmonitor.pollscheduler import PollScheduler, monotonicTime
 
 import time
 import numpy as np
@@ -31,6 +32,7 @@ class LinksMonitor(object):
         self.interval = interval
         log.info("Start all counters...\n")
         self.counters = self._startCounters()
+        self.scheduler = PollScheduler(self.interval, self.counters.keys())
         self.logfile = logfile
         log.info("%s\n"%self.printLinksToEdges())
 
@@ -109,10 +111,6 @@ class LinksMonitor(object):
             # Log new values to logfile
             #log.info("Logging...\n")
             self.log()
-            
-            # Go to sleep for some interval time
-            #log.info("Going to sleep...\n")
-            time.sleep(self.interval/2)
 
     def _startCounters(self):
         start = time.time()
@@ -123,17 +121,19 @@ class LinksMonitor(object):
         return counters_dict
 
     def _updateCounters(self):
-        """Reads all counters of the routers in the network. Blocks until the
-        counters have been updated.
+        """Reads all counters of the routers in the network. Sleeps until
+        they are due, and blocks until they have been updated.
         """
         start = time.time()
-        for r, data in self.counters.iteritems():
-            counter = data['counter']
-            while (counter.fromLastLecture() < self.interval):
-                pass
-            counter.updateCounters32()
+        pending = set(self.counters.keys())
+        while pending:
+            for r in self.scheduler.wait():
+                poll_time = monotonicTime()
+                self.counters[r]['counter'].updateCounters32()
+                self.scheduler.polled(r, poll_time)
+                pending.discard(r)
         if time_info:
-            log.info("linksmonitor.py: _updateCounters() took %d seconds\n"%(time.time()-start))
+            log.info("linksmonitor.py: _updateCounters() took %d seconds (%s)\n"%(time.time()-start, str(self.scheduler)))
 
     def _setLinkLoad(self, iface_name, load):
         name = [name for name, data in self.links.iteritems() if
@@ -1,8 +1,15 @@
 from fibbingnode.misc.mininetlib import get_logger
-from tecontroller.res.snmplib import SnmpCounters
+from tecontroller.res.snmplib import SnmpCounters, SnmpSessionCounters
 from tecontroller.res.dbhandler import DatabaseHandler
 from tecontroller.res import defaultconf as dconf
+from tecontroller.linkmonitor.pollscheduler import PollScheduler, AdaptivePollPolicy, monotonicTime
+from tecontroller.linkmonitor.loadstore import LinkLoadStore
+from tecontroller.linkmonitor import capfilters
+from tecontroller.linkmonitor.loadlog import LoadLogWriter
+from tecontroller.linkmonitor.telemetry import PushCounters, TelemetryCollector
+from tecontroller.linkmonitor.capsnapshot import snapshotFromGraph
 
+from multiprocessing.pool import ThreadPool
 import threading
 import time
 import numpy as np
@@ -14,13 +21,39 @@ class LinksMonitorThread(threading.Thread):
     algorithm in order to periodically update the available capacities
     for the network links.
 
-    It is passed a capacity graph and a lock from its parent, and it
-    modifies it periodically.
+    It is passed a capacity graph and a lock from its parent, from which
+    it reads the edges and their bandwidths. The available capacities
+    are published after each poll cycle as a new immutable
+    CapacitySnapshot (see capsnapshot.py) in self.snapshot: readers
+    take the latest one without locking or copying the graph.
+
+    The counters of all routers are read concurrently at each poll
+    cycle, by a pool of n_pollers threads (one per router by default).
+    The thread sleeps until the next routers are due, as given by a
+    PollScheduler. If adaptive is True, routers whose links are close
+    to hot_utilization or change fast are polled more often than idle
+    ones (see AdaptivePollPolicy).
+
+    Capacity read-outs are smoothed by the filter called
+    capacity_filter (see capfilters.py) before being published.
+    median_filter=True is the same as
+    capacity_filter='median'.
+
+    Link loads are logged in logfile, in binary or text format (see
+    loadlog.py).
+
+    If push is True, routers are not polled: they push their counters
+    (see telemetry.py), and the capacities of the links of each router
+    are updated as its reports arrive. Loads are then logged every
+    interval seconds.
     """
-    def __init__(self, capacity_graph, lock, logfile, median_filter=False, interval=1.01):
+    def __init__(self, capacity_graph, lock, logfile, median_filter=False, interval=1.01, n_pollers=None,
+                 capacity_filter=dconf.LM_CapacityFilter, filter_args=dconf.LM_CapacityFilterArgs,
+                 logformat=dconf.LinksMonitor_LogFormat, adaptive=dconf.LM_AdaptivePolling,
+                 hot_utilization=dconf.LM_HotUtilization, push=dconf.LM_PushTelemetry, db=None):
         super(LinksMonitorThread, self).__init__()
-        # Read network database
-        self.db = DatabaseHandler()
+        # Read network database (unless given)
+        self.db = db or DatabaseHandler()
 
         # Lock object to access capacity graph
         self.lock = lock
@@ -36,26 +69,117 @@ class LinksMonitorThread(threading.Thread):
         self.ip_to_control = {}
         
         # Start router counters
+        self.push = push
         self.counters = self._startCounters()
 
-        # Perform median filter or not?
-        self.median_filter = median_filter
-        
+        # Receives the counters pushed by the routers
+        if self.push:
+            self.telemetry = TelemetryCollector(self.counters, dconf.LM_TelemetryPort)
+        else:
+            self.telemetry = None
+
+        # Pool of threads that read the router counters concurrently
+        if not n_pollers:
+            n_pollers = max(1, len(self.counters))
+        self.pollers = ThreadPool(n_pollers)
+
+        # Duration of the last poll cycle, and time spread between the
+        # read-outs of the different routers in it
+        self.pollCycleDuration = 0
+        self.pollCycleSpread = 0
+
+        # Decides when each router is polled. The jitter of the poll
+        # times is logged every jitterLogPeriod cycles
+        self.scheduler = PollScheduler(self.interval, self.counters.keys())
+        self.jitterLogPeriod = 60
+        self.n_cycles = 0
+
+        # Computes the poll interval of each router from the load of
+        # its links, if polling is adaptive
+        if adaptive and not self.push:
+            self.pollPolicy = AdaptivePollPolicy(dconf.LM_MinPollInterval, dconf.LM_MaxPollInterval,
+                                                 dconf.LM_PollBudget, hot_utilization, dconf.LM_HotChange)
+        else:
+            self.pollPolicy = None
+
+        # Filter applied to the capacity read-outs
+        if median_filter == True:
+            (capacity_filter, filter_args) = ('median', {})
+        self.capacity_filter_name = capacity_filter
+        self.filter_args = filter_args
+
         # Start router-to-router links
         self.links = self._startLinks()
 
+        # Links are indexed by edge id: bandwidths and last available
+        # capacity read-outs are kept in arrays aligned to them
+        self.edges = sorted(self.links.keys())
+        self.edge_index = {edge: i for (i, edge) in enumerate(self.edges)}
+        self.bandwidths = np.asarray([self.links[edge]['bw'] for edge in self.edges], dtype=float)
+        self.capacities = self.bandwidths.copy()
+        # Change of utilization per second between the last two
+        # read-outs of each link
+        self.utilizationChange = np.zeros(len(self.edges))
+        self.capacity_filter = capfilters.createFilter(self.capacity_filter_name, len(self.edges),
+                                                       **self.filter_args)
+
+        # Latest published capacity snapshot, and positions of the
+        # monitored links in it
+        with self.lock:
+            self.snapshot = snapshotFromGraph(self.cg)
+        self.snapshot_positions = np.asarray([self.snapshot.edge_index[edge] for edge in self.edges], dtype=int)
+
+        # Binding between the counter interfaces of each router and
+        # the edge ids of their links
+        self.router_edges = self._createRouterEdgeBindings()
+
+        # History of the link utilizations (fraction of bandwidth
+        # used), one sample per poll cycle
+        self.loadStore = LinkLoadStore(self.edges, dconf.LM_HistorySamples)
+
         # Used internally for the logs
         self.link_to_edge_bindings = self._createLinkToEdgeBindings()
+        self.log_positions = np.asarray([self.snapshot.edge_index[self.link_to_edge_bindings[index]] for
+                                         index in sorted(self.link_to_edge_bindings.keys())], dtype=int)
 
         # Set log file
+        self.logWriter = None
         if logfile:
             self.logfile = logfile
-            # Write first line with links
-            with open(self.logfile, 'w') as f:
-                f.write(self.printLinkToEdgesLine(self.cg))
+            if logformat == 'binary':
+                (links, edges) = self.getLinkToEdgeNames()
+                self.logWriter = LoadLogWriter(self.logfile, links, edges)
+            else:
+                # Write first line with links
+                with open(self.logfile, 'w') as f:
+                    f.write(self.printLinkToEdgesLine(self.cg))
         else:
             self.logfile = None
 
+    def _createRouterEdgeBindings(self):
+        """Returns a dict: router -> (positions, edge_ids), where positions
+        are the positions in the counters of the router of the
+        interfaces of router-to-router links, and edge_ids are the ids
+        of those links.
+        """
+        self.iface_to_edge = {data['interface']: self.edge_index[edge] for
+                              edge, data in self.links.iteritems()}
+        bindings = {}
+        for router, counter in self.counters.iteritems():
+            bindings[router] = self._routerEdgeBinding(counter)
+        return bindings
+
+    def _routerEdgeBinding(self, counter):
+        """Returns the tuple (positions, edge_ids) of the interfaces of
+        counter"""
+        positions = []
+        edge_ids = []
+        for i, data in enumerate(counter.interfaces):
+            if data['name'] in self.iface_to_edge:
+                positions.append(i)
+                edge_ids.append(self.iface_to_edge[data['name']])
+        return (np.asarray(positions, dtype=int), np.asarray(edge_ids, dtype=int))
+
     def _createLinkToEdgeBindings(self):
         bindings = {}
         taken = []
@@ -70,194 +194,217 @@ class LinksMonitorThread(threading.Thread):
         return bindings
             
     def run(self):
+        if self.telemetry:
+            self.runPushed()
+            return
+
         while True:
-            start_time = time.time()
-            
+            # Sleep until some routers are due
+            routers = self.scheduler.wait()
+
             # Read capacities from SNMP
-            self.updateLinksCapacities()
+            if self.updateLinksCapacities(routers):
+                self.recordLoads()
+
+            # Poll routers with busy links more often
+            if self.pollPolicy:
+                self.adaptPollingRates()
 
             # Log them in the log file too
             if self.logfile:
                 self.logLinksLoads()
-            #log.info("It took %.3f to update and log the new capacities readout\n"%(time.time()-start_time))
-            
-            # Go to sleep remaining time to interval
-            elapsed_time = (time.time() - start_time)
-            if elapsed_time < self.interval:
-                sleep_time = self.interval - elapsed_time
-                time.sleep(sleep_time)
-            else:
-                pass
+
+            self.n_cycles += 1
+            if self.n_cycles % self.jitterLogPeriod == 0:
+                log.info("Links monitor: %s, %.2f polls/s\n"%(str(self.scheduler), self.scheduler.pollRate()))
             
-    def updateLinksCapacities(self):
+    def runPushed(self):
+        """Updates the capacities of the links of each router as its
+        counters are pushed. Loads are recorded once per telemetry
+        period, not once per report.
         """
+        last_logged = 0
+        last_recorded = 0
+        pending = False
+        for router in self.telemetry.reports():
+            if self.updateLinksCapacities([router], poll=False):
+                pending = True
+
+            if pending and time.time() - last_recorded >= dconf.LM_TelemetryInterval:
+                self.recordLoads()
+                last_recorded = time.time()
+                pending = False
+
+            if self.logfile and time.time() - last_logged >= self.interval:
+                self.logLinksLoads()
+                last_logged = time.time()
+
+    def updateLinksCapacities(self, routers=None, poll=True):
+        """Polls the counters of routers (all by default) and updates the
+        capacities of their links. If poll is False, the counters are
+        taken as they are. Returns True if some capacity was updated.
         """
+        if routers is None:
+            routers = self.counters.keys()
+
         # Update counters first
-        self._updateCounters()
-        
-        # List in which we hold the already updated interfaces
-        interfaces_updated = []
-        
-        for router, counter in self.counters.iteritems():
-            
-            # Get router interfaces names
-            iface_names = [data['name'] for data in counter.interfaces]
-              
-            # Get current loads for router interfaces 
-            # (difference from last read-out)
-            loads = counter.getLoads()
+        if poll:
+            self._updateCounters(routers)
+
+        # Edge ids and available capacities of the updated links
+        updated_ids = []
+        updated_caps = []
+        for router in routers:
+            counter = self.counters[router]
+            if counter.interfacesChanged:
+                # Interfaces discovered late (first report, or first
+                # successful poll), or changed
+                self.router_edges[router] = self._routerEdgeBinding(counter)
+                counter.interfacesChanged = False
+            (positions, edge_ids) = self.router_edges[router]
 
             # Get the time that has elapsed since last read-out
             elapsed_time = counter.timeDiff
-            currentThroughputs = loads/float(elapsed_time)
-              
-            # Retrieve the bandwidths for router-connected links
-            bandwidths = []
-
-            for ifacename in iface_names:
-                # Get bandwidth for link in that interface
-                bw_tmp = [edge_data['bw'] for edge, edge_data in
-                          self.links.iteritems() if
-                          edge_data['interface'] == ifacename]
-
-                if bw_tmp != []:
-                    bandwidths.append(bw_tmp[0])
-                else:
-                    bandwidths.append(0)
+            if elapsed_time <= 0 or len(edge_ids) == 0:
+                continue
 
-            # Convert as a numpy array
-            bandwidths = np.asarray(bandwidths)
+            # Current throughputs of router-to-router interfaces
+            # (difference from last read-out)
+            loads = np.asarray(counter.getLoads(), dtype=float)
+            if len(loads) <= positions.max():
+                # Incomplete read-out
+                continue
+            currentThroughputs = loads[positions]/float(elapsed_time)
+
+            # How fast utilization changes
+            bandwidths = self.bandwidths[edge_ids]
+            previous = 1 - self.capacities[edge_ids]/bandwidths
+            current = currentThroughputs/bandwidths
+            self.utilizationChange[edge_ids] = np.abs(current - previous)/float(elapsed_time)
 
             # Calculate available capacities
-            availableCaps = bandwidths - currentThroughputs
-
-            # Set link available capacities by interface name
-            # Get lock first
-            for i, iface_name in enumerate(iface_names):
-                if iface_name not in interfaces_updated:
-                    iface_availableCap = availableCaps[i]
-
-                    # Get interface of other side of the link
-                    edge = [edge for edge, data in self.links.iteritems() if data['interface'] == iface_name]
-                    if edge == []:
-                        # Means is not a router-to-router link
-                        pass
-                    else:
-                        (x,y) = edge[0]
-                        #iface_opposed_name = self.links[(y,x)]['interface']
-                        self.updateLinkCapacity(iface_name, iface_availableCap)
-                        #self.updateLinkCapacity(iface_opposed_name, iface_availableCap)
-                        interfaces_updated.append(iface_name)
-                        #interfaces_updated.append(iface_opposed_name)
-                    
+            updated_ids.append(edge_ids)
+            updated_caps.append(bandwidths - currentThroughputs)
+
+        if updated_ids:
+            self.updateCapacities(np.concatenate(updated_ids), np.concatenate(updated_caps))
+        return bool(updated_ids)
+
+    def recordLoads(self):
+        """Appends the current utilizations to the load history"""
+        self.loadStore.append(1 - self.capacities/self.bandwidths)
+
+    def adaptPollingRates(self):
+        """Sets the poll interval of each router from the maximum
+        utilization of its links, and how fast it changes.
+        """
+        utilizations = 1 - self.capacities/self.bandwidths
+        routers = self.counters.keys()
+        router_utilizations = []
+        router_changes = []
+        for router in routers:
+            edge_ids = self.router_edges[router][1]
+            if len(edge_ids):
+                router_utilizations.append(utilizations[edge_ids].max())
+                router_changes.append(self.utilizationChange[edge_ids].max())
+            else:
+                router_utilizations.append(0)
+                router_changes.append(0)
+
+        intervals = self.pollPolicy.intervals(router_utilizations, router_changes)
+        for (router, interval) in zip(routers, intervals):
+            self.scheduler.setInterval(router, interval)
+
     def logLinksLoads(self):
-        # Make a copy of the self.cg and release the lock
-        with self.lock:
-            cg_copy = self.cg.copy()
-            
+        # Loads of the latest snapshot
+        snapshot = self.snapshot
+        timestamp = time.time()
+        loads = snapshot.utilizations()[self.log_positions]*100.0
+        to_iterate = sorted(self.link_to_edge_bindings.keys())
+
+        if self.logWriter:
+            self.logWriter.write(timestamp, loads)
+            return
+
         with open(self.logfile, 'a') as f:
-            s = "%s"%time.time()
-            to_iterate = sorted(self.link_to_edge_bindings.keys())
-            for index in to_iterate:
-                (x,y) = self.link_to_edge_bindings[index]
-                link_index = index
-                availableCapactiy = cg_copy[x][y]['capacity']
-                bandwidth = cg_copy[x][y]['bw']
-                usedCapacity = bandwidth - availableCapactiy
-                load = (usedCapacity/float(bandwidth))*100.0
-                s += ",(L%d %.3f%%)"%(link_index, load)
+            s = "%s"%timestamp
+            for (index, load) in zip(to_iterate, loads):
+                s += ",(L%d %.3f%%)"%(index, load)
             s += '\n'
             f.write(s)
            
-    def _updateCounters(self):
-        """Updates all interface counters of the routers in the network.
-        Blocks until the counters have been updated.
+    def _updateCounters(self, routers):
+        """Updates the interface counters of routers, polling them
+        concurrently. Blocks until the counters have been updated.
+
+        Each counter keeps the time of its own read-out, so the rates
+        of each router are computed over its own elapsed time.
         """
-        for r, counter in self.counters.iteritems():
-            #start_time = time.time()
-            while (counter.fromLastLecture() < self.interval):
-                pass
-            #log.info("I was stuck %.3f seconds waiting for interval to pass\n"%(time.time()-start_time))
-            counter.updateCounters32()
-
-    def updateLinkCapacity(self, iface_name, new_capacity):
-        # Get nodes from the link with such iface_name
-        edge = [edge for edge, data in self.links.iteritems() if
-                data['interface'] == iface_name]
-        if edge != []:
-            (x, y) = edge[0]
-        else:
-            return
-        
-        with self.lock:
-            if self.median_filter == True:
-                # Perform median filter of window size = 3
-                window = self.cg[x][y]['window']
-                cap = self.cg[x][y]['capacity']
-                
-                if len(window) == 3: #median filter window size = 3
-                    # Remove last element
-                    window.pop()
-
-                # Add new capacity readout to filter window
-                window = [new_capacity] + window
-
-                # Perform the median filtering
-                # Sort them by magnitude
-                window_ordered = window[:]
-                window_ordered.sort()
-
-                # Take the median element
-                chosen_cap = window_ordered[len(window_ordered)/2] 
-
-                # Update edge data
-                self.cg[x][y]['window'] = window
-                self.cg[x][y]['capacity'] = chosen_cap
-        
-            else:
-                window = self.cg[x][y]['window']
-
-                if len(window) == 3:
-                    window.pop()
-                    # Rate of new capacity wrt previous one
-                    rate = new_capacity/float(window[0])
-                    if rate < 2.05 and rate > 1.95:
-                        # Double read-out found
-                        new_capacity = window[0]
-            
-                        window = [new_capacity] + window
-                
-                        # No median filter but we store also the last 3
-                        # capacities in the window
-                        self.cg[x][y]['window'] = window
-                        self.cg[x][y]['capacity'] = new_capacity
-                    else:
-                        window = [new_capacity] + window
-                        self.cg[x][y]['window'] = window
-                        self.cg[x][y]['capacity'] = new_capacity
-                else:
-                    window = [new_capacity] + window
-                    self.cg[x][y]['window'] = window
-                    self.cg[x][y]['capacity'] = new_capacity
+        start_time = time.time()
+        self.pollers.map(self._updateRouterCounters, routers)
+        self.pollCycleDuration = time.time() - start_time
+
+        read_times = [self.counters[r].lastUpdated for r in routers]
+        if read_times:
+            self.pollCycleSpread = max(read_times) - min(read_times)
+
+        if self.pollCycleDuration > self.interval:
+            to_log = "Poll cycle took %.3f seconds (read-outs spread over %.3f seconds)\n"
+            log.info(to_log%(self.pollCycleDuration, self.pollCycleSpread))
+
+    def _updateRouterCounters(self, router):
+        """Updates the counters of router, and schedules its next
+        poll. Called from the poller threads.
+        """
+        poll_time = monotonicTime()
+        self.counters[router].updateCounters()
+        self.scheduler.polled(router, poll_time)
+
+    def updateCapacities(self, edge_ids, new_capacities):
+        """Filters the new available capacities of the links with edge_ids
+        and publishes them in a new snapshot.
+        """
+        self.capacities[edge_ids] = new_capacities
+        filtered = self.capacity_filter.update(edge_ids, new_capacities, time.time())
+        # Readers holding the previous snapshot keep it unchanged
+        self.snapshot = self.snapshot.withCapacities(self.snapshot_positions[edge_ids], filtered)
+
+    def getLinkToEdgeNames(self):
+        """Returns the tuple (links, edges) of link names and their edges
+        (with router names), as logged.
+        """
+        links = []
+        edges = []
+        for index in sorted(self.link_to_edge_bindings.keys()):
+            (x,y) = self.link_to_edge_bindings[index]
+            links.append("L%d"%index)
+            edges.append((self.db.getNameFromIP(x), self.db.getNameFromIP(y)))
+        return (links, edges)
 
     def printLinkToEdgesLine(self, capacity_graph):
         s = ""
-        to_iterate = sorted(self.link_to_edge_bindings.keys())
-        for index in to_iterate:
-            (x,y) = self.link_to_edge_bindings[index]
-            link_number = index
-            x_name = self.db.getNameFromIP(x)
-            y_name = self.db.getNameFromIP(y)
-            s += ("L%d"%link_number)+'->(%s %s),'%(x_name, y_name)
+        (links, edges) = self.getLinkToEdgeNames()
+        for (link, (x_name, y_name)) in zip(links, edges):
+            s += link+'->(%s %s),'%(x_name, y_name)
         s += '\n'
         return s
             
     def _startCounters(self):
         """This function iterates the routers in the network and creates
-        a dictionary mapping each router to a SnmpCounter object.
+        a dictionary mapping each router to a SnmpCounter object (or
+        PushCounters, if routers push their counters).
         
         Returns a dict: routerip -> SnmpCounters.
         """
+        if self.push:
+            with self.lock:
+                return {r: PushCounters(routerIp = r) for r in self.cg.routers}
+
+        if dconf.SNMP_InProcess:
+            counter_class = SnmpSessionCounters
+        else:
+            counter_class = SnmpCounters
+
         counters_dict = {}
         with self.lock:
             for r in self.cg.routers:
@@ -265,9 +412,9 @@ class LinksMonitorThread(threading.Thread):
                 r_control_ip = self.db.getRouterControlIp(r)
                 self.ip_to_control[r] = r_control_ip
                 if r_control_ip:
-                    counters_dict[r] = SnmpCounters(routerIp = r_control_ip)
+                    counters_dict[r] = counter_class(routerIp = r_control_ip)
                 else:
-                    counters_dict[r] = SnmpCounters(routerIp = r)
+                    counters_dict[r] = counter_class(routerIp = r)
         return counters_dict
     
     def _startLinks(self):
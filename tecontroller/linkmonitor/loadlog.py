@@ -0,0 +1,184 @@
+"""This module implements the binary log of link loads written by the
+links monitor, and the readers of both the binary and the (former)
+text logs.
+
+Binary log format (little endian):
+
+ * Header: the magic string 'TELLOG1\\0', the number of links and the
+   length of a JSON list of [link, x, y] (link names and their edges),
+   followed by the JSON list itself, padded with spaces to a multiple
+   of 8 bytes.
+
+ * Records, one per sample: the timestamp (float64) followed by the
+   load of each link in % (float32).
+
+Records have a fixed width, so the log can be memory-mapped as a NumPy
+structured array. The writer is append-only and buffers the records,
+flushing them periodically.
+
+Text log format: first line 'L0->(r1 r2),L1->(r1 r3),...', then one
+line per sample '1460996208.39,(L0 0.000%),(L1 0.000%),...'.
+
+Usage: python loadlog.py convert <text log> <binary log>
+       python loadlog.py info <log>
+"""
+import numpy as np
+import struct
+import atexit
+import json
+import time
+import sys
+
+MAGIC = 'TELLOG1\0'
+HEADER = struct.Struct('<8sII')
+
+def recordType(n_links):
+    return np.dtype([('time', '<f8'), ('loads', '<f4', (n_links,))])
+
+def _header(links, edges):
+    names = json.dumps([[link, x, y] for (link, (x, y)) in zip(links, edges)])
+    names += ' '*((-(HEADER.size + len(names))) % 8)
+    return HEADER.pack(MAGIC, len(links), len(names)) + names
+
+
+class LoadLogWriter(object):
+    """Appends link load records to a binary log. Records are written
+    to disk when buffer_records have been buffered, or flush_interval
+    seconds after the last flush.
+    """
+    def __init__(self, path, links, edges, buffer_records=64, flush_interval=5.0):
+        self.path = path
+        self.links = list(links)
+        self.edges = list(edges)
+        self.flush_interval = flush_interval
+
+        self.buffer = np.zeros(buffer_records, dtype=recordType(len(self.links)))
+        self.n_buffered = 0
+        self.last_flush = time.time()
+
+        self.f = open(path, 'wb')
+        self.f.write(_header(self.links, self.edges))
+        self.f.flush()
+        atexit.register(self.close)
+
+    def write(self, timestamp, loads):
+        """Appends the loads (%) of all links at timestamp"""
+        record = self.buffer[self.n_buffered]
+        record['time'] = timestamp
+        record['loads'] = loads
+        self.n_buffered += 1
+        if self.n_buffered == len(self.buffer) or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.f.closed:
+            return
+        if self.n_buffered:
+            self.f.write(self.buffer[:self.n_buffered].tostring())
+            self.n_buffered = 0
+        self.f.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+class LoadLog(object):
+    """Memory-mapped binary log. times and loads are views of the file:
+    times is an array of n_samples and loads a (n_samples x n_links)
+    array.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            (magic, n_links, names_length) = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("%s is not a binary links log"%path)
+            names = json.loads(f.read(names_length))
+        self.links = [str(link) for (link, x, y) in names]
+        self.edges = [(str(x), str(y)) for (link, x, y) in names]
+
+        offset = HEADER.size + names_length
+        dtype = recordType(n_links)
+        # A partially written last record is left out
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            n_records = (f.tell() - offset)/dtype.itemsize
+        if n_records > 0:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n_records,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.times = self.records['time']
+        self.loads = self.records['loads']
+
+    def __len__(self):
+        return len(self.records)
+
+    def linkLoads(self, link):
+        """Returns the view of the loads of link (name)"""
+        return self.loads[:, self.links.index(link)]
+
+
+def isBinaryLog(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def readTextLog(path):
+    """Returns the tuple (links, edges, times, loads) of a text log,
+    where loads is a (samples x links) array.
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    links = []
+    edges = []
+    for binding in lines[0].strip(',').split(','):
+        (link, edge) = binding.split('->')
+        links.append(link)
+        edges.append(tuple(edge.strip('()').split(' ')))
+
+    times = []
+    loads = []
+    for line in lines[1:]:
+        fields = line.split(',')
+        values = dict([field.strip('()%').split(' ') for field in fields[1:]])
+        if len(values) != len(links):
+            # Partially written line
+            continue
+        times.append(float(fields[0]))
+        loads.append([float(values[link]) for link in links])
+    return (links, edges, np.asarray(times), np.asarray(loads).reshape((len(times), len(links))))
+
+def readLinksLog(path):
+    """Returns the tuple (links, edges, times, loads) of a binary or text
+    log. Arrays of binary logs are memory-mapped.
+    """
+    if isBinaryLog(path):
+        log = LoadLog(path)
+        return (log.links, log.edges, log.times, log.loads)
+    return readTextLog(path)
+
+def convertTextLog(text_path, binary_path):
+    """Converts a text log into a binary one. Returns the number of
+    samples converted.
+    """
+    (links, edges, times, loads) = readTextLog(text_path)
+    writer = LoadLogWriter(binary_path, links, edges, buffer_records=max(1, len(times)))
+    for (timestamp, sample) in zip(times, loads):
+        writer.write(timestamp, sample)
+    writer.close()
+    return len(times)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'convert':
+        n = convertTextLog(sys.argv[2], sys.argv[3])
+        print("Converted %d samples into %s"%(n, sys.argv[3]))
+    elif len(sys.argv) == 3 and sys.argv[1] == 'info':
+        (links, edges, times, loads) = readLinksLog(sys.argv[2])
+        print("%d links, %d samples"%(len(links), len(times)))
+        for (link, edge) in zip(links, edges):
+            print("%s -> (%s %s)"%(link, edge[0], edge[1]))
+    else:
+        print(__doc__)
@@ -0,0 +1,125 @@
+"""This module implements the in-memory history of the link
+utilizations read by the links monitor.
+
+Samples are kept in a circular buffer (edges x samples) of NumPy
+arrays with size = n_samples + spare slots. Each sample is written
+twice, at positions i and i + size of a buffer of twice that size, so
+that the last samples are always contiguous: they can be returned as a
+view, without copying them nor taking any lock.
+
+A single thread (the links monitor) appends samples. Readers get views
+of at most n_samples samples. Appends write the slots that follow the
+last sample, so a view stays valid until spare more samples are
+appended: readers should copy it if they need to keep it longer.
+"""
+import numpy as np
+import time
+
+class LinkLoadStore(object):
+    """Circular buffer of the last n_samples utilizations of edges.
+
+    :param edges: list of edges. Row i of the buffer holds the samples
+                  of edges[i].
+
+    :param spare: number of appends during which the views returned
+                  stay valid (n_samples by default).
+    """
+    def __init__(self, edges, n_samples=600, spare=None):
+        self.edges = list(edges)
+        self.edge_index = {edge: i for (i, edge) in enumerate(self.edges)}
+        self.n_samples = n_samples
+        if spare is None:
+            spare = n_samples
+        self.spare = max(1, spare)
+        self.size = self.n_samples + self.spare
+
+        self.times = np.zeros(2*self.size)
+        self.values = np.zeros((len(self.edges), 2*self.size))
+
+        # Position after the last sample written in the second half,
+        # and number of valid samples. Updated after the samples are
+        # written, so readers never see half-written samples
+        self.end = self.size
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values, timestamp=None):
+        """Appends the sample values (one per edge) taken at timestamp (now
+        by default).
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        end = self.end
+        if end == 2*self.size:
+            end = self.size
+
+        # Position in the first half of the buffer
+        i = end - self.size
+        self.times[i] = self.times[end] = timestamp
+        self.values[:, i] = self.values[:, end] = values
+
+        self.end = end + 1
+        self.count = min(self.count + 1, self.n_samples)
+
+    def last(self, n=None):
+        """Returns the tuple (times, values) of views of the last n samples
+        (all by default), where values is an (edges x n) array.
+        """
+        # count is read first: it never exceeds the samples before end
+        count = self.count
+        end = self.end
+        if n is None or n > count:
+            n = count
+        return (self.times[end-n:end], self.values[:, end-n:end])
+
+    def window(self, seconds, now=None):
+        """Returns the tuple (times, values) of views of the samples of the
+        last seconds.
+        """
+        if now is None:
+            now = time.time()
+        (times, values) = self.last()
+        start = np.searchsorted(times, now - seconds)
+        return (times[start:], values[:, start:])
+
+    def edgeSeries(self, edge, n=None):
+        """Returns the tuple (times, values) of the last n samples of edge"""
+        (times, values) = self.last(n)
+        return (times, values[self.edge_index[edge]])
+
+    def _samples(self, n=None, seconds=None):
+        if seconds is not None:
+            return self.window(seconds)[1]
+        return self.last(n)[1]
+
+    def mean(self, n=None, seconds=None):
+        """Mean utilization of each edge over the last n samples or the
+        last seconds (all samples by default).
+        """
+        values = self._samples(n, seconds)
+        if values.shape[1] == 0:
+            return np.zeros(len(self.edges))
+        return values.mean(axis=1)
+
+    def max(self, n=None, seconds=None):
+        values = self._samples(n, seconds)
+        if values.shape[1] == 0:
+            return np.zeros(len(self.edges))
+        return values.max(axis=1)
+
+    def percentile(self, q, n=None, seconds=None):
+        """q-th percentile (0-100) of the utilization of each edge"""
+        values = self._samples(n, seconds)
+        if values.shape[1] == 0:
+            return np.zeros(len(self.edges))
+        return np.percentile(values, q, axis=1)
+
+    def summary(self, n=None, seconds=None):
+        """Returns a dict: edge -> {'mean', 'max', 'p95'}"""
+        values = self._samples(n, seconds)
+        if values.shape[1] == 0:
+            return {}
+        (mean, maximum, p95) = (values.mean(axis=1), values.max(axis=1), np.percentile(values, 95, axis=1))
+        return {edge: {'mean': mean[i], 'max': maximum[i], 'p95': p95[i]} for (i, edge) in enumerate(self.edges)}
@@ -2,6 +2,7 @@
 in the network.
 """
 from tecontroller.res import defaultconf as dconf
+from tecontroller.linkmonitor.loadlog import readLinksLog
 import numpy as np
 import matplotlib.pyplot as plt
 import time
@@ -31,36 +32,18 @@ def main(args):
     else:
         fromm = 8
         
-    # Open links logfile
-    f = open(dconf.LinksMonitor_LogFile, 'r') # LINKS LOGFILE
-    lines = f.readlines()
-    lines = [line.strip('\n').split(',') for line in lines]
-    edges_t = lines[0]
-    lines = lines[1:]
-
-    links = [a.split('->')[0] for a in edges_t if a]
-    edges = [a.split('->')[1] for a in edges_t if a]
+    # Read links logfile (binary or text)
+    (links, edges, seconds, all_loads) = readLinksLog(dconf.LinksMonitor_LogFile) # LINKS LOGFILE
+    edges = ["(%s %s)"%(x, y) for (x, y) in edges]
 
     if args.all ==True:
         edges_to_print = edges
         
 
     offset = 8
-    seconds = np.asarray([float(line[0]) for line in lines])
     seconds = seconds - seconds[0] - offset# make time relative to start
 
-
-    
-    data = [line[1:] for line in lines]
-
-    
-    loads = []
-    for line in data[fromm:until]:
-        values = []
-        for i, v in enumerate(line):
-            values.append(float(v.split(' ')[1].strip('%)')))
-        loads.append(values)
-    loads = np.asarray(loads)
+    loads = np.asarray(all_loads[fromm:until], dtype=float)
 
     print "It took %d seconds to read data"%(time.time()-start)
 
@@ -0,0 +1,231 @@
+"""This module implements the scheduler that decides when the links
+monitor polls the counters of each router.
+
+Each router is due at fixed points of a grid of period interval, on a
+monotonic clock (not affected by changes of the wall clock). The
+monitor sleeps until the next due time instead of spinning. If a poll
+overruns one or more due times, the missed ones are skipped instead of
+polling the router several times in a row to catch up.
+
+The scheduler also keeps track of the jitter: the deviation of the
+actual time between two polls of a router from its nominal interval.
+
+The interval of each router can be changed at any time. The
+AdaptivePollPolicy computes them from the load of the links of each
+router.
+"""
+import numpy as np
+from collections import deque
+import threading
+import ctypes
+import ctypes.util
+import time
+import os
+
+def _monotonicClock():
+    """Returns a function that reads CLOCK_MONOTONIC, in seconds"""
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    for name in ['rt', 'c']:
+        path = ctypes.util.find_library(name)
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        def monotonic():
+            t = timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(t)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return t.tv_sec + t.tv_nsec*1e-9
+        return monotonic
+
+    # Elapsed real time since an arbitrary point (coarser)
+    return lambda: os.times()[4]
+
+monotonicTime = _monotonicClock()
+
+
+class PollScheduler(object):
+    """Keeps the next due time of each key (router) to poll.
+
+    :param interval: nominal time between two polls of a key.
+
+    :param history: number of jitter samples kept.
+    """
+    def __init__(self, interval, keys=[], history=100, clock=monotonicTime):
+        self.interval = interval
+        self.clock = clock
+
+        # {key: interval}, {key: next due time} and {key: last poll time}
+        self.intervals = {}
+        self.due = {}
+        self.lastPolled = {}
+
+        # Deviations of the actual poll intervals from the nominal
+        # ones, and number of due times skipped because of overruns
+        self.deviations = deque(maxlen=history)
+        self.n_polls = 0
+        self.n_skipped = 0
+
+        # Keys may be polled from several threads
+        self.lock = threading.Lock()
+
+        for key in keys:
+            self.add(key)
+
+    def add(self, key, interval=None):
+        """Adds key to the schedule, due right now"""
+        with self.lock:
+            self.intervals[key] = interval or self.interval
+            self.due[key] = self.clock()
+
+    def setInterval(self, key, interval):
+        """Changes the interval of key. If it has been polled already, its
+        next due time is moved to one (new) interval after its previous
+        due time.
+        """
+        with self.lock:
+            if key not in self.due:
+                return
+            if key in self.lastPolled:
+                previous_due = self.due[key] - self.intervals[key]
+                self.due[key] = previous_due + interval
+            self.intervals[key] = interval
+
+    def pollRate(self):
+        """Number of polls per second with the current intervals"""
+        with self.lock:
+            return sum([1.0/interval for interval in self.intervals.itervalues()])
+
+    def remove(self, key):
+        with self.lock:
+            for d in [self.intervals, self.due, self.lastPolled]:
+                d.pop(key, None)
+
+    def nextDue(self):
+        """Returns the earliest due time (None if there are no keys)"""
+        with self.lock:
+            if not self.due:
+                return None
+            return min(self.due.itervalues())
+
+    def dueKeys(self, now=None):
+        """Returns the list of keys due at time now"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            return [key for (key, due) in self.due.iteritems() if due <= now]
+
+    def wait(self):
+        """Sleeps until some key is due, and returns the list of due
+        keys.
+        """
+        while True:
+            next_due = self.nextDue()
+            if next_due is None:
+                return []
+            remaining_time = next_due - self.clock()
+            if remaining_time > 0:
+                time.sleep(remaining_time)
+            keys = self.dueKeys()
+            if keys:
+                return keys
+
+    def polled(self, key, poll_time=None):
+        """Records that key was polled at poll_time (now by default), and
+        schedules its next poll.
+        """
+        if poll_time is None:
+            poll_time = self.clock()
+        with self.lock:
+            if key not in self.due:
+                return
+            interval = self.intervals[key]
+            last_time = self.lastPolled.get(key)
+            if last_time is not None:
+                self.deviations.append((poll_time - last_time) - interval)
+            self.lastPolled[key] = poll_time
+            self.n_polls += 1
+
+            # Next point of the grid, skipping the ones already missed
+            due = self.due[key] + interval
+            if due <= poll_time:
+                missed = int((poll_time - due)/interval) + 1
+                due += missed*interval
+                self.n_skipped += missed
+            self.due[key] = due
+
+    def jitter(self):
+        """Returns the tuple (mean, max) of the absolute deviations of the
+        last poll intervals from the nominal ones.
+        """
+        with self.lock:
+            deviations = [abs(d) for d in self.deviations]
+        if not deviations:
+            return (0.0, 0.0)
+        return (sum(deviations)/len(deviations), max(deviations))
+
+    def __str__(self):
+        (mean, maximum) = self.jitter()
+        to_str = "%d polls, jitter mean: %.1f ms, max: %.1f ms, %d due times skipped"
+        return to_str%(self.n_polls, mean*1000.0, maximum*1000.0, self.n_skipped)
+
+
+class AdaptivePollPolicy(object):
+    """Computes the poll interval of each router from the utilization of
+    its links and how fast it changes.
+
+    The urgency of a router goes from 0 (idle) to 1, when the maximum
+    utilization of its links reaches hot_utilization, or when it
+    changes hot_change (utilization per second) or faster. Intervals
+    go geometrically from max_interval (urgency 0) to min_interval
+    (urgency 1).
+
+    If the total poll rate goes above budget (polls per second), the
+    intervals of all routers are stretched by the same factor until it
+    fits, up to max_interval. If it doesn't fit even then, all routers
+    are polled at the rate allowed by the budget.
+    """
+    def __init__(self, min_interval, max_interval, budget=None, hot_utilization=0.8, hot_change=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.hot_utilization = hot_utilization
+        self.hot_change = hot_change
+
+    def urgencies(self, utilizations, changes):
+        """Urgency of each router, given the arrays of the maximum
+        utilization of their links and of its change per second.
+        """
+        urgency = np.maximum(np.asarray(utilizations, dtype=float)/self.hot_utilization,
+                             np.asarray(changes, dtype=float)/self.hot_change)
+        return np.clip(np.nan_to_num(urgency), 0, 1)
+
+    def intervals(self, utilizations, changes):
+        """Returns the array of poll intervals of the routers"""
+        urgency = self.urgencies(utilizations, changes)
+        intervals = self.max_interval*(self.min_interval/float(self.max_interval))**urgency
+        if self.budget is None or len(intervals) == 0:
+            return intervals
+
+        if (1.0/intervals).sum() <= self.budget:
+            return intervals
+        if len(intervals)/float(self.max_interval) > self.budget:
+            return np.full(len(intervals), len(intervals)/float(self.budget))
+
+        # Bisection of the stretch factor
+        (low, high) = (1.0, self.max_interval/float(self.min_interval))
+        for i in range(30):
+            factor = (low + high)/2
+            if (1.0/np.minimum(intervals*factor, self.max_interval)).sum() > self.budget:
+                low = factor
+            else:
+                high = factor
+        return np.minimum(intervals*high, self.max_interval)
@@ -0,0 +1,141 @@
+"""This module implements push-based telemetry of the interface
+counters of the routers: instead of being polled via SNMP, an agent
+running in each router (telemetry_agent.py) periodically sends its
+counters to the links monitor in a UDP datagram.
+
+Datagram format (network byte order):
+
+ * Header: router id (4 bytes, IPv4), timestamp of the read-out at the
+   router (float64) and number of interfaces (uint16).
+
+ * One entry per interface: ifindex (uint32), name (16 bytes, padded
+   with NULs) and transmitted octets (uint64).
+
+Rates are computed from the timestamps of the router, so they are not
+affected by the network delay of the datagrams.
+"""
+from tecontroller.res.snmplib import counterDiff
+from tecontroller.res.flow import Base
+
+import numpy as np
+import socket
+import struct
+import time
+
+HEADER = struct.Struct('!4sdH')
+ENTRY = struct.Struct('!I16sQ')
+
+def packReport(routerid, timestamp, entries):
+    """Returns the datagram with the counters of routerid. entries is a
+    list of (ifindex, name, octets).
+    """
+    s = HEADER.pack(socket.inet_aton(routerid), timestamp, len(entries))
+    for (ifindex, name, octets) in entries:
+        s += ENTRY.pack(ifindex, name, octets)
+    return s
+
+def unpackReport(data):
+    """Returns the tuple (routerid, timestamp, entries) of a datagram.
+    Raises ValueError if it is malformed.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Truncated telemetry report")
+    (rid, timestamp, n) = HEADER.unpack_from(data)
+    if len(data) != HEADER.size + n*ENTRY.size:
+        raise ValueError("Truncated telemetry report")
+    entries = []
+    for i in range(n):
+        (ifindex, name, octets) = ENTRY.unpack_from(data, HEADER.size + i*ENTRY.size)
+        entries.append((ifindex, name.rstrip('\0'), octets))
+    return (socket.inet_ntoa(rid), timestamp, entries)
+
+
+class PushCounters(Base):
+    """Interface counters of a router, updated from its telemetry
+    reports. Offers the same read-out interface as SnmpCounters.
+    """
+    def __init__(self, routerIp = "127.0.0.1"):
+        super(PushCounters, self).__init__()
+        self.routerIp = routerIp
+        self.interfaces = []
+        self.octets = np.zeros(0, dtype=np.uint64)
+        self.counters = np.zeros(0)
+        self.countersDiff = np.zeros(0)
+        self.timeDiff = 0
+        self.lastUpdated = 0
+        # Timestamp of the last report, as taken by the router
+        self.lastReport = None
+        # Set when the interfaces of the router change
+        self.interfacesChanged = False
+
+    def __repr__(self):
+        return "PushCounter(%s)"%self.routerIp
+
+    def update(self, timestamp, entries):
+        """Updates the counters with a report. Returns False if the report
+        is older than the last one.
+        """
+        if self.lastReport is not None and timestamp <= self.lastReport:
+            return False
+
+        names = [name for (ifindex, name, octets) in entries]
+        octets = np.asarray([o for (ifindex, name, o) in entries], dtype=np.uint64)
+        if names != [data['name'] for data in self.interfaces]:
+            # New set of interfaces: start over
+            self.interfaces = [{'number': str(ifindex), 'name': name} for (ifindex, name, o) in entries]
+            self.interfacesChanged = True
+            self.timeDiff = 0
+            self.countersDiff = np.zeros(len(entries))
+        else:
+            self.timeDiff = timestamp - self.lastReport
+            self.countersDiff = counterDiff(octets, self.octets, bits=64).astype(float)*8
+
+        self.octets = octets
+        self.counters = octets.astype(float)*8
+        self.lastReport = timestamp
+        self.lastUpdated = time.time()
+        return True
+
+    def updateCounters(self):
+        """Counters are pushed by the router: nothing to poll"""
+        pass
+
+    def fromLastLecture(self):
+        return time.time() - self.lastUpdated
+
+    def getLoads(self):
+        return self.countersDiff
+
+
+class TelemetryCollector(object):
+    """Receives the telemetry reports on a UDP port, and updates the
+    PushCounters of the routers.
+    """
+    def __init__(self, counters, port, address='0.0.0.0'):
+        # {router id: PushCounters}
+        self.counters = counters
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.n_reports = 0
+        self.n_dropped = 0
+
+    def reports(self):
+        """Generator of the router ids whose counters have been updated,
+        as reports arrive.
+        """
+        while True:
+            data = self.sock.recv(65535)
+            try:
+                (routerid, timestamp, entries) = unpackReport(data)
+            except (ValueError, socket.error):
+                self.n_dropped += 1
+                continue
+            counter = self.counters.get(routerid)
+            if counter is None or not counter.update(timestamp, entries):
+                self.n_dropped += 1
+                continue
+            self.n_reports += 1
+            yield routerid
+
+    def close(self):
+        self.sock.close()
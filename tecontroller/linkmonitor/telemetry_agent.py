@@ -0,0 +1,79 @@
+#!/usr/bin/python
+"""This is a python script that runs in each mininet router (started
+by MyCustomRouter when dconf.LM_PushTelemetry is set). It periodically
+reads the transmitted octets of the router interfaces from
+/proc/net/dev and pushes them to the links monitor in a UDP datagram
+(see telemetry.py).
+
+Usage: telemetry_agent.py <router id> [<collector ip>]
+
+If the collector ip is not given, it is the one of the LB controller
+host, read from the network database.
+"""
+from tecontroller.linkmonitor.telemetry import packReport
+from tecontroller.res import defaultconf as dconf
+
+import ipaddress
+import socket
+import struct
+import fcntl
+import time
+import sys
+
+SIOCGIFINDEX = 0x8933
+
+def interfaceIndex(sock, name):
+    """Returns the ifindex of interface name (/sys/class/net is not
+    remounted in the namespace of the router, so it is asked to the
+    kernel).
+    """
+    ifreq = struct.pack('16si', name, 0)
+    return struct.unpack('16si', fcntl.ioctl(sock.fileno(), SIOCGIFINDEX, ifreq))[1]
+
+def readTxOctets():
+    """Returns a list of (name, transmitted octets) of the interfaces of
+    the router, except the loopback.
+    """
+    entries = []
+    with open('/proc/net/dev') as f:
+        # Skip the two header lines
+        for line in f.readlines()[2:]:
+            (name, fields) = line.split(':', 1)
+            name = name.strip()
+            if name == 'lo':
+                continue
+            # Receive fields go first (8 of them)
+            entries.append((name, int(fields.split()[8])))
+    return entries
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    routerid = sys.argv[1]
+
+    if len(sys.argv) > 2:
+        collector_ip = sys.argv[2]
+    else:
+        # Wait for the network database to be written
+        from tecontroller.res.dbhandler import DatabaseHandler
+        time.sleep(dconf.Hosts_InitialWaitingTime)
+        db = DatabaseHandler()
+        collector_ip = ipaddress.ip_interface(db.getIpFromHostName(dconf.LBC_Hostname)).ip.compressed
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    indexes = {}
+    while True:
+        timestamp = time.time()
+        entries = []
+        for (name, octets) in readTxOctets():
+            if name not in indexes:
+                indexes[name] = interfaceIndex(sock, name)
+            entries.append((indexes[name], name, octets))
+        try:
+            sock.sendto(packReport(routerid, timestamp, entries), (collector_ip, dconf.LM_TelemetryPort))
+        except socket.error:
+            # Collector not reachable yet
+            pass
+        time.sleep(dconf.LM_TelemetryInterval)
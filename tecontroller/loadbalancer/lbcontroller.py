@@ -15,6 +15,9 @@ from tecontroller.res import defaultconf as dconf
 from tecontroller.res.dbhandler import DatabaseHandler
 
 from tecontroller.res.flow import Flow
+from tecontroller.res import pathenum
+from tecontroller.res.csrgraph import CSRGraph
+from tecontroller.res.edgemask import EdgeInterner
 from tecontroller.loadbalancer.jsonlistener import JsonListener
 from tecontroller.linkmonitor.feedbackThread import feedbackThread
 
@@ -73,6 +76,11 @@ class LBController(object):
 
         # Lock to make flow_allocation thread-safe
         self.flowAllocationLock = threading.Lock()
+
+        # Edge bits to represent sets of edges as bitmasks, with
+        # (x,y) and (y,x) as different and as the same edge
+        self.edgeBits = EdgeInterner()
+        self.undirectedEdgeBits = EdgeInterner(undirected=True)
         
         # From where to read events 
         self.eventQueue = eventQueue
@@ -505,7 +513,13 @@ class LBController(object):
         log.info("%s - Creating initial DAGs\n"%t)
         pairs_already_logged = []
                            
-        apdp = nx.all_pairs_dijkstra_path(self.initial_graph, weight='metric')
+        # Integer-indexed snapshot of the topology: shortest paths are
+        # computed over its arrays
+        csr = CSRGraph(self.initial_graph, attributes=('metric',))
+
+        # Shortest paths towards each connected router, shared by all
+        # its prefixes: {cr: (distances, counts, sp_edges)}
+        shortest_paths = {}
         
         for prefix in self.network_graph.prefixes:
             dag = nx.DiGraph()
@@ -518,45 +532,47 @@ class LBController(object):
             
             other_routers = [rn for rn in self.network_graph.routers if rn != cr]
 
+            # Shortest distance and number of equal cost paths from
+            # all routers towards the connected router, and edges in
+            # some shortest path towards it
+            if cr not in shortest_paths:
+                (distances, counts) = csr.shortestPathCounts(cr)
+                sp_edges = csr.shortestPathEdges(cr, distances=distances)
+                shortest_paths[cr] = (distances, counts, sp_edges)
+            (distances, counts, sp_edges) = shortest_paths[cr]
+
             for r in other_routers:
-                
-                # Get the shortest path
-                dpath = apdp[r][cr]
-                
-                # Are there possibly more paths with the same cost? Let's check:
-                # Get length of the default dijkstra shortest path
-                dlength = self.getPathLength(dpath)
+                # Length of the default dijkstra shortest path
+                dlength = distances[csr.nodeId(r)]
 
-                # Get all paths with length equal to the defaul path length
-                default_paths = self._getAllPathsLim(self.initial_graph, r, cr, dlength)
+                # Are there possibly more paths with the same cost?
+                n_paths = int(counts[csr.nodeId(r)])
 
-                if len(default_paths) > 1:
+                if n_paths > 1:
                     # ECMP is happening
                     ecmp = True
                     if (cr, r) not in pairs_already_logged and (r, cr) not in pairs_already_logged:
                         to_print = "\tECMP is ACTIVE between %s and %s. There are %d paths with equal cost of %d\n"
-                        log.info(to_print%(self.db.getNameFromIP(cr), self.db.getNameFromIP(r), len(default_paths), dlength))
+                        log.info(to_print%(self.db.getNameFromIP(cr), self.db.getNameFromIP(r), n_paths, dlength))
                         pairs_already_logged.append((cr, r))
                     
-                elif len(default_paths) == 1:
+                elif n_paths == 1:
                     ecmp = False
-                    default_paths = [dpath]
 
                 else:
                     t = time.strftime("%H:%M:%S", time.gmtime())
                     log.info("%s - _createInitialDags(): ERROR. At least there should be a path\n"%t)
-                    
-                # Iterate through paths and add edges to DAG
-                for path in default_paths:
-                    edge_list = zip(path[:-1], path[1:])
-                    for (u,v) in edge_list:
-                        if self.network_graph.is_router(u) and self.network_graph.is_router(v):
-                            dag.add_edge(u,v)
-                            edge_data = dag.get_edge_data(u,v)
-                            edge_data['active'] = True
-                            edge_data['fibbed'] = False
-                            edge_data['default'] = True
-                            edge_data['ongoing_flows'] = False
+
+            # All edges in some shortest path towards the connected
+            # router are in the DAG
+            for (u,v) in csr.edgeNames(sp_edges):
+                if self.network_graph.is_router(u) and self.network_graph.is_router(v):
+                    dag.add_edge(u,v)
+                    edge_data = dag.get_edge_data(u,v)
+                    edge_data['active'] = True
+                    edge_data['fibbed'] = False
+                    edge_data['default'] = True
+                    edge_data['ongoing_flows'] = False
 
             # Add DAG to prefix
             self.dags[subnet_prefix] = dag
@@ -570,6 +586,23 @@ class LBController(object):
             edge_list += zip(path[:-1], path[1:])
         return edge_list
 
+    def getPathListMask(self, path_list, undirected=False):
+        """Returns the bitmask of the edges contained in the paths of
+        path_list.
+        """
+        if undirected:
+            return self.undirectedEdgeBits.pathListMask(path_list)
+        return self.edgeBits.pathListMask(path_list)
+
+    def getOccupiedEdgesMask(self, prefix, undirected=False):
+        """Returns the bitmask of the edges used by the flows allocated to
+        prefix.
+        """
+        mask = 0
+        for (flow, path_list) in self.getAllocatedFlows(prefix):
+            mask |= self.getPathListMask(path_list, undirected)
+        return mask
+
     def isFibbed(self, dst_prefix):
         """Returns true if there exist fake LSA for that prefix in the
         network.
@@ -677,13 +710,9 @@ class LBController(object):
         activeDag = self.getActiveDag(prefix)
         log.info("\t* removeAllocationEntry: initial DAG\n\t  %s\n"%str(self.toLogDagNames(activeDag).edges()))
         
-        # Get current remaining allocated flows for destination
-        remaining_flows = self.getAllocatedFlows(prefix)
-
-        # Acumulate edges for which there are flows ongoing
-        ongoing_edge_list = []
-        for (f, f_path_list) in remaining_flows:
-            ongoing_edge_list += self.getEdgesFromPathList(f_path_list)
+        # Acumulate edges for which the remaining allocated flows
+        # for destination are ongoing
+        ongoing_edges_mask = self.getOccupiedEdgesMask(prefix)
                 
         # Iterate the path_list
         for path in path_list:
@@ -694,7 +723,8 @@ class LBController(object):
             edges = zip(path_only_routers[:-1], path_only_routers[1:])
             
             # Calculate which of these edges can be set to ongoing_flows = False
-            edges_without_flows = [(u, v) for (u, v) in edges if (u, v) not in ongoing_edge_list]
+            edges_without_flows = [(u, v) for (u, v) in edges if not
+                                   ongoing_edges_mask & self.edgeBits.edgeMask((u, v))]
             
             # Set them
             current_dag = self.switchDagEdgesData(current_dag, edges_without_flows, ongoing_flows=False)
@@ -802,22 +832,18 @@ class LBController(object):
                 canRemoveLSA = True
 
                 # Collect first the edges of the paths to remove
-                path_edges_list = []
-                for path in path_list:
-                    path_edges_list += zip(path[:-1], path[1:])
+                path_edges_mask = self.getPathListMask(path_list)
 
-                log.info("Edges of the paths to remove: %s\n"%self.toLogRouterNames(path_edges_list))
+                log.info("Edges of the paths to remove: %s\n"%self.toLogRouterNames(self.getEdgesFromPathList(path_list)))
                 for (flow, flow_path_list) in allocated_flows:
                     log.info("flow: %s, path: %s\n"%(self.toLogFlowNames(flow), self.toLogRouterNames(flow_path_list)))
                     # Get all edges used by flows sending to same
                     # destination prefix
-                    flow_edges_list = []
-                    for flow_path in flow_path_list:
-                        flow_edges_list += zip(flow_path[:-1], flow_path[1:])
+                    flow_edges_mask = self.getPathListMask(flow_path_list)
 
-                    check = [True if (u,v) in path_edges_list else False for (u,v) in flow_edges_list]
-                    log.info("CHECK list: %s\n"%str(check))
-                    if sum(check) > 0:
+                    check = (flow_edges_mask & path_edges_mask) != 0
+                    log.info("CHECK: %s\n"%str(check))
+                    if check:
                         # Do not remove lsas yet. Other flows ongoing
                         # in one of the paths in path_list
                         canRemoveLSA = False
@@ -1008,52 +1034,14 @@ class LBController(object):
             ordered_paths = self._orderByCapacityLeft(paths)
         return ordered_paths
     
-    def _getAllPathsLim(self, igp_graph, start, end, k, path=[], len_path=0, die=False):
-        """Recursive function that finds all paths from start node to end
-        node with maximum length of k.
+    def _getAllPathsLim(self, igp_graph, start, end, k):
+        """Finds all paths from start node to end node with maximum length
+        (sum of edge 'metric') of k.
         """
-        if die == False:
-            # Accumulate path length first
-            if path == []:
-                len_path = 0
-            else:
-                last_node = path[-1]
-                len_path += igp_graph.get_edge_data(last_node, start)['metric']
-                
-            # Accumulate nodes in path
-            path = path + [start]
-        
-            if start == end:
-                # Arrived to the end. Go back returning everything
-                if k == 0:
-                    return [path]
-                elif len_path < k+1:
-                    return [path]
-                else:
-                    self._getAllPathsLim(igp_graph, start, end, k, path=path, len_path=len_path, die=True)
-            
-            if not start in igp_graph:
-                return []
-
-            paths = []
-            for node in igp_graph[start]:
-                if node not in path: # Ommiting loops here
-                    if k == 0:
-                        # If we do not want any length limit
-                        newpaths = self._getAllPathsLim(igp_graph, node, end, k, path=path, len_path=len_path)
-                        for newpath in newpaths:
-                            paths.append(newpath)
-                    elif len_path < k+1:
-                        newpaths = self._getAllPathsLim(igp_graph, node, end, k, path=path, len_path=len_path)
-                        for newpath in newpaths:
-                            paths.append(newpath)
-            return paths
-        else:
-            # Recursive call dies here
-            pass
+        return pathenum.getAllPaths(igp_graph, start, end, max_metric=k, metric_key='metric')
 
-    def _getAllPathsLimDAG(self, dag, start, end, k, path=[]):
-        """Recursive function that finds all paths from start node to end node
+    def _getAllPathsLimDAG(self, dag, start, end, k):
+        """Finds all paths from start node to end node
         with maximum length of k.
 
         If the function is called with k=0, returns all existing
@@ -1070,29 +1058,7 @@ class LBController(object):
                   since the dags do not have weights).
 
         """
-        # Accumulate nodes in path
-        path = path + [start]
-        
-        if start == end:
-            # Arrived to the end. Go back returning everything
-            return [path]
-            
-        if not start in dag:
-            return []
-
-        paths = []
-        for node in dag[start]:
-            if node not in path: # Ommiting loops here
-                if k == 0:
-                    # If we do not want any length limit
-                    newpaths = self._getAllPathsLimDAG(dag, node, end, k, path=path)
-                    for newpath in newpaths:
-                        paths.append(newpath)
-                elif len(path) < k+1:
-                    newpaths = self._getAllPathsLimDAG(dag, node, end, k, path=path)
-                    for newpath in newpaths:
-                        paths.append(newpath)
-        return paths
+        return pathenum.getAllPaths(dag, start, end, max_hops=k)
 
     def _orderByLength(self, paths):
         """Given a list of arbitrary paths. It ranks them by lenght (or total
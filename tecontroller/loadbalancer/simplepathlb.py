@@ -288,17 +288,16 @@ class SimplePathLB(LBController):
         dst_prefix = previous_dst_network.compressed
         allocated_flows = self.getAllocatedFlows(dst_prefix)   
 
-        # Calculate which of them are colliding with our new path
-        edges_new_pl = set(self.getEdgesFromPathList(new_path_list))
+        # Calculate which of them are colliding with our new path (in
+        # any direction)
+        edges_new_pl = self.getPathListMask(new_path_list, undirected=True)
 
         # Acumulate flow destinations ips for which the flows collide
         # with our path
         ips = []
         for (flow, fpl) in allocated_flows:
-            edges_flow = self.getEdgesFromPathList(fpl)
-            edges_flow = set(edges_flow)
-            edges_flow_r = self.getReversedEdgesSet(edges_flow)
-            if edges_flow.intersection(edges_new_pl) == set() and edges_flow_r.intersection(edges_new_pl) == set():
+            edges_flow = self.getPathListMask(fpl, undirected=True)
+            if edges_flow & edges_new_pl == 0:
                 ips.append(flow['dst'].ip)
             
         # Find the shortest longer prefix that does not collide with flows
@@ -376,24 +375,17 @@ class SimplePathLB(LBController):
         allocated_flows = self.getAllocatedFlows(dst_prefix)
 
         # Collect edges for which there are flows ongoing
-        ongoing_flows_edges = set()
-        for (flow, path_list) in allocated_flows:
-            for path in path_list:
-                ongoing_flows_edges.update(ongoing_flows_edges.union(zip(path[:-1], path[1:])))
+        ongoing_flows_edges = self.getOccupiedEdgesMask(dst_prefix)
                     
         # Collect edges initial_path
-        edges_initial_paths = set()
-        for path in initial_paths:
-            edges_initial_paths.update(edges_initial_paths.union(zip(path[:-1], path[1:])))
+        edges_initial_paths = self.getPathListMask(initial_paths)
 
-        if edges_initial_paths.intersection(ongoing_flows_edges) != set():
+        if edges_initial_paths & ongoing_flows_edges:
             # Longer prefix fibbing is needed
             return True
         else:
             # Collect edges of new paths
-            edges_new_paths = set()
-            for path in new_paths:
-                edges_new_paths.update(edges_new_paths.union(zip(path[:-1], path[1:])))
+            edges_new_paths = self.getPathListMask(new_paths)
 
             # Check if edges that should be deactivated have ongoing
             # flows too
@@ -401,7 +393,8 @@ class SimplePathLB(LBController):
                 for node in path:
                     active_edges = self.getActiveEdges(currentDag, node)
                     for edge in active_edges:
-                        if edge in ongoing_flows_edges and edge not in edges_new_paths:
+                        edge_mask = self.edgeBits.edgeMask(edge)
+                        if edge_mask & ongoing_flows_edges and not edge_mask & edges_new_paths:
                             return True
             return False
 
@@ -410,16 +403,6 @@ class SimplePathLB(LBController):
         should be subclassed by the ECMPLB"""
         pass
 
-    @staticmethod
-    def getReversedEdgesSet(edges_set):
-        """Given a set of edges, it returns a set with the reversed edges."""
-        edges_set_copy = edges_set.copy()
-        reversed_set = set()
-        while edges_set_copy != set():
-            (u,v) = edges_set_copy.pop()
-            reversed_set.update({(v,u)})
-        return reversed_set
-        
 if __name__ == '__main__':
     log.info("SIMPLE PATH LOAD BALANCER CONTROLLER\n")
     log.info("-"*60+"\n")
@@ -0,0 +1,156 @@
+"""Module that implements cheap lower and upper bounds of the congestion
+probability computed by ProbabiliyCalculator.ExactCongestionProbability.
+
+Each flow i of size s_i takes one of its possible paths uniformly at
+random, so the load of an edge e is the sum of independent variables
+s_i*X_ie, where X_ie ~ Bernoulli(p_ie) and p_ie is the fraction of the
+paths of flow i that cross e. The edge congests when its load goes
+above its slack: capacity - mincap.
+
+The bounds are computed in vectorized form over the (flows x edges)
+matrix of p_ie:
+
+ * Deterministic worst case: if no edge congests when all flows
+   cross all the edges they could cross, Pc = 0.
+
+ * Deterministic best case: if some edge congests only with the flows
+   that can't avoid it, Pc = 1.
+
+ * Upper bound: union bound over the edges, where the tail of each
+   edge load is bounded with Hoeffding's inequality.
+
+ * Lower bound: the fraction of the paths of a single flow that
+   congest with the flow itself plus the load of the flows that
+   can't avoid the edges.
+"""
+import numpy as np
+
+class BoundsFilter(object):
+    """Decides whether the congestion probability is above a threshold
+    using the bounds only, and keeps count of how often the expensive
+    computation could be skipped.
+    """
+    def __init__(self):
+        self.n_calls = 0
+        self.n_skipped = 0
+
+    def decide(self, dag, flow_paths, flow_sizes, threshold):
+        """Returns the tuple (lower, upper, decided). If decided is True,
+        the bounds fall on one side of the threshold, and thus:
+        Pc > threshold <=> lower > threshold.
+        """
+        (lower, upper) = congestionBounds(dag, flow_paths, flow_sizes)
+        decided = (upper <= threshold or lower > threshold)
+        self.n_calls += 1
+        if decided:
+            self.n_skipped += 1
+        return (lower, upper, decided)
+
+    def __str__(self):
+        return "%d out of %d skipped"%(self.n_skipped, self.n_calls)
+
+
+def congestionBounds(dag, flow_paths, flow_sizes, graph=None, capacities=None):
+    """Returns the tuple (lower, upper) of bounds of the congestion
+    probability. Arguments are the same as the ones of
+    ProbabiliyCalculator.ExactCongestionProbability: DAG edges must
+    incorporate the 'capacity' and 'mincap' keys.
+
+    If graph (a CSRGraph snapshot of the capacity graph) and the array
+    of capacities by edge id are given, edges are indexed and their
+    slack read from the arrays instead of the DAG.
+    """
+    if flow_paths == []:
+        return (0.0, 0.0)
+
+    # Flows without paths: bounds are not informative
+    if [] in flow_paths:
+        return (0.0, 1.0)
+
+    # Ids of the edges crossed by each path
+    if graph is not None:
+        edgeId = graph.edge_index.__getitem__
+    else:
+        edge_index = {}
+        edgeId = lambda edge: edge_index.setdefault(edge, len(edge_index))
+    path_ids = [[edgeId(edge) for edge in zip(path[:-1], path[1:])] for
+                path_list in flow_paths for path in path_list]
+    ids = [i for path_edges in path_ids for i in path_edges]
+    if ids == []:
+        return (0.0, 0.0)
+
+    # Index the edges crossed by some flow path
+    (used, columns) = np.unique(ids, return_inverse=True)
+    n_edges = len(used)
+
+    # Edge slacks
+    if graph is not None:
+        slack = capacities[used] - graph.attributes['mincap'][used]
+    else:
+        edges = sorted(edge_index, key=edge_index.get)
+        slack = np.array([dag[x][y]['capacity'] - dag[x][y]['mincap'] for
+                          (x, y) in [edges[i] for i in used]], dtype=float)
+
+    # Path-edge incidence matrices of each flow and fraction of
+    # paths of each flow crossing each edge
+    n_paths = np.array([len(path_list) for path_list in flow_paths])
+    rows = [p for (p, path_edges) in enumerate(path_ids) for i in path_edges]
+    incidence = np.zeros((len(path_ids), n_edges), dtype=bool)
+    incidence[rows, columns] = True
+    incidences = np.split(incidence, np.cumsum(n_paths)[:-1])
+
+    flow_of_path = np.zeros((len(flow_paths), len(path_ids)))
+    flow_of_path[np.repeat(np.arange(len(flow_paths)), n_paths), np.arange(len(path_ids))] = 1
+    fractions = flow_of_path.dot(incidence)/n_paths[:, np.newaxis]
+    sizes = np.asarray(flow_sizes, dtype=float)
+
+    maybe = fractions > 0
+    always = fractions == 1
+    worst_load = sizes.dot(maybe)
+    best_load = sizes.dot(always)
+
+    # Deterministic worst case: no edge congests
+    worst_congested = (worst_load > slack) & (worst_load > 0)
+    if not worst_congested.any():
+        return (0.0, 0.0)
+
+    # Deterministic best case: some edge always congests
+    if ((best_load > slack) & (best_load > 0)).any():
+        return (1.0, 1.0)
+
+    upper = unionHoeffdingBound(fractions, sizes, slack, worst_congested)
+    lower = singleFlowBound(incidences, always, sizes, slack, best_load)
+    return (lower, max(lower, upper))
+
+def unionHoeffdingBound(fractions, sizes, slack, worst_congested):
+    """Union bound over the edges that may congest, with the tail of
+    each edge load bounded by Hoeffding's inequality:
+
+      P(L_e > slack_e) <= exp(-2*(slack_e - E[L_e])^2 / sum(s_i^2))
+
+    where the sum runs over the flows that may or may not cross e.
+    """
+    mean_load = sizes.dot(fractions)
+    random_flows = (fractions > 0) & (fractions < 1)
+    variance_term = (sizes**2).dot(random_flows)
+
+    distance = slack - mean_load
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tails = np.exp(-2*distance**2/variance_term)
+    tails = np.where(distance <= 0, 1.0, tails)
+    tails = np.where(variance_term == 0, (mean_load > slack)*1.0, tails)
+    tails = np.where(worst_congested, tails, 0.0)
+    return min(1.0, float(tails.sum()))
+
+def singleFlowBound(incidences, always, sizes, slack, best_load):
+    """Maximum over the flows of the fraction of their paths that
+    congest with the load of the flows that can't avoid the edges.
+    """
+    lower = 0.0
+    for f, incidence in enumerate(incidences):
+        # Load of the other flows that always cross each edge
+        others_load = best_load - sizes[f]*always[f]
+        full_edges = (others_load + sizes[f]) > slack
+        congested_paths = (incidence & full_edges).any(axis=1)
+        lower = max(lower, float(congested_paths.mean()))
+    return lower
@@ -0,0 +1,180 @@
+"""Module that implements a compact, integer-indexed snapshot of a
+network graph, in compressed sparse row (CSR) form.
+
+Nodes (router ids, prefixes...) are interned to integers 0..n-1, and
+edges to integers 0..m-1, sorted by source node. Edge attributes such
+as metric, capacity, bw or mincap are kept in NumPy arrays indexed by
+edge id, so that shortest paths and capacity checks do not go through
+the per-edge attribute dictionaries of networkx:
+
+ * LBController._createInitialDags computes the shortest paths
+   towards each destination over the metric array.
+
+ * The candidate DAGs of each allocation decision of TEControllerLab2
+   (see dagpool.DecisionContext and boundlib.congestionBounds) are
+   checked against the capacity and mincap arrays of a snapshot of
+   the capacity graph.
+
+Results are converted back to node names (edgeNames) at the boundary
+with the rest of the controller.
+"""
+import numpy as np
+import heapq
+
+class CSRGraph(object):
+    def __init__(self, graph, attributes=('metric', 'capacity', 'bw', 'mincap')):
+        """Takes a snapshot of graph (any nx.DiGraph, e.g. an IGPGraph or
+        the capacity graph). Missing attributes are stored as NaN.
+        """
+        edges = graph.edges(data=True)
+        values = {name: [data.get(name) for (x, y, data) in edges] for name in attributes}
+        self._build(graph.nodes(), [(x, y) for (x, y, data) in edges], values)
+
+    @classmethod
+    def fromCapacityGraph(cls, capacity_graph):
+        """Returns the snapshot of the capacity, bw and mincap attributes of
+        capacity_graph: a networkx graph, or a CapacitySnapshot of the
+        links monitor, whose arrays are taken as they are.
+        """
+        if not hasattr(capacity_graph, 'edges_list'):
+            return cls(capacity_graph, attributes=('capacity', 'bw', 'mincap'))
+
+        edges = capacity_graph.edges_list
+        nodes = sorted(set([x for (x, y) in edges] + [y for (x, y) in edges]))
+        values = {'capacity': capacity_graph.capacities,
+                  'bw': capacity_graph.bandwidths,
+                  'mincap': capacity_graph.mincaps}
+        csr = cls.__new__(cls)
+        csr._build(nodes, edges, values)
+        return csr
+
+    def _build(self, nodes, edges, values):
+        """Interns nodes and edges [(x, y)], and takes the attribute values
+        {name: values in the order of edges}.
+        """
+        # Interned nodes
+        self.nodes = list(nodes)
+        self.node_index = {node: i for (i, node) in enumerate(self.nodes)}
+        self.n_nodes = len(self.nodes)
+
+        # Edges sorted by source node
+        node_index = self.node_index
+        order = sorted(range(len(edges)), key=lambda e: (node_index[edges[e][0]], node_index[edges[e][1]]))
+        self.n_edges = len(edges)
+        self.sources = np.array([node_index[edges[e][0]] for e in order], dtype=int)
+        self.targets = np.array([node_index[edges[e][1]] for e in order], dtype=int)
+
+        # Edge ids by (x, y) node names
+        self.edge_index = {edges[e]: i for (i, e) in enumerate(order)}
+
+        # Edge attribute arrays
+        self.attributes = {}
+        for (name, column) in values.iteritems():
+            column = np.array([np.nan if v is None else v for v in column], dtype=float)
+            self.attributes[name] = column[np.asarray(order, dtype=int)]
+
+        # Reverse index (edges sorted by target node), built on demand
+        self._reverse = None
+
+    # Conversions ###############################################
+
+    def nodeId(self, node):
+        return self.node_index[node]
+
+    def edgeId(self, x, y):
+        return self.edge_index[(x, y)]
+
+    def edgeIds(self, path):
+        """Returns the array of edge ids along a path of node names"""
+        edge_index = self.edge_index
+        return np.array([edge_index[edge] for edge in zip(path[:-1], path[1:])], dtype=int)
+
+    def edgeNames(self, edge_ids):
+        return [(self.nodes[self.sources[e]], self.nodes[self.targets[e]]) for e in edge_ids]
+
+    # Capacity checks ###########################################
+
+    def pathLoads(self, sized_paths):
+        """Returns the array of the load of each edge, where sized_paths
+        is a list of tuples (size, path) of flows. Edges of the paths
+        that are not in the graph are left out.
+        """
+        edge_index = self.edge_index
+        loads = np.zeros(self.n_edges)
+        for (size, path) in sized_paths:
+            ids = [edge_index[edge] for edge in zip(path[:-1], path[1:]) if edge in edge_index]
+            loads[ids] += size
+        return loads
+
+    # Shortest paths ############################################
+
+    def distancesTo(self, destination, weight='metric'):
+        """Returns the array of shortest distances from every node to node
+        destination (inf if it can't reach it).
+        """
+        return self._dijkstra(self.node_index[destination], weight)
+
+    def shortestPathEdges(self, destination, weight='metric', distances=None):
+        """Returns the ids of the edges that lie in some shortest path
+        towards destination: those (x, y) such that
+        d(x) = weight(x, y) + d(y). Weights must be positive.
+        """
+        if distances is None:
+            distances = self.distancesTo(destination, weight)
+        head = distances[self.targets]
+        through = self.attributes[weight] + head
+        mask = np.isfinite(head) & np.isclose(distances[self.sources], through, rtol=0, atol=1e-9)
+        return np.nonzero(mask)[0]
+
+    def shortestPathCounts(self, destination, weight='metric'):
+        """Returns the tuple (distances, counts) of arrays with the
+        shortest distance of every node towards destination, and the
+        number of equal-cost shortest paths it has towards it.
+        """
+        distances = self.distancesTo(destination, weight)
+        sp_edges = self.shortestPathEdges(destination, weight, distances)
+
+        counts = np.zeros(self.n_nodes)
+        counts[self.node_index[destination]] = 1
+        # Paths are counted in increasing distance order
+        order = np.argsort(distances, kind='mergesort')
+        sp_targets = [[] for i in range(self.n_nodes)]
+        for e in sp_edges:
+            sp_targets[self.sources[e]].append(self.targets[e])
+        for node in order:
+            if not np.isfinite(distances[node]) or distances[node] == 0:
+                continue
+            counts[node] = sum([counts[t] for t in sp_targets[node]])
+        return (distances, counts)
+
+    def _dijkstra(self, origin, weight):
+        """Dijkstra over the reversed edges, from node origin"""
+        (indptr, edges, neighbour) = self._reverseAdjacency()
+        weights = self.attributes[weight].tolist()
+
+        distances = [float('inf')]*self.n_nodes
+        distances[origin] = 0
+        heap = [(0, origin)]
+        while heap:
+            (d, node) = heapq.heappop(heap)
+            if d > distances[node]:
+                continue
+            for e in edges[indptr[node]:indptr[node+1]]:
+                other = neighbour[e]
+                new_d = d + weights[e]
+                if new_d < distances[other]:
+                    distances[other] = new_d
+                    heapq.heappush(heap, (new_d, other))
+        return np.array(distances)
+
+    def _reverseAdjacency(self):
+        """Returns the tuple (indptr, edge ids, source of each edge) of the
+        edges sorted by target node, as lists for fast access in the
+        Python loops.
+        """
+        if self._reverse is None:
+            order = np.argsort(self.targets, kind='mergesort')
+            indptr = np.zeros(self.n_nodes + 1, dtype=int)
+            indptr[1:] = np.cumsum(np.bincount(self.targets, minlength=self.n_nodes))
+            self._reverse = (indptr.tolist(), order.tolist(), self.sources.tolist())
+        return self._reverse
@@ -1,3 +1,4 @@
+from tecontroller.res import pathenum
 import networkx as nx
 import random
 import itertools as it
@@ -6,42 +7,61 @@ def getMergedDag(start, end, path_list):
 	"""
 	Given a list of paths, returns the loop-free merged DAG
 	forcing all (possible) paths in path_list.
-	"""
-	pathsDags = []
-	for path in path_list:
-		tmp_dag = nx.DiGraph()
-		tmp_dag.add_edges_from(zip(path[:-1], path[1:]))
-		pathsDags.append(tmp_dag)
 
+	If merging the paths creates loops, they are broken
+	deterministically: inside each strongly connected component,
+	only the edges that go towards nodes closer to end (in hops,
+	ties broken by node name) are kept. The result thus only depends
+	on start, end and the union of the edges of path_list.
+	"""
 	## Merge them all into one single DAG
-	composedDag = nx.compose_all(pathsDags)
-        
-        while not nx.is_directed_acyclic_graph(composedDag):
-                ## Eliminate loop edges at random
-                # Get simple cycles
-                simple_cycles = [c for c in nx.simple_cycles(composedDag)]
-                
-                ## Eliminate loops
-                for cycle in simple_cycles:
-                        # Remove cycle edge at random
-                        cycle_edges = zip(cycle[:-1], cycle[1:])
-                        random.shuffle(cycle_edges)
-                        (x, y) = cycle_edges[0]
-                        if (x,y) in composedDag.edges():
-                                composedDag.remove_edge(x, y)
-
-	# Compute all paths on randomDag (to eliminate dummy paths)
-	all_final_paths = getAllPathsLim(composedDag, start, end, k=0)
-
-	pathsDags = []
-	for path in all_final_paths:
-		tmp_dag = nx.DiGraph()
-		tmp_dag.add_edges_from(zip(path[:-1], path[1:]))
-		pathsDags.append(tmp_dag)
-	
-	finalMergedDag = nx.compose_all(pathsDags)
+	composedDag = nx.DiGraph()
+	for path in path_list:
+		composedDag.add_edges_from(zip(path[:-1], path[1:]))
+
+	if start not in composedDag or end not in composedDag:
+		return nx.DiGraph()
+
+	if not nx.is_directed_acyclic_graph(composedDag):
+		composedDag = breakLoops(composedDag, end)
+
+	# Keep only the edges in some path from start to end (to
+	# eliminate dummy paths)
+	fromStart = nx.descendants(composedDag, start)
+	fromStart.add(start)
+	toEnd = nx.ancestors(composedDag, end)
+	toEnd.add(end)
+	finalEdges = [(x, y) for (x, y) in composedDag.edges() if
+		      x in fromStart and y in toEnd and x != end]
+
+	# Breaking the loops may have disconnected start from end
+	finalMergedDag = nx.DiGraph()
+	if end in fromStart:
+		finalMergedDag.add_edges_from(finalEdges)
 	return finalMergedDag
 
+def breakLoops(graph, end):
+	"""
+	Returns an acyclic copy of graph, where each node still has a
+	path towards end (if it had one). Edges between strongly
+	connected components are always kept. Inside them, edges are
+	kept only if they decrease the order: (hops to end, node name).
+	"""
+	distances = nx.single_source_shortest_path_length(graph.reverse(), end)
+	component = {}
+	for (i, nodes) in enumerate(nx.strongly_connected_components(graph)):
+		for node in nodes:
+			component[node] = i
+
+	def order(node):
+		return (distances.get(node, float('inf')), str(node))
+
+	acyclicGraph = nx.DiGraph()
+	acyclicGraph.add_nodes_from(graph.nodes())
+	acyclicGraph.add_edges_from([(x, y) for (x, y) in graph.edges() if
+				     component[x] != component[y] or order(x) > order(y)])
+	return acyclicGraph
+
 def getRandomDag(graph, start, end):
 	"""
 	Given a network graph, and start and end nodes, computes
@@ -99,81 +119,188 @@ def getAllPossibleSinglePathDags(graph, start, end):
 	return all_dags
 
 def getAllPossibleDags(graph, start, end):
-        """
+	"""
 	Given a network graph, and start and end nodes, computes
-	a random DAG from start towards end nodes. 
+	all possible DAGs from start towards end nodes.
 	"""
-	## Calculate firts all paths from start to end
-	all_paths = getAllPathsLim(graph, start, end, k=0)
-
-        # Calculate all combinations of possible paths.
-   	all_path_subsets = []
-   	action = [all_path_subsets.append(c) for i in range(1, len(all_paths)+1) for c in list(it.combinations(all_paths, i))]
-
-   	# Compute merge of dags
-   	allRandomDags = []
-   	for subset in all_path_subsets:
-   		mergedDag = getMergedDag(start, end, subset)
-   		allRandomDags.append(mergedDag)
-
-   	# Check for duplicates
-   	uniqueDags = []
-	for rdag in allRandomDags:
-   		# Search first if seen in uniqueDags
-   		seenUD = [e for e in uniqueDags if rdag.edges() == e[0]]
-   		if seenUD == []:
-   			# not seen before
-   			uniqueDags += [(rdag.edges(), 1, rdag)]
-   		else:
-   			(ude, fq, ud) = seenUD[0]
-   			uniqueDags.remove(seenUD[0])
-   			uniqueDags += [(ude, fq+1, ud)]
-
-   	#Collect unique dags and return them
-   	allPossibleDags = [c for (a,b,c) in uniqueDags]
-
-   	return allPossibleDags
+	return list(iterAllPossibleDags(graph, start, end, min_paths=1))
 
 def getAllPossibleMultiplePathDags(graph, start, end):
 	"""
 	Given a network graph, and start and end nodes, computes
-	a random DAG from start towards end nodes. 
+	all possible DAGs from start towards end nodes that merge
+	at least two paths.
+	"""
+	return list(iterAllPossibleDags(graph, start, end, min_paths=2))
+
+def iterAllPossibleDags(graph, start, end, min_paths=1):
+	"""
+	Generator that yields each unique DAG obtained from merging
+	a subset of at least min_paths paths from start to end.
+
+	Subsets are visited in increasing size, and DAGs are yielded
+	as they are found, so the power set of paths is never
+	materialized. Duplicates are detected with getDagKey().
+	"""
+	## Calculate firts all paths from start to end
+	all_paths = getAllPathsLim(graph, start, end, k=0)
+
+	seenUnions = set()
+	seenDags = set()
+	for i in range(min_paths, len(all_paths)+1):
+		for subset in it.combinations(all_paths, i):
+			# The merged DAG only depends on the union of the
+			# edges of the subset, since getMergedDag breaks loops
+			# deterministically: skip it if already merged
+			union = frozenset([e for path in subset for e in zip(path[:-1], path[1:])])
+			if union in seenUnions:
+				continue
+			seenUnions.add(union)
+
+			mergedDag = getMergedDag(start, end, subset)
+			key = getDagKey(mergedDag)
+			if key and key not in seenDags:
+				seenDags.add(key)
+				yield mergedDag
+
+def iterRandomPossibleDags(graph, start, end, min_paths=1, max_misses=100):
+	"""
+	Generator that yields unique DAGs obtained from merging random
+	subsets of at least min_paths paths from start to end.
+
+	It stops after max_misses consecutive subsets that did not
+	produce a new DAG.
 	"""
 	## Calculate firts all paths from start to end
 	all_paths = getAllPathsLim(graph, start, end, k=0)
+	if len(all_paths) < min_paths:
+		return
+
+	seenDags = set()
+	misses = 0
+	while misses < max_misses:
+		n_paths_chosen = random.randint(min_paths, len(all_paths))
+		subset = random.sample(all_paths, n_paths_chosen)
+		mergedDag = getMergedDag(start, end, subset)
+		key = getDagKey(mergedDag)
+		if not key or key in seenDags:
+			misses += 1
+		else:
+			misses = 0
+			seenDags.add(key)
+			yield mergedDag
+
+def getDagKey(dag):
+	"""
+	Returns a canonical hashable key of the DAG: the frozenset
+	of its edges.
+	"""
+	return frozenset(dag.edges())
 
-        # Calculate all combinations of possible paths.
-   	all_path_subsets = []
-   	action = [all_path_subsets.append(c) for i in range(2, len(all_paths)+1) for c in list(it.combinations(all_paths, i))]
-
-   	# Compute merge of dags
-   	allRandomDags = []
-   	for subset in all_path_subsets:
-   		mergedDag = getMergedDag(start, end, subset)
-   		allRandomDags.append(mergedDag)
-
-   	# Check for duplicates
-   	uniqueDags = []
-	for rdag in allRandomDags:
-   		# Search first if seen in uniqueDags
-   		seenUD = [e for e in uniqueDags if rdag.edges() == e[0]]
-   		if seenUD == []:
-   			# not seen before
-   			uniqueDags += [(rdag.edges(), 1, rdag)]
-   		else:
-   
-   			(ude, fq, ud) = seenUD[0]
-   			uniqueDags.remove(seenUD[0])
-   			uniqueDags += [(ude, fq+1, ud)]
-
-   	#Collect unique dags and return them
-   	allPossibleDags = [c for (a,b,c) in uniqueDags]
-
-   	return allPossibleDags
-
-def getAllPathsLim(graph, start, end, k, path=[]):
-    """Recursive function that finds all paths from start node to end node
-    with maximum length of k.
+class RandomDagSampler(object):
+	"""
+	Draws random loop-free DAGs from start towards end nodes
+	without enumerating the paths of the graph, so that the cost
+	is proportional to the number of samples taken.
+
+	Each sample merges (as getMergedDag does) between min_paths
+	and max_paths random paths, each of them found by a
+	depth-first search that visits neighbours in random order.
+	Empty DAGs and DAGs already sampled are rejected.
+	"""
+	def __init__(self, graph, start, end, seed=None, min_paths=1, max_paths=4, max_rejections=100):
+		self.graph = graph
+		self.start = start
+		self.end = end
+		self.min_paths = min_paths
+		self.max_paths = max(min_paths, max_paths)
+
+		# Consecutive rejections after which we consider the
+		# candidate space exhausted
+		self.max_rejections = max_rejections
+
+		# Own generator, so that samples are reproducible
+		self.rng = random.Random(seed)
+
+		self.seenDags = set()
+		self.n_samples = 0
+		self.n_rejections = 0
+
+	def sample(self):
+		"""
+		Returns a new random DAG, or None if max_rejections
+		consecutive draws were rejected.
+		"""
+		rejections = 0
+		while rejections < self.max_rejections:
+			n_paths = self.rng.randint(self.min_paths, self.max_paths)
+			paths = [self.getRandomPath() for i in range(n_paths)]
+			if None in paths:
+				# start and end are not connected
+				return None
+
+			mergedDag = getMergedDag(self.start, self.end, paths)
+			key = getDagKey(mergedDag)
+			if not key or key in self.seenDags:
+				rejections += 1
+				self.n_rejections += 1
+			else:
+				self.seenDags.add(key)
+				self.n_samples += 1
+				return mergedDag
+		return None
+
+	def take(self, n):
+		"""
+		Returns a list of at most n new random DAGs.
+		"""
+		dags = []
+		for dag in self:
+			dags.append(dag)
+			if len(dags) == n:
+				break
+		return dags
+
+	def __iter__(self):
+		while True:
+			dag = self.sample()
+			if dag is None:
+				return
+			yield dag
+
+	def getRandomPath(self):
+		"""
+		Returns a random loop-free path from start to end, or None
+		if there is none.
+		"""
+		path = [self.start]
+		visited = set(path)
+		neighbours = [self._shuffledNeighbours(self.start)]
+		while path != []:
+			if path[-1] == self.end:
+				return path
+			if neighbours[-1] == []:
+				# Dead end: go back
+				path.pop()
+				neighbours.pop()
+				continue
+			node = neighbours[-1].pop()
+			if node not in visited:
+				visited.add(node)
+				path.append(node)
+				neighbours.append(self._shuffledNeighbours(node))
+		return None
+
+	def _shuffledNeighbours(self, node):
+		if node not in self.graph:
+			return []
+		neighbours = list(self.graph[node])
+		self.rng.shuffle(neighbours)
+		return neighbours
+
+def getAllPathsLim(graph, start, end, k):
+    """Finds all paths from start node to end node with maximum length
+    of k.
 
     If the function is called with k=0, returns all existing
     loopless paths between start and end nodes.
@@ -189,30 +316,7 @@ def getAllPathsLim(graph, start, end, k, path=[]):
               since the dags do not have weights).
 
     """
-    # Accumulate nodes in path
-    path = path + [start]
-    
-    if start == end:
-        # Arrived to the end. Go back returning everything
-        return [path]
-        
-    if not start in graph:
-        return []
-
-    paths = []
-    for node in graph[start]:
-        if node not in path: # Ommiting loops here
-            if k == 0:
-                # If we do not want any length limit
-                newpaths = getAllPathsLim(graph, node, end, k, path=path)
-                for newpath in newpaths:
-                    paths.append(newpath)
-
-            elif len(path) < k+1:
-                newpaths = getAllPathsLim(graph, node, end, k, path=path)
-                for newpath in newpaths:
-                    paths.append(newpath)
-    return paths
+    return pathenum.getAllPaths(graph, start, end, max_hops=k)
 
 
 # ## TESTS #####################################
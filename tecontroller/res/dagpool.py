@@ -0,0 +1,356 @@
+"""Module that implements the evaluation of candidate ri->dx DAGs for
+the flow allocation algorithm of TEControllerLab2.
+
+The evaluation of a candidate DAG only depends on the current
+all-sources DAG of the destination prefix, a snapshot of the link
+capacities and the current flow allocations. Candidates are thus
+independent from each other, and can be dispatched to a pool of
+worker processes.
+"""
+from tecontroller.res.problib import ProbabiliyCalculator
+from tecontroller.res import boundlib
+from tecontroller.res.csrgraph import CSRGraph
+from tecontroller.res import defaultconf as dconf
+from tecontroller.res import daglib
+
+import multiprocessing
+import networkx as nx
+import time
+
+# Probability calculator object of the worker processes
+_worker_pc = None
+
+# Congestion probability algorithms: {name: ProbabiliyCalculator method}
+CONG_PROB_ALGORITHMS = {'exact': 'ExactCongestionProbability',
+                        'decomposed': 'DecomposedCongestionProbability',
+                        'sampled': 'SampledAllocationsCongestionProbability'}
+
+def checkAlgorithm(algorithm):
+    """Raises ValueError if algorithm is not the name of a congestion
+    probability algorithm.
+    """
+    if algorithm not in CONG_PROB_ALGORITHMS:
+        raise ValueError("Congestion probability algorithm not supported: %s (expected one of %s)"%(
+            algorithm, ', '.join(sorted(CONG_PROB_ALGORITHMS))))
+
+class DecisionContext(object):
+    """Picklable snapshot of everything that is needed to evaluate the
+    candidate DAGs of a single allocation decision.
+
+    Flows are referenced by their index in the context: index 0 is
+    the new flow, and the rest are the flows already allocated to the
+    destination prefix, in the order given by allocated_flows. We do
+    it this way because Flow objects hash by identity, and thus the
+    copies unpickled in the workers can't be used as dictionary keys
+    in the controller.
+    """
+    def __init__(self, adag, capacity_graph, flow, allocated_flows,
+                 ingress_routers, egress_router, algorithm='exact'):
+        checkAlgorithm(algorithm)
+
+        # All-sources DAG currently active for the prefix
+        self.adag = adag
+
+        # Capacities snapshot, as arrays indexed by edge id
+        self.graph = CSRGraph.fromCapacityGraph(capacity_graph)
+
+        # Flow sizes by index
+        self.flow_sizes = [flow.size]+[f.size for (f, pl) in allocated_flows]
+
+        # Ingress router of each flow by index
+        self.ingress_routers = ingress_routers
+
+        # Egress router (the same for all flows)
+        self.egress_router = egress_router
+
+        # Allocated flows that are in a single path: [(size, path)]
+        self.single_paths = [(f.size, pl[0]) for (f, pl) in allocated_flows if len(pl) == 1]
+
+        # Virtual capacity of each edge: its current capacity plus the
+        # sizes of the single-path flows crossing it
+        self.virtual_caps = self.graph.attributes['capacity'] + self.graph.pathLoads(self.single_paths)
+        self.mincaps = self.graph.attributes['mincap']
+
+        # Edges that can't allocate the new flow
+        self.full_edges = self.virtual_caps - flow.size < self.mincaps
+
+        # Name of the congestion probability algorithm
+        self.algorithm = algorithm
+
+    def getVirtualCapacity(self, x, y):
+        """Returns the tuple (virtual capacity, mincap) of edge (x, y):
+        its current capacity plus the sizes of the single-path flows
+        crossing it.
+        """
+        e = self.graph.edgeId(x, y)
+        return (self.virtual_caps[e], self.mincaps[e])
+
+
+class CandidateDagPool(object):
+    """Evaluates candidate ri->dx DAGs either in-process (n_workers <=
+    1) or in a pool of n_workers processes.
+
+    The pool should be created before any other thread is spawned by
+    the controller, since worker processes are forked.
+    """
+    def __init__(self, n_workers=1, dump_filename=dconf.MarshalFile):
+        self.n_workers = n_workers
+        if self.n_workers > 1:
+            self.pool = multiprocessing.Pool(processes=self.n_workers,
+                                             initializer=_initWorker,
+                                             initargs=(dump_filename,))
+        else:
+            self.pool = None
+
+        # Number of candidates evaluated, and number of them for which
+        # the exact Pc computation was skipped thanks to the bounds
+        self.n_candidates = 0
+        self.n_skipped = 0
+
+    def evaluate(self, context, dags, pc, threshold=None):
+        """Evaluates all dags under context, and returns the ones that
+        achieve the minimum congestion probability as a list of
+        tuples: [(index, new_adag, congProb, new_paths)], where index
+        refers to the position of the candidate in dags.
+
+        :param pc: ProbabiliyCalculator used for the in-process
+                   evaluation.
+
+        :param threshold: if given, candidates whose Pc lower bound is
+                          above it are not computed exactly (see
+                          evaluateCandidate).
+        """
+        self.n_candidates += len(dags)
+        if self.pool is None or len(dags) < 2:
+            (results, n_skipped) = _evaluateIndexedDags(context, list(enumerate(dags)), pc, threshold)
+            self.n_skipped += n_skipped
+            return _minimumResults(results)
+
+        # Split candidates in one chunk per worker, so that the
+        # decision context is shipped only once to each of them
+        indexed_dags = list(enumerate(dags))
+        chunks = [indexed_dags[i::self.n_workers] for i in range(self.n_workers)]
+        tasks = [(context, chunk, threshold) for chunk in chunks if chunk != []]
+
+        # Gather partial minimums and reduce them
+        partial_results = self.pool.map(_evaluateChunk, tasks)
+        results = [r for (partial, n_skipped) in partial_results for r in partial]
+        self.n_skipped += sum([n_skipped for (partial, n_skipped) in partial_results])
+        return _minimumResults(results)
+
+    def search(self, context, dags, pc, isLowEnough, time_budget=None):
+        """Anytime branch-and-bound search over the candidate dags.
+
+        Candidates are evaluated in increasing order of their
+        congestion lower bound (see congestionLowerBound), in batches
+        of n_workers. The search stops when:
+
+         * 'exhausted': all candidates have been evaluated.
+         * 'pruned': the lower bound of all remaining candidates
+           exceeds the best Pc found.
+         * 'low enough': isLowEnough(best Pc) returns True.
+         * 'time budget': more than time_budget seconds elapsed
+           (at least one candidate is always evaluated).
+
+        Returns a tuple (results, bound, n_evaluated, reason), where
+        results are the best candidates found as returned by
+        evaluate(), and bound is a lower bound on the optimal Pc of
+        all dags.
+        """
+        start_time = time.time()
+
+        # Order candidates by their lower bound
+        bounds = [congestionLowerBound(context, dag) for dag in dags]
+        order = sorted(range(len(dags)), key=lambda i: bounds[i])
+
+        results = []
+        n_evaluated = 0
+        batch_size = max(1, self.n_workers)
+        reason = 'exhausted'
+        position = 0
+        while position < len(order):
+            if results != []:
+                best = results[0][2]
+                if bounds[order[position]] > best:
+                    reason = 'pruned'
+                    break
+                if isLowEnough(best):
+                    reason = 'low enough'
+                    break
+                if time_budget and (time.time() - start_time) > time_budget:
+                    reason = 'time budget'
+                    break
+
+            # Evaluate next batch of candidates
+            batch = order[position:position+batch_size]
+            if results != []:
+                threshold = results[0][2]
+            else:
+                threshold = None
+            batch_results = self.evaluate(context, [dags[i] for i in batch], pc, threshold)
+            batch_results = [(batch[j], a, p, paths) for (j, a, p, paths) in batch_results]
+            results = _minimumResults(results + batch_results)
+            n_evaluated += len(batch)
+            position += len(batch)
+
+        # The optimal Pc can't be lower than the best found or than the
+        # lowest bound of the candidates not evaluated
+        if results == []:
+            bound = None
+        elif position < len(order):
+            bound = min(results[0][2], bounds[order[position]])
+        else:
+            bound = results[0][2]
+
+        return (results, bound, n_evaluated, reason)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+def evaluateCandidate(context, ri_dx_dag, pc, threshold=None):
+    """Evaluates a single candidate ri->dx DAG. Returns the tuple
+    (new_adag, congProb, new_paths, skipped), where new_paths is the
+    list of possible paths of each flow, ordered by flow index.
+
+    The exact Pc computation is skipped (skipped is True) when the
+    analytic bounds of boundlib are tight, or when the lower bound is
+    already above threshold. In the latter case congProb is that lower
+    bound: the candidate can't improve on threshold anyway.
+    """
+    # Compute the new all-routers DAG
+    new_adag = recomputeAllSourcesDag(context.adag, ri_dx_dag)
+
+    # Add virtual capacities to new_adag
+    new_adag = addVirtualCapacities(new_adag, context.graph, context.virtual_caps)
+
+    # Compute new path taken by sources in new re-computed DAG
+    new_paths = computeNewPaths(new_adag, context.ingress_routers, context.egress_router)
+
+    # Try to decide with the congestion bounds first
+    (lower, upper) = boundlib.congestionBounds(new_adag, new_paths, context.flow_sizes,
+                                               context.graph, context.virtual_caps)
+    if lower == upper or (threshold is not None and lower > threshold):
+        return (new_adag, lower, new_paths, True)
+
+    # Compute congestion probability Pc
+    congProb = computeCongProb(pc, context.algorithm, new_adag, new_paths, context.flow_sizes)
+
+    return (new_adag, congProb, new_paths, False)
+
+def congestionLowerBound(context, ri_dx_dag):
+    """Cheap lower bound on the congestion probability of a candidate
+    ri->dx DAG.
+
+    The new flow is placed first in every allocation, so it congests
+    by itself in all allocations in which it takes a path with an edge
+    whose virtual capacity minus the flow size goes below mincap. The
+    fraction of such paths among those of the candidate is thus a
+    lower bound on its Pc.
+    """
+    paths = daglib.getAllPathsLim(ri_dx_dag, context.ingress_routers[0], context.egress_router, 0)
+    if paths == []:
+        return 0.0
+
+    full_edges = context.full_edges
+    congested_paths = [p for p in paths if full_edges[context.graph.edgeIds(p)].any()]
+    return len(congested_paths)/float(len(paths))
+
+def recomputeAllSourcesDag(all_dag, new_ridx_dag):
+    """Given the initial all_routers_dag, and the new chosen ridxDag, we
+    compute the newly created all_routers_dag merging the previous
+    one while forcing the new ridxDag.
+    """
+    # Add 'flag' in new ridx dag
+    edges = new_ridx_dag.edges()
+    ridx_dag = nx.DiGraph()
+    ridx_dag.add_edges_from(edges, flag=True)
+
+    # Compose it with all_dag
+    new_adag = nx.compose(all_dag, ridx_dag)
+
+    # Iterate new ridx nodes. Remove those outgoing edges from the
+    # same node in all_dag that do not have 'flag'.
+    final_all_dag = new_adag.copy()
+
+    # Get edges to remove
+    edges_to_remove = [(x, y) for node in new_ridx_dag.nodes() for
+                       (x, y, data) in new_adag.edges(data=True)
+                       if node == x and not data.get('flag')]
+
+    # Remove them
+    final_all_dag.remove_edges_from(edges_to_remove)
+
+    # Return modified all_dag
+    return final_all_dag
+
+def addVirtualCapacities(all_dag, graph, virtual_caps):
+    """Adds the virtual capacities to all sources dag. Virtual
+    capacities are those computed by: taking current capacities, and
+    adding back the flow sizes of the single-path allocated flows in
+    the corresponding edges.
+
+    :param graph: CSRGraph snapshot of the capacity graph
+    :param virtual_caps: array of virtual capacities by edge id of graph
+    """
+    edge_index = graph.edge_index
+    virtual_caps = virtual_caps.tolist()
+    mincaps = graph.attributes['mincap'].tolist()
+    for (x, y, data) in all_dag.edges(data=True):
+        e = edge_index[(x, y)]
+
+        # Update new virtual capacity in all_dag edge
+        data['capacity'] = virtual_caps[e]
+        data['mincap'] = mincaps[e]
+
+        # Remove flag
+        if 'flag' in data.keys():
+            data.pop('flag')
+
+    return all_dag
+
+def computeNewPaths(new_adag, ingress_routers, egress_router):
+    """Returns the list of possible paths of each flow in the new
+    all-sources dag, ordered as ingress_routers.
+    """
+    return [daglib.getAllPathsLim(new_adag, ir, egress_router, 0) for ir in ingress_routers]
+
+def computeCongProb(pc, algorithm, all_dag, flow_paths, flow_sizes):
+    """
+    :param algorithm: name of the algorithm to compute the probability with.
+    :param all_dag: all routers dag with virtual capacities
+    :param flow_paths: list of possible paths of each flow
+    :param flow_sizes: list of flow sizes
+    """
+    method = getattr(pc, CONG_PROB_ALGORITHMS[algorithm])
+    return method(all_dag, flow_paths, flow_sizes)
+
+# Functions run by the worker processes ######################
+
+def _initWorker(dump_filename):
+    global _worker_pc
+    _worker_pc = ProbabiliyCalculator(dump_filename=dump_filename)
+
+def _evaluateChunk(task):
+    (context, indexed_dags, threshold) = task
+    (results, n_skipped) = _evaluateIndexedDags(context, indexed_dags, _worker_pc, threshold)
+    # Ship back the partial minimums only
+    return (_minimumResults(results), n_skipped)
+
+def _evaluateIndexedDags(context, indexed_dags, pc, threshold=None):
+    results = []
+    n_skipped = 0
+    for (index, ri_dx_dag) in indexed_dags:
+        (new_adag, congProb, new_paths, skipped) = evaluateCandidate(context, ri_dx_dag, pc, threshold)
+        results.append((index, new_adag, congProb, new_paths))
+        n_skipped += int(skipped)
+    return (results, n_skipped)
+
+def _minimumResults(results):
+    if results == []:
+        return []
+    min_congProb = min([r[2] for r in results])
+    return [r for r in results if r[2] == min_congProb]
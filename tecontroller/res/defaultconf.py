@@ -61,23 +61,108 @@ LBC_InitialWaitingTime = 20
 TG_InitialWaitingTime = 30
 FeedbackThreadWaitingTime = Hosts_InitialWaitingTime
 
+# The feedback thread considers that a flow goes through a router if
+# it has been captured there in the last FeedbackFlowWindow seconds
+FeedbackFlowWindow = 3
+
 # Default port for which IPERF server is listening in the custom hosts
 Hosts_DefaultIperfPort = '5001'
 
 # Log folder for the hosts
 Hosts_LogFolder = PPATH + "logs/"
 
-# Log file for linksmonitor
+# Log file for linksmonitor, and its format: binary or text (see
+# linkmonitor/loadlog.py)
 LinksMonitor_LogFile = PPATH + "logs/links.log"
+LinksMonitor_LogFormat = 'binary'
+
+# Number of samples of link utilization kept in memory by the links
+# monitor thread (one per poll cycle, or per LM_TelemetryInterval with
+# push-based telemetry)
+LM_HistorySamples = 600
+
+# Filter applied by the links monitor thread to the capacity read-outs
+# (none, doublereadout, median, ewma or kalman, see
+# linkmonitor/capfilters.py), and its parameters
+LM_CapacityFilter = 'doublereadout'
+LM_CapacityFilterArgs = {}
+
+# Adaptive polling of the links monitor thread: routers are polled
+# between every LM_MinPollInterval and LM_MaxPollInterval seconds, more
+# often the closer their links are to LM_HotUtilization (fraction of
+# bandwidth) or the faster it changes (LM_HotChange per second), with
+# at most LM_PollBudget polls per second in total (None: no limit).
+# snmpd caches the interface tables for at least 1 second, so polling
+# faster than that doesn't give fresher read-outs. Off by default: the
+# read-outs of cold links get up to LM_MaxPollInterval seconds old,
+# instead of the fixed 1.01 seconds of the monitor
+LM_AdaptivePolling = False
+LM_MinPollInterval = 1.01
+LM_MaxPollInterval = 8.0
+LM_PollBudget = None
+LM_HotUtilization = 0.8
+LM_HotChange = 0.1
+
+# Push-based telemetry: instead of being polled via SNMP, the routers
+# send their interface counters to the links monitor every
+# LM_TelemetryInterval seconds, in UDP datagrams to LM_TelemetryPort
+# (see linkmonitor/telemetry.py)
+LM_PushTelemetry = False
+LM_TelemetryPort = 5100
+LM_TelemetryInterval = 0.5
 
 ## SNMP commands
 # Start agent
 START_SNMP_AGENT = '/usr/sbin/snmpd'
 SNMP_CommunityString = 'linkmonitor'
 
+# Read the router counters through an in-process SNMP session (64-bit
+# counters, GETBULK) instead of calling the snmp command line tools,
+# and timeout (in seconds), retries and max-repetitions of its requests
+SNMP_InProcess = True
+SNMP_Timeout = 0.5
+SNMP_Retries = 2
+SNMP_MaxRepetitions = 16
+
 # Marshal filename for the probability calculator object
 MarshalFile = RES_Path +'dictionarydump.marshal'
 
 # Path where the .cap files of the routers are saved
 CAP_Path = PPATH + "logs/"
 
+# Format of the router captures: 'pcap' (binary, <rid>.pcap, only the
+# first CAP_Snaplen bytes of each packet) or 'text' (tcpdump output,
+# <rid>.cap). 84 bytes hold the longest cooked, IPv4 and port headers
+CAP_Format = 'pcap'
+CAP_Snaplen = 84
+
+
+# Number of worker processes used by TEControllerLab2 to evaluate the
+# candidate DAGs in parallel (1 evaluates them in-process)
+LBC_CandidateWorkers = 1
+
+# Maximum time (in seconds) that TEControllerLab2 spends searching
+# candidate DAGs for each allocation decision (None means no limit)
+LBC_DecisionTimeBudget = 5.0
+
+# Number of candidate DAGs that TEControllerLab2 draws at random for
+# each allocation decision (0 enumerates all of them)
+LBC_CandidateSamples = 0
+
+# Seed of the random candidate DAG sampler of TEControllerLab2 (None
+# seeds it from the system)
+LBC_SamplingSeed = None
+
+# Maximum number of paths of the random candidate DAGs drawn by
+# TEControllerLab2 when multiple path DAGs are considered
+LBC_SamplerMaxPaths = 4
+
+# Maximum number of ingress->egress paths for which TEControllerLab2
+# enumerates all candidate DAGs (one per subset of paths). Above it,
+# LBC_FallbackCandidateSamples candidates are drawn at random instead
+LBC_MaxEnumeratedPaths = 12
+LBC_FallbackCandidateSamples = 200
+
+# Time budget (in seconds) of a single congestion probability
+# computation, used to choose the algorithm when none is given
+LBC_PcTimeBudget = 0.1
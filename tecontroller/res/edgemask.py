@@ -0,0 +1,62 @@
+"""Module that implements the representation of sets of edges (paths,
+path lists, edges occupied by the flows of a prefix) as integer
+bitmasks.
+
+Edges are interned to bit positions the first time they are seen, so
+that checking whether two sets of edges overlap is a single AND, and
+the union of the edges of several paths is an OR.
+"""
+import threading
+
+class EdgeInterner(object):
+    """Assigns a bit to each edge, and computes the bitmasks of paths.
+
+    If undirected is True, edges (x, y) and (y, x) share the same bit.
+    """
+    def __init__(self, undirected=False):
+        self.undirected = undirected
+
+        # {edge: bit position}
+        self.index = {}
+
+        # Masks of the paths seen so far: {tuple(path): mask}
+        self.path_masks = {}
+
+        # Bits may be assigned from several threads
+        self.lock = threading.Lock()
+
+    def edgeMask(self, edge):
+        """Returns the mask with the bit of edge"""
+        key = self._key(edge)
+        position = self.index.get(key)
+        if position is None:
+            with self.lock:
+                position = self.index.get(key)
+                if position is None:
+                    position = len(self.index)
+                    self.index[key] = position
+        return 1 << position
+
+    def pathMask(self, path):
+        """Returns the mask of the edges of a path (list of nodes)"""
+        path = tuple(path)
+        mask = self.path_masks.get(path)
+        if mask is None:
+            mask = 0
+            for edge in zip(path[:-1], path[1:]):
+                mask |= self.edgeMask(edge)
+            self.path_masks[path] = mask
+        return mask
+
+    def pathListMask(self, path_list):
+        """Returns the mask of the edges of all paths in path_list"""
+        mask = 0
+        for path in path_list:
+            mask |= self.pathMask(path)
+        return mask
+
+    def _key(self, edge):
+        (x, y) = edge
+        if self.undirected and y < x:
+            return (y, x)
+        return (x, y)
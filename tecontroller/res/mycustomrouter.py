@@ -1,5 +1,6 @@
 """Subclasses IPRouter in order to spawn the SNMP Agent processes by
-default in the mininet routers.
+default in the mininet routers (and the telemetry agents, if counters
+are pushed to the links monitor).
 """
 from fibbingnode.misc.mininetlib.iprouter import IPRouter
 from tecontroller.res import defaultconf as dconf
@@ -26,6 +27,17 @@ class MyCustomRouter(IPRouter):
         super(MyCustomRouter, self).start()
 
         # Call separate thread
-        router_filename = dconf.CAP_Path+self.feedback_id+'.cap'
-        router_file = open(router_filename, 'w')
-        p = self.popen(['tcpdump', '-n', '(udp','and','not','port','161)', '-i', 'any'], stdout=router_file, stderr=PIPE)
+        capture_filter = ['(udp','and','not','port','161','and','not','port', str(dconf.LM_TelemetryPort)+')']
+        if dconf.CAP_Format == 'pcap':
+            # Packet headers only, written as soon as they are captured
+            router_filename = dconf.CAP_Path+self.feedback_id+'.pcap'
+            p = self.popen(['tcpdump', '-n', '-U', '-s', str(dconf.CAP_Snaplen), '-w', router_filename] +
+                           capture_filter + ['-i', 'any'], stderr=PIPE)
+        else:
+            router_filename = dconf.CAP_Path+self.feedback_id+'.cap'
+            router_file = open(router_filename, 'w')
+            p = self.popen(['tcpdump', '-n'] + capture_filter + ['-i', 'any'], stdout=router_file, stderr=PIPE)
+
+        # Push the interface counters to the links monitor
+        if dconf.LM_PushTelemetry:
+            self.popen([dconf.LM_Path+'telemetry_agent.py', self.feedback_id], stdout=PIPE, stderr=PIPE)
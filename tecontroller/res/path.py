@@ -2,12 +2,16 @@
 This module implements the Path object class
 """
 
+from tecontroller.res.edgemask import EdgeInterner
 import ipaddress as ip
 
 class Path(object):
     """Implements the abstract path object representing the between nodes
     in a (general) network.
     """
+    # Undirected edge bits shared by all paths
+    edge_bits = EdgeInterner(undirected=True)
+
     def __init__(self, route=[], edges={}):
 
         self.route = route #Ordered list of nodes in the path. Nodes
@@ -19,6 +23,9 @@ class Path(object):
         self.src = self._setSrc(route)
         self.dst = self._setDst(route)
 
+        # Bitmask of the (undirected) edges, computed on demand
+        self.edge_mask = None
+
 
     def __setitem__(self, key, value):
         if key not in ['route','edges']:
@@ -29,6 +36,7 @@ class Path(object):
             self.dst = self._setDst(value)
         else: #'edges'
             self.edges = value
+            self.edge_mask = None
             
     def __getitem__(self, key):
         if key not in ['src','dst','route','edges']:
@@ -66,24 +74,34 @@ class Path(object):
         S = "[%s -> %s]: "
         return S%(self.src, self.dst)+str(self.route)
 
+    def getEdgeMask(self):
+        """Returns the bitmask of the edges of the path, in any
+        direction. Edges must be set through path['edges'] for it to
+        be updated.
+        """
+        if self.edge_mask is None:
+            mask = 0
+            for edge in self.edges.iterkeys():
+                mask |= self.edge_bits.edgeMask(edge)
+            self.edge_mask = mask
+        return self.edge_mask
+
     def coincidentPaths(self, other):
         """Checks if two paths coincede in some edge along their
         routes. Returns true if they do.
 
         """
-        result = [True for ((a,b), data) in self.iter_edges() if
-                   (a,b) in other.getEdges().keys() or (b,a) in
-                   other.getEdges().keys()]
-        return result != []
+        return (self.getEdgeMask() & other.getEdgeMask()) != 0
 
     def getCoincidentEdges(self, other):
         """Given two paths, returns the edge information of those edges
         present in both paths. Returns empty dictionary otherwise.
 
         """
+        if not self.coincidentPaths(other):
+            return {}
         result = {(a,b): data for ((a, b), data) in self.iter_edges() if
-                   (a,b) in other.getEdges().keys() or (b,a) in
-                   other.getEdges().keys()}
+                   (a,b) in other.edges or (b,a) in other.edges}
         return result
                 
     def getEdgeInfo(self, x, y):
@@ -0,0 +1,87 @@
+"""Module that implements the enumeration of all loop-free paths between
+two nodes of a graph (or DAG).
+
+Paths are enumerated iteratively with an explicit stack, so that long
+paths do not hit the recursion limit, and are generated lazily: they
+can be consumed one at a time, or capped with max_paths. Nodes in the
+current path are tracked with an integer bitmask.
+
+Paths are generated in the same order as the recursive versions that
+this module replaces: depth-first, visiting the neighbours of each
+node in the order given by graph[node].
+"""
+
+def iterAllPaths(graph, start, end, max_hops=0, max_metric=0, metric_key='metric', max_paths=0):
+    """Generator of all loop-free paths from start to end, as lists of
+    nodes.
+
+    :param max_hops: if not 0, only paths with at most max_hops edges
+                     are generated.
+
+    :param max_metric: if not 0, only paths whose total metric (sum of
+                       graph[x][y][metric_key]) is at most max_metric
+                       are generated. Metrics are assumed positive.
+
+    :param max_paths: if not 0, stop after generating max_paths paths.
+    """
+    if start == end:
+        yield [start]
+        return
+
+    if start not in graph:
+        return
+
+    # Bit of each node in the visited-set bitmask
+    bits = dict((node, 1 << i) for (i, node) in enumerate(graph))
+
+    path = [start]
+    lengths = [0]
+    visited = bits[start]
+    neighbours = [iter(graph[start])]
+    n_paths = 0
+    while neighbours:
+        for node in neighbours[-1]:
+            bit = bits[node]
+            if visited & bit:
+                # Ommiting loops here
+                continue
+
+            # Check metric limit (the hop limit is checked before
+            # going deeper)
+            if max_metric:
+                length = lengths[-1] + graph[path[-1]][node][metric_key]
+                if length > max_metric:
+                    continue
+            else:
+                length = 0
+
+            if node == end:
+                # Arrived to the end
+                yield path + [node]
+                n_paths += 1
+                if max_paths and n_paths >= max_paths:
+                    return
+                continue
+
+            # Paths through node would exceed the hop limit
+            if max_hops and len(path) >= max_hops:
+                continue
+
+            # Go deeper: the for loop starts over with the
+            # neighbours of node
+            path.append(node)
+            lengths.append(length)
+            visited |= bit
+            neighbours.append(iter(graph[node]))
+            break
+        else:
+            # All neighbours explored: go back
+            neighbours.pop()
+            lengths.pop()
+            visited ^= bits[path.pop()]
+
+def getAllPaths(graph, start, end, max_hops=0, max_metric=0, metric_key='metric', max_paths=0):
+    """Returns the list of all loop-free paths from start to end. See
+    iterAllPaths for the meaning of the arguments.
+    """
+    return list(iterAllPaths(graph, start, end, max_hops, max_metric, metric_key, max_paths))
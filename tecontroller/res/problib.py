@@ -2,9 +2,11 @@
 probabilities when activating ECMP in a routers of a network. 
 """
 from tecontroller.res import defaultconf as dconf
+from tecontroller.res import pathenum
 from scipy.misc import comb, factorial
 import itertools as it
 import numpy as np
+import networkx as nx
 import marshal
 import random
 import time
@@ -108,6 +110,51 @@ class ProbabiliyCalculator(object):
                 
         return congestion_samples/float(total_samples)
 
+    def DecomposedCongestionProbability(self, all_dag, flow_paths, flow_sizes):
+        """Same result as ExactCongestionProbability, but computed from the
+        distribution of edge load vectors, which is built by convolving
+        flows one at a time (see IncrementalCongestionProbability).
+        Allocations that load the edges equally are thus evaluated only
+        once.
+        """
+        flows = dict(enumerate(zip(flow_sizes, flow_paths)))
+        ipc = IncrementalCongestionProbability.fromAllocation(sorted(all_dag.edges()), flows)
+        return ipc.congestionProbability(all_dag)
+
+    def SampledAllocationsCongestionProbability(self, all_dag, flow_paths, flow_sizes, n_samples=1000):
+        """Estimates ExactCongestionProbability from n_samples allocations
+        drawn uniformly at random (each flow takes one of its paths),
+        evaluated at once in vectorized form.
+        """
+        if [] in flow_paths:
+            return 0.0
+
+        edge_index = {}
+        for path_list in flow_paths:
+            for path in path_list:
+                for edge in zip(path[:-1], path[1:]):
+                    edge_index.setdefault(edge, len(edge_index))
+        if edge_index == {}:
+            return 0.0
+
+        caps = np.zeros(len(edge_index))
+        mincaps = np.zeros(len(edge_index))
+        for (x, y), i in edge_index.iteritems():
+            caps[i] = all_dag[x][y]['capacity']
+            mincaps[i] = all_dag[x][y]['mincap']
+
+        # Load of the sampled allocations: (n_samples x edges)
+        loads = np.zeros((n_samples, len(edge_index)))
+        for (path_list, size) in zip(flow_paths, flow_sizes):
+            vectors = np.zeros((len(path_list), len(edge_index)))
+            for p, path in enumerate(path_list):
+                for edge in zip(path[:-1], path[1:]):
+                    vectors[p, edge_index[edge]] += size
+            loads += vectors[np.random.randint(len(path_list), size=n_samples)]
+
+        congested = ((loads > 0) & (caps - loads < mincaps)).any(axis=1)
+        return float(congested.mean())
+
     def SampledCongestionProbability(self, m, n, percentage=10, estimate=0):
         """
         In this case, m is a list of paths available capacities : [c1, c2, ...]
@@ -174,21 +221,326 @@ class ProbabiliyCalculator(object):
     def flowCongestionProbability(self, dag, ingress_router, egress_router, flow_size):
         """We assume DAG edges incorporate the available capacities:
         dag[x][y] is a dictionary with a 'capacity' key.
+
+        Returns the probability that a single flow of flow_size,
+        splitting uniformly at each node of the DAG, takes a path with
+        an edge whose capacity is lower than flow_size.
+        """
+        return self.flowCongestionProbabilities(dag, ingress_router, egress_router, [flow_size])[0]
+
+    def flowCongestionProbabilities(self, dag, ingress_router, egress_router, flow_sizes):
+        """Vectorized version of flowCongestionProbability: returns a numpy
+        array with the congestion probability of each of the flow_sizes.
+
+        Instead of enumerating all paths, arrival probabilities are
+        propagated along the DAG in topological order, in O(E):
+
+         * reach[v]: probability that the flow goes through v.
+         * clean[v, i]: probability that the flow goes through v
+           having crossed only edges with capacity >= flow_sizes[i].
+
+        The congestion probability is then the probability mass that
+        reaches the egress router through some congested edge:
+        reach[egress] - clean[egress].
         """
+        flow_sizes = np.asarray(flow_sizes, dtype=float)
+        if ingress_router == egress_router or ingress_router not in dag:
+            return np.zeros(len(flow_sizes))
+
+        # Paths of a DAG with cycles must be enumerated
+        if not nx.is_directed_acyclic_graph(dag):
+            return self._enumeratedFlowCongestionProbabilities(dag, ingress_router, egress_router, flow_sizes)
+
+        reach = {ingress_router: 1.0}
+        clean = {ingress_router: np.ones(len(flow_sizes))}
+        for node in nx.topological_sort(dag):
+            # Paths end at the egress router (or at dead ends)
+            if node not in reach or node == egress_router or len(dag[node]) == 0:
+                continue
+
+            # Flow splits uniformly among the children
+            share = reach[node]/float(len(dag[node]))
+            clean_share = clean[node]/float(len(dag[node]))
+            for child in dag[node]:
+                reach[child] = reach.get(child, 0.0) + share
+                not_congested = dag[node][child]['capacity'] >= flow_sizes
+                to_add = np.where(not_congested, clean_share, 0.0)
+                if child in clean:
+                    clean[child] = clean[child] + to_add
+                else:
+                    clean[child] = to_add
+
+        if egress_router not in reach:
+            return np.zeros(len(flow_sizes))
+        return reach[egress_router] - clean[egress_router]
+
+    def _enumeratedFlowCongestionProbabilities(self, dag, ingress_router, egress_router, flow_sizes):
         # Calculate all possible paths
         all_paths = getAllPathsLimDAG(dag, ingress_router, egress_router, 0)
 
-        # Get those who own links that create congestion
-        paths_congestion = [path for path in all_paths if getMinCapacity(dag, path) < flow_size]
+        congestion_probabilities = np.zeros(len(flow_sizes))
+        for path in all_paths:
+            # Add the probability of the path to the congestion
+            # probability of the flow sizes it can't allocate
+            congested = getMinCapacity(dag, path) < flow_sizes
+            congestion_probabilities += congested*self.getPathProbability(dag, path)
 
-        congestion_probability = 0
-        # Iterate those paths
-        for path in paths_congestion:
-            # Compute the probability of each of these paths to happen
-            # Add it to the total congestion probability (union)
-            congestion_probability += self.getPathProbability(dag, path)
-            
-        return congestion_probability
+        return congestion_probabilities
+
+
+class IncrementalCongestionProbability(object):
+    """Keeps the distribution of edge loads of the flows allocated to a
+    destination prefix, over all their possible path allocations:
+
+      {(load_e1, load_e2, ...): number of allocations}
+
+    The congestion probability computed from it is the same as the one
+    given by ProbabiliyCalculator.ExactCongestionProbability, but the
+    distribution is updated by convolution when a flow arrives and by
+    de-convolution when it expires, instead of enumerating the product
+    of all flow paths at every decision.
+
+    The distribution does not depend on the link capacities, so only a
+    change of the DAG edges requires a full recompute.
+    """
+    def __init__(self):
+        # Edges of the DAG and their index in the load vectors
+        self.edge_list = []
+        self.edge_index = {}
+
+        # Tracked flows: {flow: (size, path_list)}
+        self.flows = {}
+
+        # Distribution of the load vectors and total allocations
+        self.loads = {(): 1}
+        self.total = 1
+
+        # Counters of full recomputes and incremental updates
+        self.n_recomputes = 0
+        self.n_updates = 0
+
+    @classmethod
+    def fromAllocation(cls, edge_list, flows):
+        """Returns the state of flows {flow: (size, path_list)} over the
+        edges in edge_list, built from scratch. No recompute is
+        counted.
+        """
+        ipc = cls()
+        ipc._reset(edge_list, flows)
+        return ipc
+
+    def sync(self, dag, allocated_flows):
+        """Brings the state up to date with the current DAG and list of
+        allocated flows [(flow, path_list)].
+
+        Changed flows are removed and added incrementally. The state is
+        fully recomputed if the DAG edges changed, or if more flows
+        changed than remain unchanged.
+        """
+        current = {f: (f.size, pl) for (f, pl) in allocated_flows}
+        edge_list = sorted(dag.edges())
+
+        if edge_list != self.edge_list:
+            self._recompute(edge_list, current)
+            return
+
+        removed = [f for f in self.flows.keys() if current.get(f) != self.flows[f]]
+        added = [f for f in current.keys() if self.flows.get(f) != current[f]]
+        if len(removed) + len(added) > len(current) - len(added):
+            self._recompute(edge_list, current)
+            return
+
+        for f in removed:
+            self._removeFlow(f)
+        for f in added:
+            (size, path_list) = current[f]
+            self._addFlow(f, size, path_list)
+        if removed != [] or added != []:
+            self.n_updates += 1
+
+    def congestionProbability(self, dag, flow_size=None, flow_paths=None):
+        """Returns the congestion probability of the tracked flows plus,
+        if given, a new flow of flow_size that can take any path in
+        flow_paths. DAG edges must incorporate the 'capacity' and
+        'mincap' keys.
+        """
+        caps = [dag[x][y]['capacity'] for (x, y) in self.edge_list]
+        mincaps = [dag[x][y]['mincap'] for (x, y) in self.edge_list]
+
+        if flow_paths:
+            path_edges = [self._pathIndexes(path) for path in flow_paths]
+        else:
+            path_edges = [[]]
+            flow_size = 0
+
+        congested = 0
+        for (loads, count) in self.loads.iteritems():
+            # Already congested without new flow?
+            if self._isCongested(loads, caps, mincaps):
+                congested += count*len(path_edges)
+                continue
+
+            for indexes in path_edges:
+                for i in indexes:
+                    if caps[i] - loads[i] - flow_size < mincaps[i]:
+                        congested += count
+                        break
+
+        return congested/float(self.total*len(path_edges))
+
+    def _isCongested(self, loads, caps, mincaps):
+        for i, load in enumerate(loads):
+            if load > 0 and caps[i] - load < mincaps[i]:
+                return True
+        return False
+
+    def _recompute(self, edge_list, current):
+        self._reset(edge_list, current)
+        self.n_recomputes += 1
+
+    def _reset(self, edge_list, current):
+        self.edge_list = edge_list
+        self.edge_index = {edge: i for i, edge in enumerate(edge_list)}
+        self.flows = {}
+        self.loads = {tuple([0]*len(edge_list)): 1}
+        self.total = 1
+        for f, (size, path_list) in current.iteritems():
+            self._addFlow(f, size, path_list)
+
+    def _pathIndexes(self, path):
+        return [self.edge_index[(x, y)] for (x, y) in zip(path[:-1], path[1:])]
+
+    def _pathVectors(self, size, path_list):
+        vectors = []
+        for path in path_list:
+            vector = [0]*len(self.edge_list)
+            for i in self._pathIndexes(path):
+                vector[i] += size
+            vectors.append(tuple(vector))
+        return vectors
+
+    def _addFlow(self, flow, size, path_list):
+        """Convolves the load distribution with the flow paths"""
+        vectors = self._pathVectors(size, path_list)
+        new_loads = {}
+        for (loads, count) in self.loads.iteritems():
+            for vector in vectors:
+                key = tuple([a + b for (a, b) in zip(loads, vector)])
+                new_loads[key] = new_loads.get(key, 0) + count
+        self.loads = new_loads
+        self.total *= len(vectors)
+        self.flows[flow] = (size, path_list)
+
+    def _removeFlow(self, flow):
+        """De-convolves the load distribution from the flow paths.
+
+        Let v0 be the lexicographically smallest path vector, and m(v)
+        the number of paths with vector v. Then:
+
+          old(y) = (new(y + v0) - sum(m(v)*old(y + v0 - v)))/m(v0)
+
+        for the rest of path vectors v. Since y + v0 - v is
+        lexicographically smaller than y, old() can be computed in
+        increasing lexicographic order.
+        """
+        (size, path_list) = self.flows.pop(flow)
+
+        # Path vectors and their multiplicity
+        multiplicity = {}
+        for vector in self._pathVectors(size, path_list):
+            multiplicity[vector] = multiplicity.get(vector, 0) + 1
+        vectors = sorted(multiplicity.keys())
+        v0 = vectors[0]
+        others = vectors[1:]
+
+        candidates = []
+        for loads in self.loads.iterkeys():
+            y = tuple([a - b for (a, b) in zip(loads, v0)])
+            if min(y) >= 0:
+                candidates.append(y)
+        candidates.sort()
+
+        old_loads = {}
+        for y in candidates:
+            count = self.loads[tuple([a + b for (a, b) in zip(y, v0)])]
+            for v in others:
+                key = tuple([a + b - c for (a, b, c) in zip(y, v0, v)])
+                count -= multiplicity[v]*old_loads.get(key, 0)
+            count /= multiplicity[v0]
+            if count > 0:
+                old_loads[y] = count
+
+        self.loads = old_loads
+        self.total /= len(path_list)
+
+
+class CongestionCostEstimator(object):
+    """Predicts the time each congestion probability algorithm would take
+    for a set of flows, from the number of possible paths of each flow,
+    and chooses the most accurate one that fits in a time budget:
+
+     * 'exact': enumerates the product of all flow paths.
+     * 'decomposed': convolves the flows one at a time over the
+       distinct edge load vectors (exact too).
+     * 'sampled': evaluates a fixed number of random allocations.
+
+    Unit costs are the seconds per unit of work of each algorithm.
+    """
+    def __init__(self, exact_unit=4e-5, decomposed_unit=8e-6, sampled_unit=2e-7, n_samples=1000):
+        self.exact_unit = exact_unit
+        self.decomposed_unit = decomposed_unit
+        self.sampled_unit = sampled_unit
+        self.n_samples = n_samples
+
+    def estimate(self, path_counts, groups=None):
+        """Returns a dictionary {algorithm: estimated seconds}.
+
+        :param path_counts: number of possible paths of each flow.
+
+        :param groups: optional hashable key of each flow, equal for
+                       flows of the same size that share the same
+                       possible paths. It makes the estimate of the
+                       number of distinct load vectors tighter.
+        """
+        n_flows = len(path_counts)
+        if groups is None:
+            groups = range(n_flows)
+
+        # Exact: each allocation walks the paths of all flows
+        exact_work = allocationProductSize(path_counts)*n_flows
+
+        # Decomposed: each flow is convolved with the load vectors
+        # distribution of the previous ones
+        decomposed_work = 0
+        product = 1
+        group_flows = {}
+        for (n_paths, group) in zip(path_counts, groups):
+            support = min(product, distinctLoadsBound(group_flows.values()))
+            decomposed_work += support*n_paths
+            product *= n_paths
+            (k, n) = group_flows.get(group, (0, n_paths))
+            group_flows[group] = (k + 1, n)
+
+        sampled_work = self.n_samples*n_flows
+
+        return {'exact': exact_work*self.exact_unit,
+                'decomposed': decomposed_work*self.decomposed_unit,
+                'sampled': sampled_work*self.sampled_unit}
+
+    def choose(self, path_counts, time_budget, groups=None):
+        """Returns the tuple (algorithm, estimated seconds) of the most
+        accurate algorithm expected to run within time_budget seconds
+        ('sampled' if none does).
+        """
+        estimates = self.estimate(path_counts, groups)
+        for algorithm in ['exact', 'decomposed']:
+            if estimates[algorithm] <= time_budget:
+                # The exact algorithms give the same result: take the
+                # fastest one
+                if estimates['decomposed'] < estimates[algorithm]:
+                    algorithm = 'decomposed'
+                return (algorithm, estimates[algorithm])
+        return ('sampled', estimates['sampled'])
 
 
 class Timer(object):
@@ -209,9 +561,9 @@ class Timer(object):
     
 # Useful functions not included in the object #################
 
-def getAllPathsLimDAG(dag, start, end, k, path=[]):
-    """Recursive function that finds all paths from start node to end node
-    with maximum length of k.
+def getAllPathsLimDAG(dag, start, end, k):
+    """Finds all paths from start node to end node with maximum length
+    of k.
     
     If the function is called with k=0, returns all existing
     loopless paths between start and end nodes.
@@ -227,29 +579,48 @@ def getAllPathsLimDAG(dag, start, end, k, path=[]):
     since the dags do not have weights).
     
     """
-    # Accumulate nodes in path
-    path = path + [start]
-    
+    return pathenum.getAllPaths(dag, start, end, max_hops=k)
+
+def countPaths(dag, start, end):
+    """Returns the number of loop-free paths from start to end, computed
+    by dynamic programming over the DAG in topological order (or by
+    enumerating them if the graph has cycles).
+    """
     if start == end:
-        # Arrived to the end. Go back returning everything
-        return [path]
-        
-    if not start in dag:
-        return []
-
-    paths = []
-    for node in dag[start]:
-        if node not in path: # Ommiting loops here
-            if k == 0:
-                # If we do not want any length limit
-                newpaths = getAllPathsLimDAG(dag, node, end, k, path=path)
-                for newpath in newpaths:
-                    paths.append(newpath)
-            elif len(path) < k+1:
-                newpaths = getAllPathsLimDAG(dag, node, end, k, path=path)
-                for newpath in newpaths:
-                    paths.append(newpath)
-    return paths
+        return 1
+    if start not in dag or end not in dag:
+        return 0
+    if not nx.is_directed_acyclic_graph(dag):
+        return len(getAllPathsLimDAG(dag, start, end, 0))
+
+    counts = {start: 1}
+    for node in nx.topological_sort(dag):
+        if node not in counts or node == end:
+            continue
+        for child in dag[node]:
+            counts[child] = counts.get(child, 0) + counts[node]
+    return counts.get(end, 0)
+
+def allocationProductSize(path_counts):
+    """Number of allocations enumerated by ExactCongestionProbability:
+    the product of the number of possible paths of each flow.
+    """
+    size = 1
+    for n_paths in path_counts:
+        size *= n_paths
+    return size
+
+def distinctLoadsBound(group_flows):
+    """Upper bound on the number of distinct edge load vectors of a set
+    of flows, given as a list of (k, n) tuples: k flows of the same size
+    sharing the same n possible paths. The load vector only depends on
+    how many flows of each group take each path: a multiset of k out
+    of n paths.
+    """
+    bound = 1
+    for (k, n) in group_flows:
+        bound *= comb(k + n - 1, k, exact=True)
+    return bound
 
 def getMinCapacity(dag, path):
     """
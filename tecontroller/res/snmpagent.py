@@ -0,0 +1,222 @@
+"""This module implements a local stand-in for the SNMP agents (snmpd)
+of the mininet routers, so that SnmpCounters and the links monitor can
+be exercised and benchmarked without a running network.
+
+Each SimulatedRouter listens on its own UDP port on localhost and
+serves the IF-MIB objects read by the links monitor (ifDescr, ifMtu,
+ifPhysAddress, ifOutOctets, ifHCOutOctets and ifHCInOctets). The octet
+counters of its interfaces grow as scripted: at a constant rate, or at
+piecewise constant rates given as a list of (time, rate) steps. They
+start at any value, so wrap-arounds of the 32 and 64-bit counters can
+be produced at will.
+
+The AgentSimulator serves all routers from a single thread, and can
+delay its responses (latency, plus a uniform random jitter) and drop
+requests (loss probability).
+
+    routers = [SimulatedRouter('r%d'%i, 4, rate=1e5) for i in range(8)]
+    simulator = AgentSimulator(routers, latency=0.01, loss=0.05)
+    simulator.start()
+    counters = SnmpSessionCounters('127.0.0.1', port=routers[0].port)
+"""
+from tecontroller.res import snmpsession as ss
+from tecontroller.res import defaultconf as dconf
+
+import threading
+import bisect
+import select
+import socket
+import random
+import heapq
+import time
+
+class SimulatedInterface(object):
+    """Interface whose octet counter grows rate bytes/s from
+    start_octets, since start_time.
+
+    :param rate: constant rate, or list of (time, rate) steps, where
+    time is relative to start_time and the rate is 0 before the first
+    step.
+    """
+    def __init__(self, index, name, rate=0, start_octets=0, start_time=None):
+        self.index = index
+        self.name = name
+        if isinstance(rate, (list, tuple)):
+            self.steps = sorted(rate)
+        else:
+            self.steps = [(0, rate)]
+        self.start_octets = start_octets
+        self.start_time = start_time or time.time()
+
+    def rate(self, t=None):
+        """Rate at time t (now by default)"""
+        if t is None:
+            t = time.time()
+        rate = 0
+        for (step_time, step_rate) in self.steps:
+            if step_time > t - self.start_time:
+                break
+            rate = step_rate
+        return rate
+
+    def octets(self, t=None):
+        """Octets sent since ever, at time t (now by default). Counters
+        wrap when they are served.
+        """
+        if t is None:
+            t = time.time()
+        elapsed = t - self.start_time
+        octets = 0.0
+        for (i, (step_time, step_rate)) in enumerate(self.steps):
+            if step_time >= elapsed:
+                break
+            if i + 1 < len(self.steps):
+                end_time = min(self.steps[i+1][0], elapsed)
+            else:
+                end_time = elapsed
+            octets += step_rate*(end_time - max(step_time, 0))
+        return self.start_octets + int(octets)
+
+    def meanRate(self, t0, t1):
+        """Mean rate (bytes/s) between times t0 and t1"""
+        return (self.octets(t1) - self.octets(t0))/float(t1 - t0)
+
+
+class SimulatedRouter(object):
+    """Router whose agent serves the loopback (ifIndex 1) and
+    n_interfaces interfaces called name-eth0, name-eth1... rate and
+    start_octets are those of all interfaces (see SimulatedInterface),
+    or lists with one value per interface.
+    """
+    def __init__(self, name, n_interfaces, rate=0, start_octets=0, community=dconf.SNMP_CommunityString):
+        self.name = name
+        self.community = community
+        start_time = time.time()
+
+        if not isinstance(rate, list):
+            rate = [rate]*n_interfaces
+        if not isinstance(start_octets, list):
+            start_octets = [start_octets]*n_interfaces
+        self.interfaces = [SimulatedInterface(1, 'lo', 0, 0, start_time)]
+        for i in range(n_interfaces):
+            self.interfaces.append(SimulatedInterface(i + 2, '%s-eth%d'%(name, i), rate[i],
+                                                      start_octets[i], start_time))
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+
+        # {oid: function returning (tag, value)}, and sorted oids
+        self.objects = {}
+        for iface in self.interfaces:
+            i = iface.index
+            mac = '\x00'*6 if i == 1 else '\x02\x00\x00\x00\x00' + chr(i % 256)
+            self.objects[ss.ifDescr + (i,)] = lambda iface=iface: (ss.OCTET_STRING, iface.name)
+            self.objects[ss.ifMtu + (i,)] = lambda: (ss.INTEGER, 1500)
+            self.objects[ss.ifPhysAddress + (i,)] = lambda mac=mac: (ss.OCTET_STRING, mac)
+            self.objects[ss.ifOutOctets + (i,)] = lambda iface=iface: (ss.COUNTER32, iface.octets() % 2**32)
+            self.objects[ss.ifHCOutOctets + (i,)] = lambda iface=iface: (ss.COUNTER64, iface.octets() % 2**64)
+            self.objects[ss.ifHCInOctets + (i,)] = lambda iface=iface: (ss.COUNTER64, iface.octets() % 2**64)
+        self.oids = sorted(self.objects.keys())
+
+    def __repr__(self):
+        return "SimulatedRouter(%s, port %d)"%(self.name, self.port)
+
+    def next(self, oid):
+        """Returns the first oid after oid, or None"""
+        position = bisect.bisect_right(self.oids, oid)
+        if position < len(self.oids):
+            return self.oids[position]
+
+    def respond(self, data):
+        """Returns the response to the request data (None if the
+        community is wrong). Raises SnmpError if it can't be decoded.
+        """
+        (version, community, pdu_type, request_id, non_rep, max_rep, varbinds) = ss.decodeMessage(data)
+        if community != self.community:
+            return
+        status = 0
+        index = 0
+        response = []
+        if pdu_type == ss.GET_BULK_REQUEST:
+            oids = [oid for (oid, tag, value) in varbinds]
+            for repetition in range(max_rep):
+                for (n, oid) in enumerate(oids):
+                    next_oid = self.next(oid)
+                    if next_oid is None:
+                        response.append((oid, ss.END_OF_MIB_VIEW, None))
+                    else:
+                        response.append((next_oid,) + self.objects[next_oid]())
+                        oids[n] = next_oid
+                if not [oid for oid in oids if self.next(oid)]:
+                    break
+        elif pdu_type in [ss.GET_REQUEST, ss.GET_NEXT_REQUEST]:
+            for (n, (oid, tag, value)) in enumerate(varbinds):
+                if pdu_type == ss.GET_NEXT_REQUEST:
+                    oid = self.next(oid)
+                if oid in self.objects:
+                    response.append((oid,) + self.objects[oid]())
+                elif version == ss.VERSION_1:
+                    # noSuchName
+                    (status, index) = (2, n + 1)
+                    response = varbinds
+                    break
+                else:
+                    response.append((varbinds[n][0], ss.END_OF_MIB_VIEW, None))
+        elif pdu_type == ss.SET_REQUEST:
+            # Cache timeouts are accepted and ignored
+            response = varbinds
+        return ss.encodeMessage(community, ss.GET_RESPONSE, request_id, response, status, index, version)
+
+
+class AgentSimulator(threading.Thread):
+    """Serves the agents of routers. Responses are sent latency seconds
+    (plus up to jitter seconds) after the request is received, and
+    requests are dropped with probability loss.
+    """
+    def __init__(self, routers, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        super(AgentSimulator, self).__init__()
+        self.daemon = True
+        self.routers = routers
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+
+        # Responses waiting to be sent: [(send time, n, router, data, address)]
+        self.pending = []
+        self.n_requests = 0
+        self.n_dropped = 0
+
+    def ports(self):
+        return {router.name: router.port for router in self.routers}
+
+    def run(self):
+        sockets = {router.sock: router for router in self.routers}
+        n = 0
+        while True:
+            timeout = None
+            if self.pending:
+                timeout = max(0, self.pending[0][0] - time.time())
+            (readable, _, _) = select.select(sockets.keys(), [], [], timeout)
+
+            for sock in readable:
+                (data, address) = sock.recvfrom(65535)
+                self.n_requests += 1
+                if self.loss and self.random.random() < self.loss:
+                    self.n_dropped += 1
+                    continue
+                router = sockets[sock]
+                try:
+                    response = router.respond(data)
+                except ss.SnmpError:
+                    continue
+                if response:
+                    delay = self.latency + self.jitter*self.random.random()
+                    n += 1
+                    heapq.heappush(self.pending, (time.time() + delay, n, router, response, address))
+
+            # Send the responses that are due
+            while self.pending and self.pending[0][0] <= time.time():
+                (_, _, router, response, address) = heapq.heappop(self.pending)
+                router.sock.sendto(response, address)
@@ -2,19 +2,23 @@
 with the SNMP data that we extract from the routers. Specifically,
 keeps track of the interface counters.
 
-TODO
-====
+Two implementations are provided:
 
- * The module should be rewritten to use pysnmp library instead of
-   calling the Linux snmp command line tools. 
+ * SnmpCounters calls the Linux snmp command line tools and reads the
+   32-bit ifOutOctets counters.
 
- * For the moment, using pysnmp library still pops up the following
-   error: https://sourceforge.net/p/pysnmp/mailman/message/34615777/
+ * SnmpSessionCounters keeps a persistent in-process session with the
+   router (see snmpsession.py), and reads the 64-bit ifHCOutOctets and
+   ifHCInOctets counters with GETBULK requests. It is used instead of
+   the pysnmp library, which pops up the following error:
+   https://sourceforge.net/p/pysnmp/mailman/message/34615777/
 
+In both cases, differences between read-outs take counter wrap-around
+into account.
 """
-from pysnmp.hlapi import *
 from tecontroller.res.flow import Base
 from tecontroller.res import defaultconf as dconf
+from tecontroller.res import snmpsession
 import subprocess
 import time
 import datetime
@@ -25,17 +29,34 @@ from fibbingnode.misc.mininetlib import get_logger
 time_info = False
 log = get_logger()
 
+def counterDiff(new_counters, old_counters, bits=32):
+    """Returns the increment of the counters between two read-outs (as
+    np.uint64 arrays), modulo 2**bits.
+    """
+    diff = np.asarray(new_counters, dtype=np.uint64) - np.asarray(old_counters, dtype=np.uint64)
+    if bits < 64:
+        diff &= np.uint64((1 << bits) - 1)
+    return diff
+
 class SnmpCounters(Base):
     def __init__(self, routerIp = "127.0.0.1", port = 161):
         super(SnmpCounters, self).__init__()
         self.routerIp = routerIp
         self.port = port
         self.setRefreshTimeToMinimum()
-        self.lastUpdated = 0
         self.interfaces = self.getInterfaces()
+        # Set when the interfaces are discovered after construction
+        self.interfacesChanged = False
+        self._resetCounters()
+
+    def _resetCounters(self):
+        """Starts over the counters of self.interfaces"""
+        self.lastUpdated = 0
         self.counters = np.array([0]*len(self.interfaces))
         self.timeDiff = 0
         self.countersDiff = np.array([0]*len(self.interfaces))
+        # Last raw octet counters read
+        self.octets = np.zeros(len(self.interfaces), dtype=np.uint64)
         
     def __repr__(self):
         return "SNMPCounter(%s)"%self.routerIp
@@ -149,24 +170,30 @@ class SnmpCounters(Base):
 
         # process snmpwalk output
         out_counters_t = [a.split(" = ")[1] for a in out.split('\n') if len(a.split(" = ")) == 2]
-        out_counters = np.asarray([int(a[a.index(':')+2:]) for a in out_counters_t if a][1:])
+        out_counters = np.asarray([int(a[a.index(':')+2:]) for a in out_counters_t if a][1:], dtype=np.uint64)
 
-        # Treated as np.arrays from here on
-        #total_counters = np.multiply((in_counters + out_counters), 8) # in bits
-        total_counters = np.multiply(out_counters, 8) # in bits
-                
         # update interfaces data structure
         updateTime = time.time()
-        self.timeDiff = updateTime - self.lastUpdated
-        self.countersDiff = total_counters - self.counters
-        self.counters = total_counters
+        self._setCounters(out_counters, updateTime, bits=32)
         
-        # Update last timestamp
-        self.lastUpdated = updateTime
-
         if time_info:
             log.info("snmplib.py: updateCounters32() took: %d seconds\n"%(time.time()-start))
 
+    def updateCounters(self):
+        self.updateCounters32()
+
+    def _setCounters(self, out_octets, updateTime, bits):
+        """Sets the new read-out of the ifOutOctets counters (of the given
+        size in bits), taken at updateTime.
+        """
+        # Treated as np.arrays from here on (in bits)
+        self.countersDiff = counterDiff(out_octets, self.octets, bits).astype(float)*8
+        self.octets = out_octets
+        self.counters = out_octets.astype(float)*8
+        self.timeDiff = updateTime - self.lastUpdated
+
+        # Update last timestamp
+        self.lastUpdated = updateTime
 
     def fromLastLecture(self):
         return time.time() - self.lastUpdated
@@ -187,3 +214,99 @@ class SnmpCounters(Base):
             return load[0]
         else:
             raise KeyError("iface_name: %s does not belong to any router interface"%iface_name)
+
+
+class SnmpSessionCounters(SnmpCounters):
+    """Keeps track of the interface counters of a router through a
+    persistent in-process SNMP session, reading the 64-bit counters with
+    GETBULK requests.
+    """
+    def __init__(self, routerIp = "127.0.0.1", port = 161,
+                 timeout = dconf.SNMP_Timeout, retries = dconf.SNMP_Retries):
+        self.session = snmpsession.SnmpSession(routerIp, port, dconf.SNMP_CommunityString,
+                                               timeout, retries)
+        super(SnmpSessionCounters, self).__init__(routerIp, port)
+
+    def __repr__(self):
+        return "SNMPSessionCounter(%s)"%self.routerIp
+
+    def _resetCounters(self):
+        super(SnmpSessionCounters, self)._resetCounters()
+        # Last raw ifHCInOctets counters read
+        self.inOctets = np.zeros(len(self.interfaces), dtype=np.uint64)
+        self.inOctetsDiff = np.zeros(len(self.interfaces), dtype=np.uint64)
+
+    def setRefreshTimeToMinimum(self):
+        for table in [snmpsession.ifTable, snmpsession.ifXTable]:
+            try:
+                self.session.set(snmpsession.nsCacheTimeout + table,
+                                 snmpsession.INTEGER, 1)
+            except snmpsession.SnmpError as e:
+                if time_info:
+                    log.info("snmplib.py: setRefreshTimeToMinimum() ERROR: %s\n"%(str(e)))
+
+    def getInterfaces(self):
+        """Same interfaces as SnmpCounters.getInterfaces: the first one (the
+        loopback) is left out.
+
+        If the router doesn't respond, no interfaces are returned, and
+        they are discovered on the next read-out (see updateCounters64).
+        """
+        start = time.time()
+        columns = [snmpsession.ifDescr, snmpsession.ifMtu, snmpsession.ifPhysAddress]
+        try:
+            (names, mtus, macs) = [dict(rows) for rows in
+                                   self.session.walkColumns(columns, dconf.SNMP_MaxRepetitions)]
+        except snmpsession.SnmpError as e:
+            log.info("snmplib.py: getInterfaces() of %s ERROR: %s. Retrying on next read-out\n"%(self.routerIp, str(e)))
+            return []
+
+        ifaces_dict = []
+        for index in sorted(macs.keys())[1:]:
+            mac = ':'.join(['%x'%ord(c) for c in macs[index]])
+            ifaces_dict.append({'number': '.'.join(map(str, index)), 'mac': mac,
+                                'name': names.get(index), 'mtu': mtus.get(index)})
+
+        if time_info:
+            log.info("snmplib.py: getInterfaces() took: %d seconds\n"%(time.time()-start))
+        return ifaces_dict
+
+    def updateCounters64(self):
+        """Reads the ifHCOutOctets and ifHCInOctets counters of all
+        interfaces with GETBULK requests.
+        """
+        start = time.time()
+        if not self.interfaces:
+            # Interfaces not discovered yet
+            self.interfaces = self.getInterfaces()
+            if not self.interfaces:
+                return
+            self._resetCounters()
+            self.interfacesChanged = True
+
+        columns = [snmpsession.ifHCOutOctets, snmpsession.ifHCInOctets]
+        try:
+            (out_rows, in_rows) = [dict(rows) for rows in
+                                   self.session.walkColumns(columns, dconf.SNMP_MaxRepetitions)]
+        except snmpsession.SnmpError as e:
+            if time_info:
+                log.info("snmplib.py: updateCounters64() ERROR: %s\n"%(str(e)))
+            return
+        updateTime = time.time()
+
+        indexes = [(int(data['number']),) for data in self.interfaces]
+        if [index for index in indexes if index not in out_rows or index not in in_rows]:
+            # Incomplete read-out
+            return
+        out_octets = np.asarray([out_rows[index] for index in indexes], dtype=np.uint64)
+        in_octets = np.asarray([in_rows[index] for index in indexes], dtype=np.uint64)
+
+        self._setCounters(out_octets, updateTime, bits=64)
+        self.inOctetsDiff = counterDiff(in_octets, self.inOctets, bits=64)
+        self.inOctets = in_octets
+
+        if time_info:
+            log.info("snmplib.py: updateCounters64() took: %d seconds\n"%(time.time()-start))
+
+    def updateCounters(self):
+        self.updateCounters64()
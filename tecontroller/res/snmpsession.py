@@ -0,0 +1,342 @@
+"""This module implements a minimal, in-process SNMPv2c client: a
+persistent UDP session with a router's agent, over which GET, SET and
+GETBULK requests are sent, with timeouts and retries.
+
+Messages are encoded and decoded here directly in BER, so that reading
+the counters of a router doesn't spawn any process nor parse the text
+output of the net-snmp command line tools.
+
+Only the subset of SNMP needed by the link monitor is supported:
+community-based messages with INTEGER, OCTET STRING, NULL, OBJECT
+IDENTIFIER, Counter32, Gauge32, TimeTicks and Counter64 values.
+"""
+import itertools
+import random
+import socket
+import time
+
+# SNMP versions
+VERSION_1 = 0
+VERSION_2C = 1
+
+# Value tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIMETICKS = 0x43
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+# PDU tags
+GET_REQUEST = 0xa0
+GET_NEXT_REQUEST = 0xa1
+GET_RESPONSE = 0xa2
+SET_REQUEST = 0xa3
+GET_BULK_REQUEST = 0xa5
+
+UNSIGNED_TAGS = (COUNTER32, GAUGE32, TIMETICKS, COUNTER64)
+EXCEPTION_TAGS = (NO_SUCH_OBJECT, NO_SUCH_INSTANCE, END_OF_MIB_VIEW)
+
+# IF-MIB objects
+ifDescr = (1, 3, 6, 1, 2, 1, 2, 2, 1, 2)
+ifMtu = (1, 3, 6, 1, 2, 1, 2, 2, 1, 4)
+ifPhysAddress = (1, 3, 6, 1, 2, 1, 2, 2, 1, 6)
+ifInOctets = (1, 3, 6, 1, 2, 1, 2, 2, 1, 10)
+ifOutOctets = (1, 3, 6, 1, 2, 1, 2, 2, 1, 16)
+ifHCInOctets = (1, 3, 6, 1, 2, 1, 31, 1, 1, 1, 6)
+ifHCOutOctets = (1, 3, 6, 1, 2, 1, 31, 1, 1, 1, 10)
+
+# NET-SNMP-AGENT-MIB::nsCacheTimeout, indexed by the (implied) OID
+# of the cached table
+nsCacheTimeout = (1, 3, 6, 1, 4, 1, 8072, 1, 5, 3, 1, 2)
+ifTable = (1, 3, 6, 1, 2, 1, 2, 2)
+ifXTable = (1, 3, 6, 1, 2, 1, 31, 1, 1)
+
+
+class SnmpError(Exception):
+    pass
+
+class SnmpTimeout(SnmpError):
+    pass
+
+
+def parseOid(oid):
+    """Accepts an OID as a tuple of integers or a dotted string"""
+    if isinstance(oid, basestring):
+        return tuple(int(arc) for arc in oid.strip('.').split('.'))
+    return tuple(oid)
+
+# BER encoding ##############################################
+
+def encodeLength(length):
+    if length < 0x80:
+        return chr(length)
+    s = ''
+    while length:
+        s = chr(length & 0xff) + s
+        length >>= 8
+    return chr(0x80 | len(s)) + s
+
+def encodeTLV(tag, content):
+    return chr(tag) + encodeLength(len(content)) + content
+
+def encodeInteger(value, tag=INTEGER):
+    """Two's complement, minimum number of octets. Unsigned tags get a
+    leading zero octet if needed.
+    """
+    s = ''
+    while True:
+        s = chr(value & 0xff) + s
+        value >>= 8
+        if (value == 0 and not ord(s[0]) & 0x80) or (value == -1 and ord(s[0]) & 0x80):
+            break
+    return encodeTLV(tag, s)
+
+def encodeOid(oid):
+    oid = parseOid(oid)
+    arcs = [40*oid[0] + oid[1]] + list(oid[2:])
+    s = ''
+    for arc in arcs:
+        chunk = chr(arc & 0x7f)
+        arc >>= 7
+        while arc:
+            chunk = chr(0x80 | (arc & 0x7f)) + chunk
+            arc >>= 7
+        s += chunk
+    return encodeTLV(OBJECT_IDENTIFIER, s)
+
+def encodeValue(tag, value):
+    if tag == INTEGER or tag in UNSIGNED_TAGS:
+        return encodeInteger(value, tag)
+    elif tag == OCTET_STRING:
+        return encodeTLV(tag, value)
+    elif tag == OBJECT_IDENTIFIER:
+        return encodeOid(value)
+    else:
+        # NULL and exceptions have no content
+        return encodeTLV(tag, '')
+
+def encodeMessage(community, pdu_type, request_id, varbinds, error_status=0, error_index=0, version=VERSION_2C):
+    """Returns the encoded message. varbinds is a list of (oid, tag,
+    value). In GETBULK requests, error_status and error_index are
+    non-repeaters and max-repetitions.
+    """
+    encoded_varbinds = ''.join([encodeTLV(SEQUENCE, encodeOid(oid) + encodeValue(tag, value))
+                                for (oid, tag, value) in varbinds])
+    pdu = encodeTLV(pdu_type, encodeInteger(request_id) + encodeInteger(error_status) +
+                    encodeInteger(error_index) + encodeTLV(SEQUENCE, encoded_varbinds))
+    return encodeTLV(SEQUENCE, encodeInteger(version) + encodeTLV(OCTET_STRING, community) + pdu)
+
+# BER decoding ##############################################
+
+def decodeTLV(data, offset):
+    """Returns the tuple (tag, start, end) of the element of the
+    bytearray data at offset: its content is data[start:end].
+    """
+    tag = data[offset]
+    length = data[offset+1]
+    offset += 2
+    if length & 0x80:
+        n = length & 0x7f
+        length = 0
+        for b in data[offset:offset+n]:
+            length = (length << 8) | b
+        offset += n
+    if offset + length > len(data):
+        raise SnmpError("Truncated message")
+    return (tag, offset, offset + length)
+
+def decodeInteger(data, start, end, signed=True):
+    value = 0
+    for b in data[start:end]:
+        value = (value << 8) | b
+    if signed and end > start and data[start] & 0x80:
+        value -= 1 << (8*(end - start))
+    return value
+
+def decodeOid(data, start, end):
+    arcs = []
+    arc = 0
+    for b in data[start:end]:
+        arc = (arc << 7) | (b & 0x7f)
+        if not b & 0x80:
+            arcs.append(arc)
+            arc = 0
+    if not arcs:
+        return ()
+    first = min(arcs[0]/40, 2)
+    return tuple([first, arcs[0] - 40*first] + arcs[1:])
+
+def decodeValue(data, tag, start, end):
+    if tag == INTEGER:
+        return decodeInteger(data, start, end)
+    elif tag in UNSIGNED_TAGS:
+        return decodeInteger(data, start, end, signed=False)
+    elif tag == OCTET_STRING:
+        return str(data[start:end])
+    elif tag == OBJECT_IDENTIFIER:
+        return decodeOid(data, start, end)
+    else:
+        return None
+
+def decodeMessage(data):
+    """Returns the tuple (version, community, pdu_type, request_id,
+    error_status, error_index, varbinds) of an encoded message, where
+    varbinds is a list of (oid, tag, value).
+    """
+    data = bytearray(data)
+    try:
+        (tag, start, end) = decodeTLV(data, 0)
+        fields = []
+        offset = start
+        while offset < end:
+            element = decodeTLV(data, offset)
+            fields.append(element)
+            offset = element[2]
+        (version, community, (pdu_type, pdu_start, pdu_end)) = fields
+        version = decodeInteger(data, *version[1:])
+        community = str(data[community[1]:community[2]])
+
+        pdu_fields = []
+        offset = pdu_start
+        while offset < pdu_end:
+            element = decodeTLV(data, offset)
+            pdu_fields.append(element)
+            offset = element[2]
+        (request_id, error_status, error_index) = [decodeInteger(data, s, e) for (t, s, e) in pdu_fields[:3]]
+
+        varbinds = []
+        (vbs_tag, offset, vbs_end) = pdu_fields[3]
+        while offset < vbs_end:
+            (vb_tag, vb_start, vb_end) = decodeTLV(data, offset)
+            (oid_tag, oid_start, oid_end) = decodeTLV(data, vb_start)
+            (value_tag, value_start, value_end) = decodeTLV(data, oid_end)
+            varbinds.append((decodeOid(data, oid_start, oid_end), value_tag,
+                             decodeValue(data, value_tag, value_start, value_end)))
+            offset = vb_end
+    except (IndexError, ValueError):
+        raise SnmpError("Malformed message")
+    return (version, community, pdu_type, request_id, error_status, error_index, varbinds)
+
+
+class SnmpSession(object):
+    """Persistent SNMPv2c session with the agent at (host, port).
+
+    Each request is retransmitted up to retries times if no response
+    arrives within timeout seconds. Responses to previous (timed out)
+    requests are discarded.
+    """
+    def __init__(self, host, port=161, community='public', timeout=0.5, retries=2):
+        self.host = host
+        self.port = port
+        self.community = community
+        self.timeout = timeout
+        self.retries = retries
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.requestIds = itertools.count(random.randint(1, 1 << 30))
+
+        # Number of requests sent (retransmissions included) and of
+        # timeouts
+        self.n_requests = 0
+        self.n_timeouts = 0
+
+    def __repr__(self):
+        return "SnmpSession(%s:%d)"%(self.host, self.port)
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, pdu_type, varbinds, error_status=0, error_index=0):
+        """Sends a request and returns the varbinds of its response"""
+        request_id = self.requestIds.next() & 0x7fffffff
+        message = encodeMessage(self.community, pdu_type, request_id, varbinds, error_status, error_index)
+        for attempt in range(self.retries + 1):
+            self.sock.send(message)
+            self.n_requests += 1
+            deadline = time.time() + self.timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.sock.settimeout(remaining)
+                try:
+                    data = self.sock.recv(65535)
+                except socket.timeout:
+                    break
+                except socket.error as e:
+                    # E.g: ICMP port unreachable
+                    raise SnmpError("%s: %s"%(self, e))
+                try:
+                    response = decodeMessage(data)
+                except SnmpError:
+                    continue
+                (version, community, r_type, r_id, r_status, r_index, r_varbinds) = response
+                if r_type != GET_RESPONSE or r_id != request_id:
+                    # Late response to an older request
+                    continue
+                if r_status != 0:
+                    raise SnmpError("%s: error-status %d at varbind %d"%(self, r_status, r_index))
+                return r_varbinds
+            self.n_timeouts += 1
+        raise SnmpTimeout("%s: no response after %d attempts"%(self, self.retries + 1))
+
+    def get(self, oids):
+        """Returns the list of (oid, value) of oids"""
+        varbinds = self.request(GET_REQUEST, [(parseOid(oid), NULL, None) for oid in oids])
+        return [(oid, value) for (oid, tag, value) in varbinds]
+
+    def set(self, oid, tag, value):
+        self.request(SET_REQUEST, [(parseOid(oid), tag, value)])
+
+    def getBulk(self, oids, non_repeaters=0, max_repetitions=10):
+        """Returns the list of (oid, tag, value) of the response to a
+        GETBULK request.
+        """
+        return self.request(GET_BULK_REQUEST, [(parseOid(oid), NULL, None) for oid in oids],
+                            non_repeaters, max_repetitions)
+
+    def walkColumns(self, columns, max_repetitions=16):
+        """Walks several table columns at once with GETBULK requests.
+
+        Returns a list with, for each column, the list of (index, value)
+        of its rows, where index is the tuple of OID arcs after the
+        column OID.
+        """
+        columns = [parseOid(column) for column in columns]
+        rows = [[] for column in columns]
+        # Columns still being walked, and last OID seen in each
+        pending = range(len(columns))
+        last = list(columns)
+        while pending:
+            varbinds = self.getBulk([last[i] for i in pending], 0, max_repetitions)
+            if not varbinds:
+                break
+            finished = set()
+            progress = False
+            for (n, (oid, tag, value)) in enumerate(varbinds):
+                i = pending[n % len(pending)]
+                column = columns[i]
+                if i in finished:
+                    continue
+                if tag in EXCEPTION_TAGS or oid[:len(column)] != column or oid <= last[i]:
+                    finished.add(i)
+                    continue
+                rows[i].append((oid[len(column):], value))
+                last[i] = oid
+                progress = True
+            if not progress:
+                break
+            pending = [i for i in pending if i not in finished]
+        return rows
+
+    def walk(self, oid, max_repetitions=16):
+        """Returns the list of (index, value) below oid"""
+        return self.walkColumns([oid], max_repetitions)[0]